@@ -0,0 +1,283 @@
+"""
+Benchmarks the job pipeline on synthetic squeue output, from parsing to rendering
+the job list:
+
+    python -m benchmarks.bench --sizes 1k,10k,100k,1M --output results.json
+    python -m benchmarks.bench --compare results.json
+
+Every stage is timed a few times (best and median are reported) and then run once
+more under tracemalloc for its peak memory. With --compare, stages that got slower
+(or hungrier) than the given results by more than --threshold are reported and the
+exit status is 1.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+import urwid
+
+from benchmarks.squeue_gen import format_squeue, generate_jobs, next_poll
+from stui import backend
+from stui.nodes import NodeTable
+from stui.views.jobs import JobsTab
+from tests.conftest import make_cluster
+
+SQUEUE_FORMAT = re.compile(r'--format="([^"]*)"')
+SPECIFIERS = {spec: field for field, spec in backend.SQUEUE_FIELDS.items()}
+
+RENDER_SIZE = (200, 60)
+
+
+class FakeSqueueDriver(backend.SlurmCLIDriver):
+    """Answers squeue with the generated jobs, in whatever --format was asked for."""
+
+    def __init__(self, jobs):
+        super().__init__(remote=None)
+        self.jobs = jobs
+        self.lines = {}
+
+    def set_jobs(self, jobs):
+        self.jobs = jobs
+        self.lines = {}
+
+    def prepare(self, field_names):
+        """Formats the output up front so that it doesn't count towards polls."""
+        key = tuple(field_names)
+        if key not in self.lines:
+            self.lines[key] = format_squeue(self.jobs, key)
+        return self.lines[key]
+
+    def get_nodes(self):
+        return NodeTable()
+
+    def get_job_details(self, job_id):
+        return {"JobId": job_id}
+
+    def get_job_history(self, user, since):
+        return []
+
+    def run_command(self, cmd, check=False):
+        specs = SQUEUE_FORMAT.search(cmd).group(1).split("|")
+        return self.prepare(SPECIFIERS[s] for s in specs)
+
+
+def make_bench_cluster(jobs):
+    return make_cluster(
+        FakeSqueueDriver(jobs), "bench", me="user001", partitions=("gpu", "cpu")
+    )
+
+
+def make_tab(cluster):
+    tab = JobsTab(backend.ClusterGroup([cluster]))
+    tab.fpanel.filter_all_partitions.set_state(True)
+    return tab
+
+
+def poll(cluster):
+    # The lines for the current query are formatted before the clock starts
+    cluster.driver.prepare(backend.make_squeue_format(cluster.job_query.fields)[0])
+    cluster.poll_once()
+
+
+class Stage(object):
+    """
+    One thing to measure. setup() builds whatever run() needs from scratch for every
+    repetition and isn't timed.
+    """
+
+    def __init__(self, name, run, setup=lambda: None):
+        self.name = name
+        self.run = run
+        self.setup = setup
+
+
+def stages(jobs, later_jobs):
+    field_names = tuple(backend.SQUEUE_FIELDS)
+    lines = format_squeue(jobs, field_names)
+
+    def polled_cluster():
+        cluster = make_bench_cluster(jobs)
+        poll(cluster)
+        return cluster
+
+    def refreshed_tab():
+        cluster = polled_cluster()
+        tab = make_tab(cluster)
+        tab.refresh()
+        # The first refresh narrows down the squeue query, poll again with it so
+        # that later polls only differ in the jobs.
+        poll(cluster)
+        tab.refresh()
+        return tab
+
+    def tab_with_new_poll():
+        tab = refreshed_tab()
+        cluster = tab.cluster.clusters[0]
+        cluster.driver.set_jobs(later_jobs)
+        poll(cluster)
+        return tab
+
+    def filtered_tab():
+        tab = refreshed_tab()
+        tab.fpanel.filter_running.set_state(True)
+        tab.fpanel.filter_job_name.set_edit_text("train")
+        tab.refresh()
+        return tab, list(tab.index.jobs.values())
+
+    def rendered_tab():
+        tab = refreshed_tab()
+        tab.qpanel.render(RENDER_SIZE, focus=True)
+        return tab
+
+    def render(tab):
+        # Nothing cached, like after a poll changed what's on screen
+        urwid.CanvasCache.clear()
+        tab.qpanel.render(RENDER_SIZE, focus=True)
+
+    return [
+        Stage("Job parsing", lambda _: [backend.Job(field_names, l) for l in lines]),
+        Stage("Cluster.poll_once (first)", poll, lambda: make_bench_cluster(jobs)),
+        Stage("Cluster.poll_once (next)", poll, _next_poll_setup(jobs, later_jobs)),
+        Stage(
+            "JobsTab.refresh (full)",
+            JobsTab.refresh,
+            lambda: make_tab(polled_cluster()),
+        ),
+        Stage("JobsTab.refresh (delta)", JobsTab.refresh, tab_with_new_poll),
+        Stage("JobsTab.filter_jobs", lambda a: a[0].filter_jobs(a[1]), filtered_tab),
+        Stage("JobQueueWidget render (new widgets)", render, refreshed_tab),
+        Stage("JobQueueWidget render (warm widgets)", render, rendered_tab),
+    ]
+
+
+def _next_poll_setup(jobs, later_jobs):
+    def setup():
+        cluster = make_bench_cluster(jobs)
+        poll(cluster)
+        cluster.driver.set_jobs(later_jobs)
+        return cluster
+
+    return setup
+
+
+def measure(stage, repeat):
+    times = []
+    for _ in range(repeat):
+        arg = stage.setup()
+        gc.collect()
+        start = time.perf_counter()
+        stage.run(arg)
+        times.append(time.perf_counter() - start)
+        del arg
+
+    arg = stage.setup()
+    gc.collect()
+    tracemalloc.start()
+    stage.run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del arg
+
+    return {
+        "best_s": min(times),
+        "median_s": statistics.median(times),
+        "peak_mb": peak / 1e6,
+    }
+
+
+def parse_size(s):
+    s = s.strip().lower()
+    for suffix, factor in (("k", 1000), ("m", 1000000)):
+        if s.endswith(suffix):
+            return int(float(s[:-1]) * factor)
+    return int(s)
+
+
+def run(sizes, seed, repeat, only=None):
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": {},
+    }
+
+    for n in sizes:
+        jobs = generate_jobs(n, seed)
+        later_jobs = next_poll(jobs, seed + 1)
+        # Fewer repetitions for the big ones, they're less noisy anyway
+        n_repeat = repeat if n <= 100000 else 1
+
+        for stage in stages(jobs, later_jobs):
+            if only and not re.search(only, stage.name):
+                continue
+            r = measure(stage, n_repeat)
+            results["results"][f"{stage.name} [{n}]"] = r
+            print(
+                f"{stage.name:<36} {n:>8}  best {r['best_s'] * 1e3:10.2f} ms  "
+                f"median {r['median_s'] * 1e3:10.2f} ms  peak {r['peak_mb']:8.1f} MB",
+                flush=True,
+            )
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints how `results` compare to `baseline`, returns the regressions."""
+    regressions = []
+    for name, r in results["results"].items():
+        b = baseline["results"].get(name)
+        if b is None:
+            continue
+
+        time_ratio = r["best_s"] / max(b["best_s"], 1e-9)
+        mem_ratio = r["peak_mb"] / max(b["peak_mb"], 1e-3)
+        flag = ""
+        # Sub-millisecond differences are noise, whatever the ratio
+        slower = time_ratio > threshold and r["best_s"] - b["best_s"] > 1e-3
+        if slower or mem_ratio > threshold:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:<45} time x{time_ratio:5.2f}  memory x{mem_ratio:5.2f}{flag}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default="1k,10k,100k,1M")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="Regex of the stages to run")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    results = run(sizes, args.seed, args.repeat, args.only)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("seed") != args.seed:
+            print("Warning: the baseline was generated with a different seed")
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Generates realistic looking `squeue` output for benchmarking: plain jobs, array
+jobs (running tasks plus the pending remainder on a single line), multi-node jobs
+with compressed hostlists and GPU TRES. The same seed always gives the same output.
+"""
+
+import random
+from typing import Dict, List, Sequence
+
+from stui.backend import SQUEUE_FIELDS
+from stui.hostlist import compress_hostlist
+from stui.util import format_elapsed
+
+__all__ = ["generate_jobs", "next_poll", "format_squeue"]
+
+USERS = [f"user{i:03}" for i in range(200)]
+PARTITIONS = ["gpu", "gpu-long", "cpu", "cpu-long", "debug", "bigmem"]
+NAME_STEMS = ["train", "eval", "preprocess", "sweep", "bert", "resnet", "sim", "md"]
+NODE_PREFIXES = {"gpu": "gpu", "gpu-long": "gpu", "bigmem": "mem"}
+NODES_PER_PREFIX = 2000
+
+
+def _nodes(rng: random.Random, partition: str, count: int) -> str:
+    prefix = NODE_PREFIXES.get(partition, "cpu")
+    start = rng.randrange(NODES_PER_PREFIX - count)
+    # Mostly contiguous allocations with the occasional gap, like a real scheduler
+    hosts = [f"{prefix}{start + i * rng.choice((1, 1, 1, 2)):04}" for i in range(count)]
+    return compress_hostlist(hosts)
+
+
+def _job(rng: random.Random, job_id: int, state: str) -> Dict[str, str]:
+    partition = rng.choice(PARTITIONS)
+    gpus = rng.choice((1, 2, 4, 8)) if partition.startswith("gpu") else 0
+    nodes = rng.choice((1, 1, 1, 1, 2, 4, 16))
+    running = state != "PENDING"
+    elapsed = rng.randrange(7 * 24 * 3600) if running else 0
+
+    return {
+        "job_id_unique": str(job_id),
+        "job_id_base_idx": str(job_id),
+        "job_id_base": str(job_id),
+        "job_id_idx": "N/A",
+        "cpus": str(nodes * rng.choice((1, 4, 16, 32, 64))),
+        "job_name": f"{rng.choice(NAME_STEMS)}_{rng.randrange(10000)}",
+        "partition": partition,
+        "user": rng.choice(USERS),
+        "nice": "0",
+        "state": state,
+        "time": format_elapsed(elapsed),
+        "tres": f"gres:gpu:{gpus}" if gpus else "N/A",
+        "nodes": _nodes(rng, partition, nodes) if running else "",
+        # Not an squeue field, kept so that next_poll() doesn't have to parse "time"
+        "elapsed": elapsed,
+    }
+
+
+def generate_jobs(n: int, seed=0) -> List[Dict[str, str]]:
+    """`n` squeue lines worth of jobs, as squeue field name -> value dicts."""
+    rng = random.Random(seed)
+    jobs = []
+    job_id = 1000000
+
+    while len(jobs) < n:
+        job_id += 1
+        if rng.random() < 0.05:
+            # An array: some tasks running, the rest pending behind one line
+            size = rng.choice((10, 100, 1000, 10000))
+            throttle = rng.choice((None, 10, 50))
+            running = min(rng.randrange(1, 200), size, n - len(jobs) - 1)
+            template = _job(rng, job_id, "RUNNING")
+
+            for task in range(running):
+                job = dict(template)
+                job_id += 1
+                job["job_id_unique"] = str(job_id)
+                job["job_id_base_idx"] = f"{template['job_id_base']}_{task}"
+                job["job_id_idx"] = str(task)
+                job["elapsed"] = rng.randrange(24 * 3600)
+                job["time"] = format_elapsed(job["elapsed"])
+                job["nodes"] = _nodes(rng, template["partition"], 1)
+                jobs.append(job)
+
+            if running < size and len(jobs) < n:
+                idx = f"{running}-{size - 1}"
+                if throttle is not None:
+                    idx += f"%{throttle}"
+                job = dict(template, state="PENDING", time="0:00", nodes="", elapsed=0)
+                job["job_id_base_idx"] = f"{template['job_id_base']}_[{idx}]"
+                job["job_id_idx"] = idx
+                jobs.append(job)
+        else:
+            state = rng.choices(("RUNNING", "PENDING", "COMPLETING"), (60, 38, 2))[0]
+            jobs.append(_job(rng, job_id, state))
+
+    return jobs
+
+
+def next_poll(jobs: List[Dict[str, str]], seed=0, churn=0.01) -> List[Dict[str, str]]:
+    """
+    What the next poll a second later would return: running jobs are a second
+    older and a fraction `churn` of the jobs has finished, started or been
+    submitted.
+    """
+    rng = random.Random(seed)
+    out = []
+    for job in jobs:
+        r = rng.random()
+        if r < churn / 2:
+            continue  # finished
+        if job["state"] == "RUNNING":
+            elapsed = job["elapsed"] + 1
+            job = dict(job, elapsed=elapsed, time=format_elapsed(elapsed))
+        elif job["state"] == "PENDING" and job["job_id_idx"] == "N/A" and r < churn:
+            job = dict(job, state="RUNNING", elapsed=1, time=format_elapsed(1))
+            job["nodes"] = _nodes(rng, job["partition"], 1)
+        out.append(job)
+
+    new_id = 9000000 + seed * len(jobs)
+    for i in range(int(len(jobs) * churn / 2)):
+        out.append(_job(rng, new_id + i, "PENDING"))
+
+    return out
+
+
+def format_squeue(jobs: Sequence[Dict[str, str]], field_names=tuple(SQUEUE_FIELDS)):
+    """The lines squeue would print for `jobs` with the given --format fields."""
+    return ["|".join(job[f] for f in field_names) for job in jobs]
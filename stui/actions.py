@@ -0,0 +1,195 @@
+import logging
+import threading
+from queue import Empty, Queue
+from typing import Callable, Dict, Iterable, List, Optional
+
+__all__ = ["ActionExecutor", "ActionHandle", "CommandError", "gather"]
+
+logger = logging.getLogger("stui.actions")
+
+
+class CommandError(Exception):
+    def __init__(self, cmd: str, status: int, stderr: str = ""):
+        self.cmd = cmd
+        self.status = status
+        self.stderr = stderr.strip()
+        super().__init__(f"'{cmd}' exited with {status}: {self.stderr}")
+
+
+class ActionHandle(object):
+    """
+    Returned for every user action. The action runs on the executor's thread; the UI
+    can poll is_done() and look at `error` afterwards, or wait() for it.
+    """
+
+    def __init__(self, description: str):
+        self.description = description
+        self.error = None  # type: Optional[Exception]
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        state = "done" if self.is_done() else "pending"
+        return f"ActionHandle({self.description!r}, {state})"
+
+    def is_done(self) -> bool:
+        return self._done.is_set()
+
+    def succeeded(self) -> bool:
+        return self.is_done() and self.error is None
+
+    def wait(self, timeout=None) -> bool:
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, callback: Callable[["ActionHandle"], None]):
+        """The callback runs on the executor's thread (or right away if done)."""
+        with self._lock:
+            if not self.is_done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, error: Optional[Exception] = None):
+        with self._lock:
+            if self.is_done():
+                return
+            self.error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logger.exception(f"Callback for {self.description} failed")
+
+
+def gather(handles: Iterable[ActionHandle], description: str) -> ActionHandle:
+    """
+    Returns a handle that's done once all of `handles` are. It carries the first
+    error, if any.
+    """
+    handles = list(handles)
+    combined = ActionHandle(description)
+    remaining = [len(handles)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        combined._finish(next((h.error for h in handles if h.error), None))
+
+    if not handles:
+        combined._finish()
+    for h in handles:
+        h.add_done_callback(on_done)
+
+    return combined
+
+
+class _CancelAction(object):
+    def __init__(self, handle: ActionHandle, job_ids: List[str]):
+        self.handle = handle
+        self.job_ids = job_ids
+
+
+class _Action(object):
+    def __init__(self, handle: ActionHandle, fn: Callable[[], None]):
+        self.handle = handle
+        self.fn = fn
+
+
+class ActionExecutor(object):
+    """
+    Runs user actions on a dedicated thread so they never wait behind a squeue.
+    Everything that has piled up while the previous action was running is handled in
+    one go, in the order it was submitted. Cancels submitted back to back are merged
+    into a single `cancel_jobs` call, which for the CLI driver means as few scancel
+    invocations as possible.
+    """
+
+    def __init__(
+        self,
+        cancel_jobs: Callable[[List[str]], Dict[str, Exception]],
+        on_completed: Optional[Callable[[], None]] = None,
+    ):
+        self.cancel_jobs = cancel_jobs
+        self.on_completed = on_completed
+        self.queue = Queue()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._thread_fn, daemon=True)
+            self.thread.start()
+
+    def cancel(self, job_ids: Iterable[str], description=None) -> ActionHandle:
+        job_ids = list(job_ids)
+        if description is None:
+            description = f"Cancel {len(job_ids)} job(s)"
+
+        handle = ActionHandle(description)
+        if len(job_ids) == 0:
+            handle._finish()
+        else:
+            self.queue.put(_CancelAction(handle, job_ids))
+        return handle
+
+    def submit(self, fn: Callable[[], None], description: str) -> ActionHandle:
+        handle = ActionHandle(description)
+        self.queue.put(_Action(handle, fn))
+        return handle
+
+    def _thread_fn(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get(block=False))
+                except Empty:
+                    break
+
+            self._run_batch(batch)
+
+            if self.on_completed is not None:
+                self.on_completed()
+
+    def _run_batch(self, batch):
+        # Cancels can't jump the queue, e.g. a cancel submitted after a hold has to
+        # happen after it, so only those next to each other are merged.
+        cancels = []
+        for action in batch:
+            if isinstance(action, _CancelAction):
+                cancels.append(action)
+                continue
+
+            if cancels:
+                self._run_cancels(cancels)
+                cancels = []
+            try:
+                action.fn()
+            except Exception as e:
+                logger.warning(f"{action.handle.description} failed: {e}")
+                action.handle._finish(e)
+            else:
+                action.handle._finish()
+
+        if cancels:
+            self._run_cancels(cancels)
+
+    def _run_cancels(self, cancels: List[_CancelAction]):
+        # dict keeps the order and drops duplicates
+        job_ids = list(dict.fromkeys(i for c in cancels for i in c.job_ids))
+
+        try:
+            errors = self.cancel_jobs(job_ids)
+        except Exception as e:
+            logger.warning(f"Cancelling jobs failed: {e}")
+            errors = {job_id: e for job_id in job_ids}
+
+        for c in cancels:
+            error = next((errors[i] for i in c.job_ids if i in errors), None)
+            c.handle._finish(error)
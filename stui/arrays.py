@@ -0,0 +1,329 @@
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from stui.backend import Job
+
+__all__ = [
+    "ArrayGroup",
+    "ArrayGroupRow",
+    "GroupedRows",
+    "count_tasks",
+    "group_key",
+    "row_sort_key",
+]
+
+# squeue's compact state codes, for the summary rows
+STATE_CODES = {
+    "BOOT FAIL": "BF",
+    "CANCELLED": "CA",
+    "COMPLETED": "CD",
+    "CONFIGURING": "CF",
+    "COMPLETING": "CG",
+    "DEADLINE": "DL",
+    "FAILED": "F",
+    "NODE FAIL": "NF",
+    "OUT OF MEMORY": "OOM",
+    "PENDING": "PD",
+    "PREEMPTED": "PR",
+    "RUNNING": "R",
+    "SUSPENDED": "S",
+    "STOPPED": "ST",
+    "TIMEOUT": "TO",
+}
+
+
+def group_key(job: Job) -> tuple:
+    return (job.cluster, job.job_id_base, "array")
+
+
+def count_tasks(job: Job) -> int:
+    """How many array tasks a row stands for, e.g. 96 for pending tasks '5-100%4'."""
+    if not job.is_pending():
+        return 1
+
+    count = 0
+    for r in job.job_id_idx.strip("[]").partition("%")[0].split(","):
+        r, _, step = r.partition(":")
+        lo, sep, hi = r.partition("-")
+        if not lo.isdigit():
+            return 1
+        if sep and hi.isdigit():
+            step = int(step) if step.isdigit() and int(step) > 0 else 1
+            count += (int(hi) - int(lo)) // step + 1
+        else:
+            count += 1
+    return count
+
+
+def _throttle(job: Job) -> Optional[str]:
+    _, sep, throttle = job.job_id_idx.strip("[]").partition("%")
+    return throttle if sep else None
+
+
+class ArrayGroupRow(object):
+    """
+    What the job list shows for an array group. A new one is made every time the
+    group changes, like Jobs are replaced when they change, so widgets can tell
+    whether they're up to date by identity.
+    """
+
+    __slots__ = (
+        "key",
+        "group",
+        "job",
+        "sort_key",
+        "expanded",
+        "tasks",
+        "state_counts",
+        "throttle",
+        "min_time",
+        "max_time",
+    )
+
+    def __init__(self, group: "ArrayGroup", expanded: bool):
+        self.key = group.key
+        self.group = group
+        self.job = group.first_job()
+        self.sort_key = group.first_sort_key()
+        self.expanded = expanded
+        self.tasks = sum(group.state_counts.values())
+        self.state_counts = dict(group.state_counts)
+        self.throttle = group.throttle()
+        self.min_time, self.max_time = group.time_range()
+
+    def __len__(self):
+        return len(self.group.jobs)
+
+    def job_keys(self):
+        return self.group.jobs.keys()
+
+    def state_str(self) -> str:
+        counts = sorted(self.state_counts.items(), key=lambda c: -c[1])
+        return " ".join(f"{n}{STATE_CODES.get(s, s[:2])}" for s, n in counts)
+
+    def array_str(self) -> str:
+        if self.throttle is not None:
+            return f"{self.tasks}%{self.throttle}"
+        return str(self.tasks)
+
+
+class ArrayGroup(object):
+    """
+    The visible elements of one job array: the running (or finished) tasks plus the
+    single squeue row standing for the still pending ones. Aggregates over them are
+    kept up to date one element at a time as the elements come, go and change.
+
+    The group is sorted where its first element in the current sort order would be,
+    so it needs the same sort key function as the rest of the list.
+    """
+
+    def __init__(self, key: tuple, key_fn: Callable[[Job], Any], reverse: bool):
+        self.key = key
+        self.key_fn = key_fn
+        self.reverse = reverse
+
+        self.jobs = {}  # type: Dict[tuple, Job]
+        self.sort_keys = {}  # type: Dict[tuple, Any]
+        self.state_counts = Counter()  # state -> number of tasks
+        self.times = Counter()  # elapsed seconds -> number of elements
+        self.throttles = Counter()
+
+        # Derived from the above when they're next needed, None means stale
+        self._first = None
+        self._time_range = None
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def add(self, job: Job):
+        """Adds `job` or, if it's already there, replaces it."""
+        if job.key in self.jobs:
+            self.remove(job.key)
+
+        key = job.key
+        sk = self.key_fn(job)
+        self.jobs[key] = job
+        self.sort_keys[key] = sk
+        self.state_counts[job.state] += count_tasks(job)
+        self.times[job.elapsed_seconds()] += 1
+        throttle = _throttle(job)
+        if throttle is not None:
+            self.throttles[throttle] += 1
+
+        if self._first is not None:
+            if (sk > self._first[0]) if self.reverse else (sk < self._first[0]):
+                self._first = (sk, key)
+        if self._time_range is not None:
+            lo, hi = self._time_range
+            t = job.elapsed_seconds()
+            self._time_range = (min(lo, t), max(hi, t))
+        self._sorted = None
+
+    def update_time(self, job: Job):
+        """
+        Replaces an element whose elapsed time is all that has changed, which is
+        most of them on every poll. The sort order stays as it is so it has to
+        have nothing to do with the time.
+        """
+        old = self.jobs[job.key]
+        self.jobs[job.key] = job
+
+        t_old = old.elapsed_seconds()
+        t = job.elapsed_seconds()
+        if t != t_old:
+            self._decrement(self.times, t_old)
+            self.times[t] += 1
+            if self._time_range is not None:
+                lo, hi = self._time_range
+                if t_old in self.times or t_old not in (lo, hi):
+                    self._time_range = (min(lo, t), max(hi, t))
+                elif t_old == hi != lo and t > hi:
+                    # The longest running element, still the longest running
+                    self._time_range = (lo, t)
+                else:
+                    self._time_range = None
+        # The elements are in the same order, they're just not the same objects
+        self._sorted = None
+
+    def remove(self, key: tuple) -> bool:
+        job = self.jobs.pop(key, None)
+        if job is None:
+            return False
+
+        del self.sort_keys[key]
+        self._decrement(self.state_counts, job.state, count_tasks(job))
+        t = job.elapsed_seconds()
+        self._decrement(self.times, t)
+        throttle = _throttle(job)
+        if throttle is not None:
+            self._decrement(self.throttles, throttle)
+
+        # Only the extremes need recomputing, and only if they're what just went
+        if self._first is not None and self._first[1] == key:
+            self._first = None
+        if self._time_range is not None and t in self._time_range:
+            self._time_range = None
+        self._sorted = None
+        return True
+
+    @staticmethod
+    def _decrement(counter: Counter, value, n=1):
+        counter[value] -= n
+        if counter[value] <= 0:
+            del counter[value]
+
+    def _get_first(self):
+        if self._first is None:
+            pick = max if self.reverse else min
+            self._first = pick((sk, k) for k, sk in self.sort_keys.items())
+        return self._first
+
+    def first_sort_key(self):
+        return self._get_first()[0]
+
+    def first_job(self) -> Job:
+        return self.jobs[self._get_first()[1]]
+
+    def time_range(self):
+        if self._time_range is None:
+            self._time_range = (min(self.times), max(self.times))
+        return self._time_range
+
+    def throttle(self) -> Optional[str]:
+        return next(iter(self.throttles), None)
+
+    def sorted_jobs(self) -> List[Job]:
+        """The elements in the list's sort order. Only built for expanded groups."""
+        if self._sorted is None:
+            keys = sorted(self.sort_keys, key=self.sort_keys.__getitem__)
+            if self.reverse:
+                keys.reverse()
+            self._sorted = [self.jobs[k] for k in keys]
+        return self._sorted
+
+
+def row_sort_key(key_fn: Callable[[Job], Any]) -> Callable[[Any], Any]:
+    """Extends a job sort key to array group rows."""
+
+    def key(row):
+        if row.__class__ is ArrayGroupRow:
+            return row.sort_key
+        return key_fn(row)
+
+    return key
+
+
+class GroupedRows(object):
+    """
+    The rows of the job list: the sorted top-level rows (jobs and array groups) with
+    the elements of the expanded groups spliced in after their group's row. Only
+    expanded groups cost anything beyond the top-level rows, so call update() after
+    the rows or the set of expanded groups have changed.
+
+    Behaves like a read-only sequence of rows for the list walker.
+    """
+
+    def __init__(self, rows, groups: Dict[tuple, ArrayGroup], expanded: set):
+        self.rows = rows
+        self.groups = groups
+        self.expanded = expanded
+        # (row position, group) of the expanded groups, by position
+        self.spans = []
+        self.length = len(rows)
+
+    def update(self):
+        spans = []
+        for key in self.expanded:
+            group = self.groups.get(key)
+            position = self.rows.position_of(key)
+            if group is not None and position is not None:
+                spans.append((position, group))
+        spans.sort(key=lambda s: s[0])
+
+        self.spans = spans
+        self.length = len(self.rows) + sum(len(g) for _, g in spans)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, position: int):
+        if position < 0 or position >= self.length:
+            raise IndexError(position)
+
+        offset = 0
+        for row_position, group in self.spans:
+            start = row_position + offset
+            if position <= start:
+                break
+            if position <= start + len(group):
+                return group.sorted_jobs()[position - start - 1]
+            offset += len(group)
+
+        return self.rows[position - offset]
+
+    def __iter__(self):
+        for position in range(self.length):
+            yield self[position]
+
+    def key_at(self, position: int) -> tuple:
+        return self[position].key
+
+    def position_of(self, key) -> Optional[int]:
+        row_position = self.rows.position_of(key)
+
+        offset = 0
+        for position, group in self.spans:
+            if row_position is not None:
+                if position >= row_position:
+                    break
+            elif key in group.jobs:
+                # An element of an expanded group
+                return (
+                    position + offset + 1 + group.sorted_jobs().index(group.jobs[key])
+                )
+            offset += len(group)
+
+        if row_position is None:
+            return None
+        return row_position + offset
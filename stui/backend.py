@@ -1,23 +1,68 @@
-import copy
 import functools
+import itertools
 import logging
+import operator
 import os
 import re
 import shutil
+import socket
 import subprocess
+import sys
+import tempfile
 import threading
-from collections import OrderedDict
-from queue import Queue
-from time import sleep
-from typing import Iterable, List
+import time
+import uuid
+from collections import OrderedDict, deque
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Tuple
 
 import fabric
 from paramiko.ssh_exception import SSHException
 
-__all__ = ["Cluster"]
+from stui.actions import ActionExecutor, ActionHandle, CommandError, gather
+from stui.hostlist import compress_hostlist, expand_hostlist
+from stui.details import JobDetailCache
+from stui.history import (
+    SACCT_FORMAT,
+    HistoryCache,
+    HistoryRecord,
+    default_cache_path,
+    parse_sacct,
+)
+from stui.nodes import NodeTable, parse_oneliner, parse_scontrol_nodes
+from stui.scheduler import PollingPool, PollScheduler
+
+__all__ = [
+    "AuthenticationError",
+    "Cluster",
+    "ClusterGroup",
+    "Driver",
+    "Job",
+    "JobDelta",
+    "JobQuery",
+    "JobSnapshot",
+    "SlurmCLIDriver",
+    "UpdateNotifier",
+]
 
 logger = logging.getLogger("stui.backend")
 
+# How many consecutive job deltas the Cluster keeps around. Consumers that fall
+# further behind than this have to fall back to a full refresh.
+DELTA_HISTORY_LEN = 16
+
+# Keep scancel command lines well below ARG_MAX and whatever the remote sshd/shell is
+# willing to accept.
+MAX_COMMAND_LENGTH = 16384
+
+# Node state changes much more slowly than the queue and is only ever looked at as a
+# whole, so it's fetched less often than jobs.
+NODE_POLL_INTERVAL = 5.0
+
+# How long a command on the remote shell gets before the shell is given up on. A
+# hung one would otherwise block every later command on the same cluster.
+REMOTE_COMMAND_TIMEOUT = 120.0
+
 
 def when_connected(deocrated_f):
     @functools.wraps(deocrated_f)
@@ -30,47 +75,145 @@ def when_connected(deocrated_f):
     return f
 
 
+@functools.lru_cache(maxsize=None)
+def _squeue_field_plan(fields: Tuple[str, ...]):
+    """
+    Works out once per format string where each squeue field ends up on a Job, so
+    that parsing a line doesn't need to build a throwaway dict.
+    """
+    plan = []
+    for idx, field in enumerate(fields):
+        attr = Job.SQUEUE_ATTRS.get(field)
+        if attr is not None:
+            plan.append((idx, attr, attr in Job.INTERNED))
+    return tuple(plan)
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_array_idx(job_id_idx: str):
+    """Returns (array_total_jobs, array_throttle) for a pending array's index str."""
+    if "%" in job_id_idx:
+        match = re.search(r"(\d+)%(\d+)$", job_id_idx)
+        if match:
+            return match.group(1), match.group(2)
+    else:
+        # TODO: are there [ ]s?
+        match = re.search(r"_\[(\d+)\]$", job_id_idx)
+        if match:
+            return match.group(1), None
+
+    return None, None
+
+
 class Job(object):
-    def __init__(self, fields: Iterable[str], squeue_str: str):
-        super().__init__()
+    """
+    One row of squeue output. There can be hundreds of thousands of these so they
+    use __slots__ and the attributes that take few distinct values (users,
+    partitions, states, ...) are interned and shared between jobs. Array-specific
+    fields are only parsed when somebody asks for them.
+    """
 
-        self.whole_line = squeue_str
-        squeue_dict = {k: v for k, v in zip(fields, squeue_str.split("|"))}
+    # squeue field name -> Job attribute
+    SQUEUE_ATTRS = {
+        "job_id_unique": "job_id",
+        "job_id_base_idx": "job_id_combined",
+        "job_id_base": "job_id_base",
+        "job_id_idx": "job_id_idx",
+        "cpus": "cpus",
+        "job_name": "name",
+        "partition": "partition",
+        "user": "user",
+        "nice": "nice",
+        "state": "state",
+        "time": "time",
+        "tres": "gres",
+        "nodes": "nodes_str",
+    }
 
-        self.job_id = squeue_dict["job_id_unique"]
-        self.job_id_combined = squeue_dict["job_id_base_idx"]
-        self.job_id_base = squeue_dict["job_id_base"]
-        self.job_id_idx = squeue_dict["job_id_idx"]
+    INTERNED = frozenset(
+        ("cpus", "partition", "user", "nice", "state", "time", "gres", "nodes_str")
+    )
 
-        self.nodes = squeue_dict["nodes"].split(",")
-        self.partition = squeue_dict["partition"]
-        self.name = squeue_dict["job_name"]
-        self.user = squeue_dict["user"]
-        self.state = squeue_dict["state"]
-        self.time = squeue_dict["time"]
-        self.nice = squeue_dict["nice"]
-        self.cpus = squeue_dict["cpus"]
-        self.gres = squeue_dict["tres"]
+    # Attributes that are compared when working out whether a job has changed
+    # between two consecutive squeue snapshots.
+    FIELDS = (
+        "job_id_combined",
+        "job_id_base",
+        "job_id_idx",
+        "nodes_str",
+        "partition",
+        "name",
+        "user",
+        "state",
+        "time",
+        "nice",
+        "cpus",
+        "gres",
+    )
 
-        self.is_array_job = False if self.job_id_idx == "N/A" else True
+    __slots__ = ("job_id", "_cluster", "key") + FIELDS
 
-        self.array_total_jobs = None
-        self.array_throttle = None
-        if self.is_array_job and self.is_pending():
-            if "%" in self.job_id_idx:
-                match = re.search(r"(\d+)%(\d+)$", self.job_id_idx)
-                if match:
-                    self.array_total_jobs = match.group(1)
-                    self.array_throttle = match.group(2)
-            else:
-                # TODO: are there [ ]s?
-                match = re.search(r"_\[(\d+)\]$", self.job_id_idx)
-                if match:
-                    self.array_total_jobs = match.group(1)
+    _fields_getter = operator.attrgetter(*FIELDS)
+
+    def __init__(self, fields: Iterable[str], squeue_str: str):
+        if not isinstance(fields, tuple):
+            fields = tuple(fields)
+
+        self.job_id = ""
+        self.cluster = None
+        for attr in self.FIELDS:
+            setattr(self, attr, "")
+
+        values = squeue_str.split("|")
+        for idx, attr, interned in _squeue_field_plan(fields):
+            value = values[idx]
+            setattr(self, attr, sys.intern(value) if interned else value)
+
+    @classmethod
+    def from_values(cls, job_id: str, **values: str) -> "Job":
+        """Builds a job from attribute values directly, e.g. for non-squeue drivers."""
+        job = cls.__new__(cls)
+        job.job_id = job_id
+        job.cluster = None
+        for attr in cls.FIELDS:
+            value = values.get(attr, "")
+            setattr(job, attr, sys.intern(value) if attr in cls.INTERNED else value)
+        return job
 
     def __repr__(self):
         return f"Job {self.job_id} - State{self.state}"
 
+    @property
+    def cluster(self) -> Optional[str]:
+        return self._cluster
+
+    @cluster.setter
+    def cluster(self, name: Optional[str]):
+        self._cluster = name
+        # Unique across all the clusters stui is connected to. It's looked up a lot
+        # (filtering, indexes, the job list) so it's stored rather than a property.
+        self.key = (name, self.job_id)
+
+    @property
+    def nodes(self) -> Tuple[str, ...]:
+        return expand_hostlist(self.nodes_str)
+
+    @property
+    def is_array_job(self) -> bool:
+        return self.job_id_idx != "N/A"
+
+    @property
+    def array_total_jobs(self) -> Optional[str]:
+        if self.is_array_job and self.is_pending():
+            return _parse_array_idx(self.job_id_idx)[0]
+        return None
+
+    @property
+    def array_throttle(self) -> Optional[str]:
+        if self.is_array_job and self.is_pending():
+            return _parse_array_idx(self.job_id_idx)[1]
+        return None
+
     def is_running(self):
         return self.state == "RUNNING"
 
@@ -81,7 +224,7 @@ class Job(object):
         return "gpu" in self.gres
 
     def is_array_job_f(self):
-        return self.is_array_job  # TODO: use property?
+        return self.is_array_job
 
     def array_str(self):
         if not self.is_array_job:
@@ -89,106 +232,476 @@ class Job(object):
         else:
             return self.job_id_idx
 
+    def elapsed_seconds(self) -> int:
+        """Parses squeue's [days-][hours:]minutes:seconds time."""
+        days, _, hms = self.time.rpartition("-")
+        seconds = 0
+        for part in hms.split(":"):
+            if not part.isdigit():
+                return 0
+            seconds = seconds * 60 + int(part)
+        if days.isdigit():
+            seconds += int(days) * 24 * 3600
+        return seconds
 
-class Cluster(threading.Thread):
-    def __init__(self, remote=None):
-        super().__init__()
+    def changed_fields(self, other: "Job") -> List[str]:
+        if Job._fields_getter(self) == Job._fields_getter(other):
+            return []
+        return [f for f in self.FIELDS if getattr(self, f) != getattr(other, f)]
 
-        self.use_fabric = True
-        self.remote = remote
 
-        self.is_ready = threading.Event()
+class JobDelta(object):
+    """
+    Difference between two job snapshots, keyed by Job.key. Internally every entry
+    is a (before, after) pair where either side is None if the job didn't exist in
+    the corresponding snapshot. This makes merging consecutive deltas trivial.
+    """
+
+    def __init__(self, pairs=None):
+        self._pairs = {} if pairs is None else pairs
+        # Deltas never change once made, so this is only worked out once
+        self._changed = None
 
-        self.latest_jobs = []
+    @classmethod
+    def between(cls, old_jobs: Dict[str, Job], new_jobs: Dict[str, Job]):
+        pairs = {}
+        for job_id, new_job in new_jobs.items():
+            old_job = old_jobs.get(job_id)
+            if old_job is None or old_job.changed_fields(new_job):
+                pairs[job_id] = (old_job, new_job)
+        for job_id, old_job in old_jobs.items():
+            if job_id not in new_jobs:
+                pairs[job_id] = (old_job, None)
+        return cls(pairs)
+
+    @classmethod
+    def union(cls, deltas: Iterable["JobDelta"]) -> "JobDelta":
+        """Combines deltas of disjoint sets of jobs, e.g. from different clusters."""
+        pairs = {}
+        for d in deltas:
+            pairs.update(d._pairs)
+        return cls(pairs)
+
+    def merge(self, later: "JobDelta") -> "JobDelta":
+        """Returns a new delta equivalent to applying self and then later."""
+        pairs = dict(self._pairs)
+        for job_id, (before, after) in later._pairs.items():
+            earlier = pairs.get(job_id)
+            if earlier is None:
+                # Nothing to combine with, and it's in `later` so it has changed
+                pairs[job_id] = (before, after)
+                continue
+            before = earlier[0]
+
+            if before is None and after is None:
+                pairs.pop(job_id, None)
+            elif (
+                before is not None
+                and after is not None
+                and not before.changed_fields(after)
+            ):
+                pairs.pop(job_id, None)
+            else:
+                pairs[job_id] = (before, after)
+
+        return JobDelta(pairs)
+
+    def is_empty(self, ignore: Iterable[str] = ()):
+        """True if nothing changed, not counting changes limited to `ignore`."""
+        if not ignore:
+            return len(self._pairs) == 0
+
+        ignore = set(ignore)
+        for before, after in self._pairs.values():
+            if before is None or after is None:
+                return False
+            if not ignore.issuperset(before.changed_fields(after)):
+                return False
+
+        return True
+
+    def pairs(self) -> Iterable[Tuple[Optional[Job], Optional[Job]]]:
+        """(before, after) for every job in the delta, None where it didn't exist."""
+        return self._pairs.values()
+
+    @property
+    def added(self) -> Dict[str, Job]:
+        return {k: a for k, (b, a) in self._pairs.items() if b is None}
+
+    @property
+    def removed(self) -> Dict[str, Job]:
+        return {k: b for k, (b, a) in self._pairs.items() if a is None}
+
+    @property
+    def changed(self) -> Dict[str, Tuple[Job, List[str]]]:
+        if self._changed is None:
+            self._changed = {
+                k: (a, b.changed_fields(a))
+                for k, (b, a) in self._pairs.items()
+                if a is not None and b is not None
+            }
+        return self._changed
+
+    def __repr__(self):
+        return (
+            f"JobDelta(+{len(self.added)} -{len(self.removed)} "
+            f"~{len(self.changed)})"
+        )
+
+
+class JobQuery(NamedTuple):
+    """
+    Restrictions on which jobs get fetched from Slurm, so that narrow views don't
+    need the whole queue transferred and parsed. None means "don't restrict". This
+    must always describe a superset of what the UI shows as the UI still filters
+    the results itself.
+
+    `fields` lists the Job attributes somebody actually looks at. Drivers are free
+    to leave the others empty.
+    """
+
+    users: Optional[Tuple[str, ...]] = None
+    states: Optional[Tuple[str, ...]] = None
+    partitions: Optional[Tuple[str, ...]] = None
+    nodes: Optional[Tuple[str, ...]] = None
+    fields: Optional[FrozenSet[str]] = None
+
+    def would_fetch(self, job: Job) -> bool:
+        """
+        Whether `job` would be in the results if it were still queued as it was. A
+        job's state and nodes change as it runs so those restrictions never count,
+        and neither do values that weren't fetched.
+        """
+        if self.states is not None or self.nodes is not None:
+            return False
+        if self.users is not None and job.user not in self.users:
+            return False
+        # Pending jobs can be queued in several partitions at once
+        if self.partitions is not None and set(job.partition.split(",")).isdisjoint(
+            self.partitions
+        ):
+            return False
+        return True
+
+
+class JobSnapshot(object):
+    """
+    Read-only view of the job list as returned by one squeue call. The polling thread
+    never mutates a published snapshot, it builds a new one and swaps the reference.
+    This means readers can hold on to it for as long as they like without copying or
+    locking. The Job objects inside are shared too so they must not be modified.
+    """
+
+    __slots__ = ("generation", "jobs", "jobs_by_id", "query")
+
+    def __init__(self, generation: int, jobs: Iterable[Job], query=JobQuery()):
+        jobs = tuple(jobs)
+        object.__setattr__(self, "generation", generation)
+        object.__setattr__(self, "jobs", jobs)
+        object.__setattr__(self, "query", query)
+        object.__setattr__(
+            self, "jobs_by_id", MappingProxyType({j.key: j for j in jobs})
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("JobSnapshot is immutable")
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def __iter__(self):
+        return iter(self.jobs)
+
+    def __repr__(self):
+        return f"JobSnapshot(generation={self.generation}, jobs={len(self.jobs)})"
 
+
+class RemoteShell(object):
+    """
+    A long-lived `sh` on the far side of an SSH transport. Instead of opening a new
+    exec channel (and remote shell) for every command, commands are written to the
+    shell's stdin one after another and their output is framed by a marker that is
+    unique to this session. stderr is redirected to a temporary file on the remote
+    end and sent back after the marker so only one stream needs to be read.
+
+    A command that hasn't finished after `timeout` seconds raises TimeoutError and
+    the shell is closed, the next command gets a new one.
+    """
+
+    def __init__(self, transport, timeout=REMOTE_COMMAND_TIMEOUT):
+        self.transport = transport
+        self.timeout = timeout
+        self.channel = None
+        self.marker = f"__stui_{uuid.uuid4().hex}__"
         self.lock = threading.Lock()
-        self.requests = Queue()
-        self.thread = None
 
-    def connect(self, fd, ssh_username=None, ssh_password=None):
-        self.fd = fd
-        self.ssh_username = ssh_username
-        self.ssh_password = ssh_password
+    def open(self):
+        self.channel = self.transport.open_session()
+        self.channel.exec_command("sh")
+        self.channel.sendall(
+            b"STUI_ERR=$(mktemp) || exit 1\ntrap 'rm -f \"$STUI_ERR\"' EXIT\n"
+        )
 
-        if self.thread is not None:
-            self.thread.join()
-        self.thread = threading.Thread(target=self._thread_fn, daemon=True)
-        self.thread.start()
+    def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
 
-    def _thread_fn(self):
+    def run(self, cmd: str) -> Tuple[int, str, str]:
+        with self.lock:
+            if self.channel is None or self.channel.closed:
+                self.open()
+
+            script = (
+                f'{{ {cmd}\n}} </dev/null 2>"$STUI_ERR"\n'
+                f"printf '\\n%s %d\\n' '{self.marker}' $?\n"
+                'cat "$STUI_ERR"\n'
+                f"printf '\\n%s\\n' '{self.marker}'\n"
+            )
+            self.channel.sendall(script.encode("utf-8"))
+
+            end = f"\n{self.marker}\n".encode("utf-8")
+            buf = bytearray()
+            deadline = time.monotonic() + self.timeout
+            while True:
+                try:
+                    self.channel.settimeout(max(deadline - time.monotonic(), 0.001))
+                    chunk = self.channel.recv(65536)
+                except socket.timeout:
+                    # Whatever it's stuck on goes away with the shell
+                    self.close()
+                    raise TimeoutError(f"'{cmd}' took more than {self.timeout}s")
+                if not chunk:
+                    self.close()
+                    raise EOFError("Remote shell closed unexpectedly.")
+                search_from = max(0, len(buf) - len(end))
+                buf += chunk
+                if buf.find(end, search_from) != -1:
+                    break
+
+        out = buf[: -len(end)].decode("utf-8", errors="replace")
+        stdout, status_and_stderr = out.split(f"\n{self.marker} ", 1)
+        status, stderr = status_and_stderr.split("\n", 1)
+
+        return int(status), stdout, stderr
+
+
+class AuthenticationError(Exception):
+    """Raised by Driver.connect() when the user needs to provide login details."""
+
+    def __init__(self, reason: str):
+        # reason is one of "need password" or "wrong password"
+        self.reason = reason
+        super().__init__(reason)
+
+
+class Driver(object):
+    """
+    Everything Cluster needs from Slurm, independent of how it is reached. Drivers
+    are used from the polling thread and the action thread at the same time.
+    """
+
+    remote = None
+
+    def connect(self, ssh_username=None, ssh_password=None):
+        pass
+
+    def whoami(self) -> str:
+        raise NotImplementedError
+
+    def get_config(self) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def get_partition_info(self) -> Tuple[List[str], List[str]]:
+        """Returns (partitions available to the user, all partitions)."""
+        raise NotImplementedError
+
+    def get_node_names(self) -> List[str]:
+        return []
+
+    def get_nodes(self) -> NodeTable:
+        """The state of all the nodes, fetched in one go."""
+        raise NotImplementedError
+
+    def get_jobs(self, query: JobQuery = JobQuery()) -> List[Job]:
+        """Drivers that can't restrict the query on the server side ignore it."""
+        raise NotImplementedError
 
+    def get_user_job_ids(self, user: str, newest_first: bool) -> List[str]:
+        """Job ids of `user` ordered by submit time."""
+        raise NotImplementedError
+
+    def get_job_details(self, job_id: str) -> Dict[str, str]:
+        """Everything Slurm knows about a job, keyed like `scontrol show job`."""
+        raise NotImplementedError
+
+    def get_job_history(self, user: str, since: int) -> List[HistoryRecord]:
+        """
+        The jobs of `user` that were pending or running at `since` (seconds since
+        the epoch) or later, from the accounting database.
+        """
+        raise NotImplementedError
+
+    def cancel_jobs(self, job_ids: List[str]) -> Dict[str, Exception]:
+        """Cancels the jobs and returns the errors, if any, keyed by job id."""
+        raise NotImplementedError
+
+    def cancel_user_jobs(self, user: str):
+        raise NotImplementedError
+
+
+def chunk_command(prefix: str, args: Iterable[str], max_length=MAX_COMMAND_LENGTH):
+    """Splits `prefix arg1 arg2 ...` into as few commands as fit in max_length."""
+    chunk = []
+    length = len(prefix)
+    for arg in args:
+        if chunk and length + 1 + len(arg) > max_length:
+            yield chunk
+            chunk = []
+            length = len(prefix)
+        chunk.append(arg)
+        length += 1 + len(arg)
+
+    if chunk:
+        yield chunk
+
+
+SQUEUE_FIELDS = OrderedDict(
+    {
+        "job_id_unique": r"%A",  # for job arrays this will have a unique value for each element
+        "job_id_base_idx": r"%i",  # for job arrays has the form "<base_job_id>_<index>"
+        "job_id_base": r"%F",  # Job array's base job ID. For non-array jobs, this is the job ID
+        "job_id_idx": r"%K",  # Job array's index
+        "cpus": r"%C",
+        "job_name": r"%j",
+        "partition": r"%P",
+        "user": r"%u",
+        "nice": r"%y",
+        "state": r"%T",
+        "time": r"%M",
+        "tres": r"%b",
+        "nodes": r"%N",
+    }
+)
+
+# Without these a Job can't be identified or told apart from other array elements
+REQUIRED_JOB_ATTRS = frozenset(
+    ("job_id", "job_id_combined", "job_id_base", "job_id_idx", "state")
+)
+
+
+@functools.lru_cache(maxsize=16)
+def make_squeue_format(
+    attrs: Optional[FrozenSet[str]],
+) -> Tuple[Tuple[str, ...], str]:
+    """
+    Returns the squeue field names and the --format string needed to fill in the
+    given Job attributes (all of them if attrs is None). Cached as the set only
+    changes when the user toggles a column or a filter.
+    """
+    if attrs is not None:
+        attrs = attrs | REQUIRED_JOB_ATTRS
+
+    field_names = tuple(
+        field
+        for field in SQUEUE_FIELDS
+        if attrs is None or Job.SQUEUE_ATTRS[field] in attrs
+    )
+    return field_names, "|".join(SQUEUE_FIELDS[f] for f in field_names)
+
+
+class SlurmCLIDriver(Driver):
+    """
+    Runs the Slurm command line tools, either locally or on a remote host over SSH,
+    and parses their text output.
+    """
+
+    def __init__(self, remote=None):
+        self.use_fabric = True
+        self.remote = remote
+
+    def connect(self, ssh_username=None, ssh_password=None):
         if self.remote is None:
             if shutil.which("sinfo") is None:
                 # TODO: Test this!
                 raise SystemExit("Slurm binaries not found.")
         elif self.use_fabric:
             connect_kwargs = {
-                "password": self.ssh_password,
+                "password": ssh_password,
                 "look_for_keys": True,
                 "allow_agent": True,
                 "auth_timeout": 10,
                 "timeout": 5,
             }
             self.fabric_connection = fabric.Connection(
-                self.remote, user=self.ssh_username, connect_kwargs=connect_kwargs
+                self.remote, user=ssh_username, connect_kwargs=connect_kwargs
             )
 
             try:
                 self.fabric_connection.open()
             except SSHException as e:
                 if str(e) == "No authentication methods available":
-                    os.write(self.fd, b"need password")
+                    raise AuthenticationError("need password")
                 elif str(e) == "Authentication failed.":
-                    os.write(self.fd, b"wrong password")
+                    raise AuthenticationError("wrong password")
                 else:
                     raise SystemExit("Lost SSH connection.")
-                return
 
-        self.me = self._run_command("whoami")[0]  # TODO
-        self.config = self._get_config()
-        self.my_partitions, self.all_partitions = self._get_partition_info()
+            self.remote_shells = threading.local()
 
-        self.is_ready.set()
-        os.write(self.fd, b"connection established")
-        os.close(self.fd)
-        self.fd = None
+    def _ssh_mux_options(self) -> List[str]:
+        # Let OpenSSH share one connection between all the commands we run instead of
+        # doing a full handshake for each of them.
+        control_path = os.path.join(tempfile.gettempdir(), "stui-ssh-%C")
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={control_path}",
+            "-o",
+            "ControlPersist=60",
+        ]
 
-        try:
-            while True:
-                latest_jobs = self._get_jobs()
-                with self.lock:
-                    self.latest_jobs = latest_jobs
-                if not self.requests.empty():
-                    cmd = self.requests.get(block=False)
-                    self._run_command(cmd)
-
-                sleep(1)
-        except:
-            # if self.remote:
-            #     self.fabric_connection.close()
-            #     self.fabric_connection = fabric.Connection(self.remote)
-            #     self.fabric_connection.open()
-            raise SystemExit("Something went wrong.")
-
-    def _run_command(self, cmd: str):
+    def _remote_shell(self) -> RemoteShell:
+        # Every thread gets its own channel on the shared SSH transport so that user
+        # actions don't queue up behind a slow squeue on the polling thread.
+        shell = getattr(self.remote_shells, "shell", None)
+        if shell is None:
+            shell = RemoteShell(self.fabric_connection.client.get_transport())
+            self.remote_shells.shell = shell
+        return shell
+
+    def run_command(self, cmd: str, check=False):
         if self.remote is not None:
             if self.use_fabric:
-                results = self.fabric_connection.run(cmd, hide=True)
-                o = results.stdout.splitlines()
+                status, stdout, stderr = self._remote_shell().run(cmd)
             else:
-                cmd = f"ssh {self.remote} {cmd}"
-                process = subprocess.run(cmd.split(" "), capture_output=True)
-                o = process.stdout.decode("utf-8").splitlines()
+                ssh_cmd = ["ssh", *self._ssh_mux_options(), self.remote, cmd]
+                process = subprocess.run(ssh_cmd, capture_output=True)
+                status = process.returncode
+                stdout = process.stdout.decode("utf-8")
+                stderr = process.stderr.decode("utf-8")
+            o = stdout.splitlines()
         else:
             process = subprocess.run(cmd.split(" "), capture_output=True)
+            status = process.returncode
+            stderr = process.stderr.decode("utf-8")
             o = process.stdout.decode("utf-8").splitlines()
             # TODO: for some reason lines are surrounded by quotes when not using SSH
             o = [line.strip('"') for line in o]
 
+        if status != 0:
+            if check:
+                raise CommandError(cmd, status, stderr)
+            logger.warning(f"'{cmd}' exited with {status}: {stderr.strip()}")
+
         return o
 
-    def _get_config(self):
-        o = self._run_command("scontrol show config")
+    def whoami(self):
+        return self.run_command("whoami")[0]  # TODO
+
+    def get_config(self):
+        o = self.run_command("scontrol show config")
 
         pattern = r"(\S+)\s*=(.*)"
 
@@ -202,14 +715,22 @@ class Cluster(threading.Thread):
 
         return config
 
-    def _get_partition_info(self):
+    def get_partition_info(self):
 
-        my_p = self._run_command('sinfo --format="%R" --noheader')
-        all_p = self._run_command('sinfo --format="%R" --noheader --all')
+        my_p = self.run_command('sinfo --format="%R" --noheader')
+        all_p = self.run_command('sinfo --format="%R" --noheader --all')
 
         return my_p, all_p
 
-    def _get_jobs(self) -> List[Job]:
+    def get_node_names(self):
+        return self.run_command("sinfo --format=%N --noheader --Node --all")
+
+    def get_nodes(self):
+        # Unlike `sinfo -N`, which repeats a node for each of its partitions, this is
+        # one line per node and includes the GRES in use.
+        return parse_scontrol_nodes(self.run_command("scontrol show nodes --oneliner"))
+
+    def get_jobs(self, query: JobQuery = JobQuery()) -> List[Job]:
         """
         squeue has two formatting commands: --format and --Format (-o and -O). The
         former is more flexible in terms of constructing a string but it uses single
@@ -224,57 +745,486 @@ class Cluster(threading.Thread):
         Returns: List[Job]
         """
 
-        fields = OrderedDict(
-            {
-                "job_id_unique": r"%A",  # for job arrays this will have a unique value for each element
-                "job_id_base_idx": r"%i",  # for job arrays has the form "<base_job_id>_<index>"
-                "job_id_base": r"%F",  # Job array's base job ID. For non-array jobs, this is the job ID
-                "job_id_idx": r"%K",  # Job array's index
-                "cpus": r"%C",
-                "job_name": r"%j",
-                "partition": r"%P",
-                "reason": r"%r",
-                "user": r"%u",
-                "nice": r"%y",
-                "state": r"%T",
-                "time": r"%M",
-                "tres": r"%b",
-                "nodes": r"%N",
-            }
+        field_names, squeue_format = make_squeue_format(query.fields)
+
+        cmd = f'squeue --noheader --all --format="{squeue_format}"'
+        if query.users is not None:
+            cmd += f" --user={','.join(query.users)}"
+        if query.states is not None:
+            cmd += f" --states={','.join(query.states)}"
+        if query.partitions is not None:
+            cmd += f" --partition={','.join(query.partitions)}"
+        if query.nodes is not None:
+            cmd += f" --nodelist={compress_hostlist(query.nodes)}"
+        cmd_output = self.run_command(cmd)
+
+        return [Job(field_names, line) for line in cmd_output]
+
+    def get_user_job_ids(self, user, newest_first):
+        # Done separately from scancel rather than with `| head -n 1 | xargs scancel`
+        # so that it also works for local clusters where commands don't go through a
+        # shell.
+        order = "-V" if newest_first else "+V"
+        return self.run_command(
+            f"squeue -u {user} --sort={order} -h --format=%A", check=True
         )
 
-        cmd = f'squeue --noheader --all --format="{"|".join(fields.values())}"'
-        cmd_output = self._run_command(cmd)
+    def get_job_details(self, job_id):
+        lines = self.run_command(f"scontrol show job --oneliner {job_id}", check=True)
+        # For an array's id scontrol lists all of its tasks
+        details = [parse_oneliner(line) for line in lines if line]
+        for d in details:
+            if d.get("JobId") == job_id:
+                return d
+        return details[0] if details else {}
+
+    def get_job_history(self, user, since):
+        # Slurm reads and prints times in the cluster's timezone, which needn't be
+        # ours. So the start is relative to now and the output in epoch seconds.
+        ago = max(int(time.time()) - since, 0)
+        lines = self.run_command(
+            "env SLURM_TIME_FORMAT=%s sacct --allocations --noheader --parsable2 "
+            f"--user={user} --starttime=now-{ago}seconds --format={SACCT_FORMAT}",
+            check=True,
+        )
+        return parse_sacct(lines)
+
+    def cancel_jobs(self, job_ids):
+        errors = {}
+        for chunk in chunk_command("scancel", job_ids):
+            try:
+                self.run_command(f"scancel {' '.join(chunk)}", check=True)
+            except CommandError as e:
+                logger.warning(f"scancel failed: {e}")
+                errors.update((job_id, e) for job_id in chunk)
+        return errors
+
+    def cancel_user_jobs(self, user):
+        self.run_command(f"scancel -u {user}", check=True)
+
+
+class JobHistory(object):
+    """
+    The latest snapshot together with the deltas that led up to it. Both are swapped
+    under one lock so readers always get a delta that matches the snapshot.
+    """
+
+    def __init__(self):
+        self.snapshot = JobSnapshot(0, [])
+        self.deltas = deque(maxlen=DELTA_HISTORY_LEN)
+        self.lock = threading.Lock()
+
+    def publish(self, snapshot: JobSnapshot, delta: JobDelta):
+        with self.lock:
+            self.deltas.append((snapshot.generation, delta))
+            self.snapshot = snapshot
+
+    def since(self, generation: int) -> Tuple[JobSnapshot, Optional[JobDelta]]:
+        """
+        Returns the latest snapshot and everything that has changed after
+        `generation`. The delta is None if the history doesn't go back far enough.
+        """
+        with self.lock:
+            snapshot = self.snapshot
+            deltas = [d for g, d in self.deltas if g > generation]
+
+        if generation > snapshot.generation:
+            return snapshot, None
+        if len(deltas) != snapshot.generation - generation:
+            return snapshot, None
+
+        if not deltas:
+            return snapshot, JobDelta()
+
+        merged = deltas[0]
+        for d in deltas[1:]:
+            merged = merged.merge(d)
+
+        return snapshot, merged
+
+
+class UpdateNotifier(object):
+    """
+    Wakes the UI up when there's new data, by writing to a pipe the UI's event loop
+    watches (urwid's watch_pipe). Any thread can call notify(). There's never more
+    than one wake-up in flight: notifications that come in before the UI has called
+    acknowledge() are folded into the pending one.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+        os.set_blocking(fd, False)
+        self.pending = False
+        self.lock = threading.Lock()
+
+    def notify(self):
+        with self.lock:
+            if self.pending:
+                return
+            self.pending = True
+
+        try:
+            os.write(self.fd, b"\n")
+        except BlockingIOError:
+            # The pipe is full of wake-ups the UI hasn't read yet
+            pass
+
+    def acknowledge(self):
+        """Called by the UI before it looks at the new data."""
+        with self.lock:
+            self.pending = False
+
+
+class Cluster(threading.Thread):
+    def __init__(
+        self, remote=None, refresh_interval=1, driver=None, pool=None, name=None
+    ):
+        super().__init__()
+
+        self.driver = driver if driver is not None else SlurmCLIDriver(remote)
+        self.remote = self.driver.remote
+        # Known before connecting (unlike ClusterName) and unique per command line
+        # argument, which is what we need to tell jobs of different clusters apart.
+        self.name = name or remote or "local"
+        self.scheduler = PollScheduler(refresh_interval)
+        self.pool = pool
+
+        self.is_ready = threading.Event()
+
+        self.history = JobHistory()
+        self.job_query = JobQuery()
+        self.nodes = NodeTable()
+        self.last_node_poll = None
+        # Told about every snapshot that has changes in it
+        self.notifier = None  # type: Optional[UpdateNotifier]
+
+        self.actions = ActionExecutor(self.driver.cancel_jobs, self._actions_completed)
+        self.thread = None
+
+    def connect(self, fd, ssh_username=None, ssh_password=None):
+        self.fd = fd
+        self.ssh_username = ssh_username
+        self.ssh_password = ssh_password
+
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = threading.Thread(target=self._thread_fn, daemon=True)
+        self.thread.start()
+
+    def _thread_fn(self):
+
+        try:
+            self.driver.connect(self.ssh_username, self.ssh_password)
+        except AuthenticationError as e:
+            os.write(self.fd, e.reason.encode("utf-8"))
+            return
+
+        self.me = self.driver.whoami()
+        self.config = self.driver.get_config()
+        self.my_partitions, self.all_partitions = self.driver.get_partition_info()
+        self.node_names = frozenset(self.driver.get_node_names())
+
+        self.actions.start()
+
+        self.is_ready.set()
+        os.write(self.fd, b"connection established")
+        os.close(self.fd)
+        self.fd = None
+
+        # From here on polling is driven by the pool, possibly shared with other
+        # clusters.
+        if self.pool is None:
+            self.pool = PollingPool()
+        self.pool.add(self)
+
+    def poll_once(self):
+        self.scheduler.poll_started()
+
+        query = self.job_query
+        try:
+            jobs = self.driver.get_jobs(query)
+        except Exception:
+            logger.exception(f"Fetching jobs from {self.name} failed")
+            # Treat errors like a quiet queue so a broken cluster backs off
+            self.scheduler.poll_finished(quiet=True)
+            return
+
+        # Safe as nobody else has seen these Job objects yet
+        for job in jobs:
+            job.cluster = self.name
 
-        return [Job(fields.keys(), line) for line in cmd_output]
+        delta = self._publish_jobs(jobs, query)
+
+        now = time.monotonic()
+        if (
+            self.last_node_poll is None
+            or now - self.last_node_poll >= NODE_POLL_INTERVAL
+        ):
+            self.last_node_poll = now
+            self.poll_nodes()
+
+        # The elapsed time of running jobs changes on every single poll so it doesn't
+        # count as activity.
+        self.scheduler.poll_finished(quiet=delta.is_empty(ignore=("time",)))
+
+    def poll_nodes(self):
+        try:
+            nodes = self.driver.get_nodes()
+        except Exception:
+            logger.exception(f"Fetching nodes from {self.name} failed")
+            return
+
+        nodes.set_cluster(self.name)
+        if nodes.same_as(self.nodes):
+            return
+
+        # Published by swapping the reference, readers always see a whole table
+        nodes.generation = self.nodes.generation + 1
+        self.nodes = nodes
+        if self.notifier is not None:
+            self.notifier.notify()
+
+    def _actions_completed(self):
+        # Poll right away to show what the actions did, and wake the UI up in case
+        # they failed without changing any jobs.
+        self.scheduler.poke()
+        if self.notifier is not None:
+            self.notifier.notify()
+
+    def _publish_jobs(self, latest_jobs: List[Job], query=JobQuery()):
+        previous = self.history.snapshot
+        snapshot = JobSnapshot(previous.generation + 1, latest_jobs, query)
+
+        # Only one poll of a cluster runs at a time so the diff can be computed
+        # without holding the lock.
+        delta = JobDelta.between(previous.jobs_by_id, snapshot.jobs_by_id)
+        self.history.publish(snapshot, delta)
+
+        if self.notifier is not None and not delta.is_empty():
+            self.notifier.notify()
+
+        return delta
 
     @when_connected
     def get_name(self):
         return self.config["ClusterName"]
 
+    @when_connected
+    def get_snapshot(self) -> JobSnapshot:
+        return self.history.snapshot
+
     @when_connected
     def get_jobs(self):
-        with self.lock:
-            jobs_copy = copy.deepcopy(self.latest_jobs)
-        return jobs_copy
+        return self.history.snapshot.jobs
+
+    def set_job_query(self, query: JobQuery):
+        if query != self.job_query:
+            self.job_query = query
+            # Don't leave the user looking at the results of the old query for long
+            self.scheduler.poke()
+
+    @when_connected
+    def get_generation(self) -> int:
+        return self.history.snapshot.generation
 
     @when_connected
-    def cancel_jobs(self, jobs):
-        job_ids = " ".join(str(j.job_id) for j in jobs)
-        self.requests.put(f"scancel {job_ids}")
+    def get_nodes(self) -> NodeTable:
+        return self.nodes
 
     @when_connected
-    def cancel_my_jobs(self):
-        self.requests.put(f"scancel -u {self.me}")
+    def has_changed(self, generation: Optional[int]) -> bool:
+        return generation != self.history.snapshot.generation
+
+    @when_connected
+    def get_job_deltas(self, since_generation: int) -> Optional[Tuple[int, JobDelta]]:
+        """
+        Returns the current generation and everything that has changed in the job
+        list after `since_generation`. Returns None if the history doesn't go back
+        far enough, in which case the caller needs to do a full refresh using
+        get_snapshot().
+        """
+        snapshot, delta = self.history.since(since_generation)
+        if delta is None:
+            return None
+        return snapshot.generation, delta
 
     @when_connected
-    def cancel_my_newest_job(self):
-        self.requests.put(
-            f'squeue -u {self.me} --sort=-V -h --format="%A" | head -n 1 | xargs scancel'
+    def cancel_jobs(self, jobs) -> ActionHandle:
+        return self.actions.cancel(j.job_id for j in jobs)
+
+    @when_connected
+    def cancel_my_jobs(self) -> ActionHandle:
+        return self.actions.submit(
+            functools.partial(self.driver.cancel_user_jobs, self.me),
+            "Cancel all my jobs",
+        )
+
+    @when_connected
+    def cancel_my_newest_job(self) -> ActionHandle:
+        return self.actions.submit(
+            functools.partial(self._cancel_my_job_by_age, newest=True),
+            "Cancel my newest job",
         )
 
     @when_connected
-    def cancel_my_oldest_job(self):
-        self.requests.put(
-            f'squeue -u {self.me} --sort=+V -h --format="%A" | head -n 1 | xargs scancel'
+    def cancel_my_oldest_job(self) -> ActionHandle:
+        return self.actions.submit(
+            functools.partial(self._cancel_my_job_by_age, newest=False),
+            "Cancel my oldest job",
         )
+
+    def _cancel_my_job_by_age(self, newest):
+        job_ids = self.driver.get_user_job_ids(self.me, newest_first=newest)
+        if job_ids:
+            errors = self.driver.cancel_jobs(job_ids[:1])
+            if errors:
+                raise errors[job_ids[0]]
+
+
+class ClusterGroup(object):
+    """
+    Presents any number of Clusters as one. Jobs from all of them are merged into a
+    single snapshot/delta stream (Job.key includes the cluster name so ids can't
+    clash) and actions are routed to the cluster each job belongs to. All members
+    are polled by one shared PollingPool so a slow cluster never holds up the
+    others.
+    """
+
+    def __init__(self, clusters: Iterable[Cluster], history_path=None):
+        self.clusters = list(clusters)
+        self.pool = PollingPool()
+        for c in self.clusters:
+            c.pool = self.pool
+
+        self.history = JobHistory()
+        # The member snapshots the merged snapshot was built from
+        self.member_snapshots = {}
+        self.merged_snapshot = None
+        self.nodes = NodeTable()
+        self.member_nodes = []
+        self.job_details = JobDetailCache(self._fetch_job_details)
+        # Nothing is read from or written to disk until the history is looked at
+        self.finished_jobs = HistoryCache(
+            history_path or default_cache_path(), self._fetch_job_history
+        )
+
+    def set_notifier(self, notifier: UpdateNotifier):
+        for c in self.clusters:
+            c.notifier = notifier
+        self.job_details.on_fetched = notifier.notify
+        self.finished_jobs.on_synced = notifier.notify
+
+    def ready_clusters(self) -> List[Cluster]:
+        return [c for c in self.clusters if c.is_ready.is_set()]
+
+    def get_cluster(self, name: str) -> Cluster:
+        return next(c for c in self.clusters if c.name == name)
+
+    def get_cluster_names(self) -> List[str]:
+        return [c.name for c in self.clusters]
+
+    def get_name(self):
+        return ", ".join(c.get_name() for c in self.ready_clusters())
+
+    @property
+    def node_names(self) -> FrozenSet[str]:
+        return frozenset().union(*(c.node_names for c in self.ready_clusters()))
+
+    def _sync(self):
+        """Folds whatever the members have published since last time into ours."""
+        deltas = []
+        for c in self.ready_clusters():
+            previous = self.member_snapshots.get(c)
+            if previous is None:
+                previous = JobSnapshot(0, [])
+            elif not c.has_changed(previous.generation):
+                continue
+
+            snapshot, delta = c.history.since(previous.generation)
+            if delta is None:
+                delta = JobDelta.between(previous.jobs_by_id, snapshot.jobs_by_id)
+
+            self.member_snapshots[c] = snapshot
+            deltas.append(delta)
+
+        if deltas:
+            generation = self.history.snapshot.generation + 1
+            # Merged lazily in get_snapshot(), most refreshes only need the deltas
+            self.merged_snapshot = None
+            self.history.publish(JobSnapshot(generation, []), JobDelta.union(deltas))
+
+    def get_snapshot(self) -> JobSnapshot:
+        self._sync()
+        if self.merged_snapshot is None:
+            self.merged_snapshot = JobSnapshot(
+                self.history.snapshot.generation,
+                itertools.chain.from_iterable(self.member_snapshots.values()),
+            )
+        return self.merged_snapshot
+
+    def get_jobs(self):
+        return self.get_snapshot().jobs
+
+    def job_queries(self) -> Dict[str, JobQuery]:
+        """The query behind the latest jobs of each member, by cluster name."""
+        self._sync()
+        return {c.name: s.query for c, s in self.member_snapshots.items()}
+
+    def get_nodes(self) -> NodeTable:
+        """The nodes of all the clusters in one table, rebuilt when any changed."""
+        member_nodes = [c.nodes for c in self.ready_clusters()]
+        if len(member_nodes) != len(self.member_nodes) or any(
+            a is not b for a, b in zip(member_nodes, self.member_nodes)
+        ):
+            self.member_nodes = member_nodes
+            self.nodes = NodeTable.concat(member_nodes, self.nodes.generation + 1)
+        return self.nodes
+
+    def get_generation(self) -> int:
+        self._sync()
+        return self.history.snapshot.generation
+
+    def has_changed(self, generation: Optional[int]) -> bool:
+        return generation != self.get_generation()
+
+    def get_job_deltas(self, since_generation: int) -> Optional[Tuple[int, JobDelta]]:
+        self._sync()
+        snapshot, delta = self.history.since(since_generation)
+        if delta is None:
+            return None
+        return snapshot.generation, delta
+
+    def _fetch_job_details(self, key: tuple) -> Dict[str, str]:
+        cluster, job_id = key
+        return self.get_cluster(cluster).driver.get_job_details(job_id)
+
+    def get_job_details(self, job: Job, prefetch: Iterable[Job] = ()):
+        """
+        What JobDetailCache has for `job`: the details, the exception fetching them
+        raised, or None if they haven't been fetched yet. Never blocks.
+        """
+        return self.job_details.get(job.key, [j.key for j in prefetch])
+
+    def _fetch_job_history(self, cluster: str, user: str, since: int):
+        return self.get_cluster(cluster).driver.get_job_history(user, since)
+
+    def history_keys(self) -> List[Tuple[str, str]]:
+        """The (cluster, user) pairs whose finished jobs the history shows."""
+        return [(c.name, c.me) for c in self.ready_clusters()]
+
+    def cancel_jobs(self, jobs) -> ActionHandle:
+        by_cluster = OrderedDict()
+        for j in jobs:
+            by_cluster.setdefault(j.cluster, []).append(j)
+
+        handles = [self.get_cluster(c).cancel_jobs(js) for c, js in by_cluster.items()]
+        return gather(handles, f"Cancel {len(jobs)} job(s)")
+
+    def cancel_my_jobs(self, names: Optional[Iterable[str]] = None) -> ActionHandle:
+        """Cancels all my jobs on the clusters in `names`, all of them if None."""
+        clusters = self.ready_clusters()
+        if names is not None:
+            names = set(names)
+            clusters = [c for c in clusters if c.name in names]
+        handles = [c.cancel_my_jobs() for c in clusters]
+        return gather(handles, "Cancel all my jobs")
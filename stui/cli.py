@@ -2,16 +2,35 @@ import argparse
 import sys
 
 from stui.stui import StuiApp
+from stui.views.jobs import JobQueueWidget
 from stui import __version__
 
 
+def column_list(value):
+    columns = [c.strip() for c in value.split(",") if c.strip()]
+    for c in columns:
+        if c not in JobQueueWidget.hideable_columns:
+            raise argparse.ArgumentTypeError(f"unknown column '{c}'")
+    return columns
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description="stui")
 
     parser.add_argument(
         "--ssh",
         default=None,
-        help="Remote destination where slurm controller is running. Format: --remote {Host name defined in ssh config} or --remote {username@server}. Does _not_ prompt for password and relies on ssh-keys for authentication.",
+        nargs="+",
+        metavar="REMOTE",
+        help="Remote destination(s) where slurm controller is running. Format: --ssh {Host name defined in ssh config} or --ssh {username@server}. Does _not_ prompt for password and relies on ssh-keys for authentication. Several remotes are monitored side by side.",
+    )
+
+    parser.add_argument(
+        "--slurmrestd",
+        default=None,
+        nargs="+",
+        metavar="URL",
+        help="Talk to slurmrestd at URL(s) (e.g. http://host:6820) instead of running Slurm commands. Authenticates with $SLURM_JWT.",
     )
 
     parser.add_argument(
@@ -19,7 +38,15 @@ def parse_args():
         "--refresh-interval",
         type=int,
         default=1,
-        help="Refresh interval (in seconds) for fetching data from the cluster. (Default: 1s)",
+        help="Refresh interval (in seconds) for fetching data from the cluster. stui polls less often when squeue is slow or nothing changes. (Default: 1s)",
+    )
+
+    parser.add_argument(
+        "--hide-columns",
+        type=column_list,
+        default=[],
+        metavar="COLUMNS",
+        help=f"Comma-separated list of job columns to hide. Hidden columns aren't fetched from Slurm which helps on very large queues. Hiding any of user, nodes, cpus, gres or partition leaves the jobs out of the utilization summary. Choices: {','.join(JobQueueWidget.hideable_columns)}",
     )
 
     parser.add_argument(
@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional, Union
+
+__all__ = ["JobDetailCache"]
+
+logger = logging.getLogger("stui.details")
+
+Details = Union[Dict[str, str], Exception]
+
+
+class JobDetailCache(object):
+    """
+    The `scontrol show job` details of the jobs the user has looked at recently,
+    fetched on a background thread so the UI never waits for them.
+
+    get() only ever returns what's already there (None if nothing is) and asks for
+    whatever is missing or older than `ttl` seconds to be fetched. Each call replaces
+    the previous wish list rather than adding to it, so scrolling quickly past a
+    hundred jobs doesn't leave a hundred fetches queued up: only the job in focus
+    and its neighbours are fetched, in that order.
+
+    At most `max_size` jobs are kept, the least recently looked at go first.
+    Failures (e.g. a job that has already left the controller) are cached like
+    results so they aren't retried in a loop.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[tuple], Dict[str, str]],
+        max_size=256,
+        ttl=30.0,
+        on_fetched: Optional[Callable[[], None]] = None,
+    ):
+        self.fetch = fetch
+        self.max_size = max_size
+        self.ttl = ttl
+        self.on_fetched = on_fetched
+
+        # key -> (time fetched, details or the exception fetching them raised)
+        self.entries = OrderedDict()
+        self.wanted = []
+        self.in_flight = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread = None
+
+    def _is_fresh(self, key, now) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and now - entry[0] < self.ttl
+
+    def get(self, key: tuple, prefetch: Iterable[tuple] = ()) -> Optional[Details]:
+        """
+        The details of job `key`, possibly a bit out of date, or None if they've
+        never been fetched. Also fetches the jobs in `prefetch` in the background.
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+            self.wanted = [
+                k
+                for k in dict.fromkeys((key, *prefetch))
+                if k != self.in_flight and not self._is_fresh(k, now)
+            ]
+            wanted = bool(self.wanted)
+            if wanted:
+                self.wakeup.notify()
+
+        if wanted and self.thread is None:
+            self.thread = threading.Thread(target=self._thread_fn, daemon=True)
+            self.thread.start()
+
+        return None if entry is None else entry[1]
+
+    def _thread_fn(self):
+        while True:
+            with self.lock:
+                while not self.wanted:
+                    self.wakeup.wait()
+                key = self.in_flight = self.wanted.pop(0)
+
+            try:
+                details = self.fetch(key)
+            except Exception as e:
+                logger.warning(f"Fetching the details of {key} failed: {e}")
+                details = e
+
+            with self.lock:
+                self.in_flight = None
+                self.entries[key] = (time.monotonic(), details)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+            if self.on_fetched is not None:
+                self.on_fetched()
@@ -0,0 +1,209 @@
+import functools
+from collections import defaultdict
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+
+from stui.backend import Job, JobDelta
+from stui.search import NameIndex, make_matcher
+
+__all__ = ["JobFilter", "JobIndex"]
+
+
+def _job_nodes(job: Job) -> Iterable[str]:
+    """
+    The job's nodes, or its node list as it is if that can't be expanded so that
+    one malformed squeue row doesn't break filtering for everyone.
+    """
+    try:
+        return job.nodes
+    except ValueError:
+        return (job.nodes_str,)
+
+
+class JobFilter(NamedTuple):
+    """
+    Everything the Jobs tab filters on, read from the filter panel once per refresh.
+    None (or False/"") means the corresponding filter is off. Partitions and users
+    are per cluster so they're stored as (cluster, value) pairs.
+    """
+
+    clusters: Optional[FrozenSet[str]] = None
+    partitions: Optional[FrozenSet[tuple]] = None
+    users: Optional[FrozenSet[tuple]] = None
+    states: Optional[FrozenSet[str]] = None
+    gpu: bool = False
+    name: str = ""
+    # One of search.SEARCH_MODES
+    name_mode: str = "substring"
+    # Matched anywhere in the names of the job's nodes
+    node: str = ""
+
+    def residual_predicate(self) -> Optional[Callable[[Job], bool]]:
+        """The part that JobIndex can't answer, None if there's nothing left."""
+        if self.gpu:
+            return Job.uses_gpu
+        return None
+
+    def compile(self) -> Callable[[Job], bool]:
+        """A single predicate for checking individual jobs against the filter."""
+        checks = []
+
+        if self.clusters is not None:
+            clusters = self.clusters
+            checks.append(lambda j: j.cluster in clusters)
+        if self.partitions is not None:
+            partitions = self.partitions
+            checks.append(lambda j: (j.cluster, j.partition) in partitions)
+        if self.users is not None:
+            users = self.users
+            checks.append(lambda j: (j.cluster, j.user) in users)
+        if self.states is not None:
+            states = self.states
+            checks.append(lambda j: j.state in states)
+        if self.node:
+            node = self.node
+            checks.append(lambda j: any(node in n for n in _job_nodes(j)))
+        if self.name:
+            matcher = make_matcher(self.name, self.name_mode)
+            checks.append(lambda j: matcher(j.name))
+
+        residual = self.residual_predicate()
+        if residual is not None:
+            checks.append(residual)
+
+        if not checks:
+            return lambda j: True
+        if len(checks) == 1:
+            return checks[0]
+        return lambda j: all(check(j) for check in checks)
+
+
+class JobIndex(object):
+    """
+    The job table together with inverted indexes from user, partition, state and
+    node to the keys of the jobs that have them, plus an n-gram index over job
+    names for searching (see search.NameIndex). It's kept up to date from the
+    backend's JobDeltas so maintaining it costs O(changes) per poll, and the
+    filters that matter on big queues become set intersections instead of scans.
+    """
+
+    def __init__(self):
+        self.jobs = {}  # type: Dict[tuple, Job]
+        # Position in the table, to give filtered results the table's order
+        self.order = {}  # type: Dict[tuple, int]
+        self.next_order = 0
+
+        self.by_cluster = defaultdict(set)
+        self.by_partition = defaultdict(set)  # (cluster, partition) -> keys
+        self.by_user = defaultdict(set)  # (cluster, user) -> keys
+        self.by_state = defaultdict(set)
+        self.by_node = defaultdict(set)
+        self.names = NameIndex()
+
+    def __len__(self):
+        return len(self.jobs)
+
+    def _entries(self, job: Job):
+        yield self.by_cluster, job.cluster
+        yield self.by_partition, (job.cluster, job.partition)
+        yield self.by_user, (job.cluster, job.user)
+        yield self.by_state, job.state
+        for node in _job_nodes(job):
+            if node:
+                yield self.by_node, node
+
+    def _add(self, job: Job):
+        key = job.key
+        for index, value in self._entries(job):
+            index[value].add(key)
+        self.names.add(key, job.name)
+
+    def _remove(self, job: Job):
+        key = job.key
+        for index, value in self._entries(job):
+            keys = index[value]
+            keys.discard(key)
+            if not keys:
+                del index[value]
+        self.names.remove(key, job.name)
+
+    def rebuild(self, jobs: Iterable[Job]):
+        self.__init__()
+        for job in jobs:
+            self.jobs[job.key] = job
+            self.order[job.key] = self.next_order
+            self.next_order += 1
+            self._add(job)
+
+    def apply_delta(self, delta: JobDelta):
+        for key in delta.removed:
+            job = self.jobs.pop(key, None)
+            if job is not None:
+                del self.order[key]
+                self._remove(job)
+
+        for key, job in delta.added.items():
+            self.jobs[key] = job
+            self.order[key] = self.next_order
+            self.next_order += 1
+            self._add(job)
+
+        for key, (job, fields) in delta.changed.items():
+            old = self.jobs[key]
+            self.jobs[key] = job
+            # Most changes are to the elapsed time, which isn't indexed
+            if old.cluster != job.cluster or any(
+                f in ("partition", "user", "state", "nodes_str", "name") for f in fields
+            ):
+                self._remove(old)
+                self._add(job)
+
+    def _lookup(self, index, values) -> Set[tuple]:
+        keys = set()
+        for v in values:
+            keys |= index.get(v, set())
+        return keys
+
+    def candidates(self, f: JobFilter) -> Optional[Set[tuple]]:
+        """
+        Keys of the jobs that pass the indexed part of `f`, or None if none of the
+        indexed filters are active.
+        """
+        sets = []
+        if f.clusters is not None:
+            sets.append(self._lookup(self.by_cluster, f.clusters))
+        if f.partitions is not None:
+            sets.append(self._lookup(self.by_partition, f.partitions))
+        if f.users is not None:
+            sets.append(self._lookup(self.by_user, f.users))
+        if f.states is not None:
+            sets.append(self._lookup(self.by_state, f.states))
+        if f.node:
+            # Far fewer node names than jobs so this is still cheap
+            nodes = [n for n in self.by_node if f.node in n]
+            sets.append(self._lookup(self.by_node, nodes))
+        if f.name:
+            sets.append(self.names.search(f.name, f.name_mode))
+
+        if not sets:
+            return None
+
+        # Starting from the smallest set keeps every intersection small
+        sets.sort(key=len)
+        return functools.reduce(set.intersection, sets[1:], sets[0])
+
+    def select(self, f: JobFilter) -> List[Job]:
+        """The jobs that pass `f`, in table order."""
+        keys = self.candidates(f)
+        if keys is None:
+            jobs = self.jobs.values()
+        elif len(keys) * 4 > len(self.jobs):
+            # Cheaper to walk the table than to sort lots of keys
+            jobs = [j for k, j in self.jobs.items() if k in keys]
+        else:
+            jobs = [self.jobs[k] for k in sorted(keys, key=self.order.__getitem__)]
+
+        predicate = f.residual_predicate()
+        if predicate is not None:
+            jobs = filter(predicate, jobs)
+
+        return list(jobs)
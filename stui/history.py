@@ -0,0 +1,354 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from stui.util import to_int
+
+__all__ = [
+    "HistoryCache",
+    "HistoryQuery",
+    "HistoryRecord",
+    "SACCT_FORMAT",
+    "default_cache_path",
+    "parse_sacct",
+]
+
+logger = logging.getLogger("stui.history")
+
+# How far back the very first sync of a cluster goes
+INITIAL_DAYS = 7
+
+# Jobs that finished longer ago than this are dropped from the cache
+RETENTION_DAYS = 90
+
+# How often the cache is brought up to date while the history is on screen
+SYNC_INTERVAL = 60.0
+
+# Every sync goes back a bit further than where the previous one stopped, to catch
+# records slurmdbd got late and clocks that don't quite agree with ours. Records are
+# upserted so getting some of them twice does no harm.
+SYNC_OVERLAP = 300
+
+
+class HistoryRecord(NamedTuple):
+    job_id: str
+    name: str
+    partition: str
+    state: str
+    exit_code: str
+    # Seconds since the epoch, None if the job never got that far
+    submit_time: Optional[int]
+    start_time: Optional[int]
+    end_time: Optional[int]
+    elapsed: int
+    cpus: int
+    node_list: str
+    tres: str
+
+
+# The sacct fields a HistoryRecord is made of. JobName comes last because it's the
+# only one that can have a "|" in it.
+SACCT_FORMAT = (
+    "JobID,State,ExitCode,Submit,Start,End,ElapsedRaw,AllocCPUS,NodeList,AllocTRES,"
+    "Partition,JobName"
+)
+_N_SACCT_FIELDS = SACCT_FORMAT.count(",") + 1
+
+
+def _epoch(s: str) -> Optional[int]:
+    # Times are printed as seconds since the epoch (SLURM_TIME_FORMAT=%s) so that
+    # the cluster's timezone doesn't matter, and as "Unknown" or "None" for times
+    # that haven't happened.
+    return int(s) if s.isdigit() else None
+
+
+def parse_sacct(lines: Iterable[str]) -> List[HistoryRecord]:
+    """
+    Parses `sacct --parsable2 --noheader --format=SACCT_FORMAT` output, run with
+    SLURM_TIME_FORMAT=%s.
+    """
+    records = []
+    for line in lines:
+        values = line.split("|", _N_SACCT_FIELDS - 1)
+        if len(values) != _N_SACCT_FIELDS:
+            continue
+        (
+            job_id,
+            state,
+            exit_code,
+            submit,
+            start,
+            end,
+            elapsed,
+            cpus,
+            node_list,
+            tres,
+            partition,
+            name,
+        ) = values
+
+        records.append(
+            HistoryRecord(
+                job_id,
+                name,
+                partition,
+                # "CANCELLED by 1234" -> "CANCELLED"
+                state.partition(" ")[0],
+                exit_code,
+                _epoch(submit),
+                _epoch(start),
+                _epoch(end),
+                to_int(elapsed),
+                to_int(cpus),
+                node_list,
+                tres,
+            )
+        )
+    return records
+
+
+def default_cache_path() -> str:
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "stui", "history.sqlite")
+
+
+class HistoryQuery(NamedTuple):
+    """What the history is narrowed down to. None means no restriction."""
+
+    # Matched case-insensitively anywhere in the job name or id
+    text: str = ""
+    states: Optional[Tuple[str, ...]] = None
+    partitions: Optional[Tuple[str, ...]] = None
+    # Only jobs that ended at or after this time
+    ended_after: Optional[int] = None
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    cluster TEXT NOT NULL,
+    user TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    name TEXT,
+    partition TEXT,
+    state TEXT,
+    exit_code TEXT,
+    submit_time INTEGER,
+    start_time INTEGER,
+    end_time INTEGER,
+    elapsed INTEGER,
+    cpus INTEGER,
+    node_list TEXT,
+    tres TEXT,
+    PRIMARY KEY (cluster, user, job_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_by_end ON jobs (cluster, user, end_time, job_id);
+CREATE INDEX IF NOT EXISTS jobs_by_state ON jobs (cluster, user, state, end_time);
+CREATE INDEX IF NOT EXISTS jobs_by_partition
+    ON jobs (cluster, user, partition, end_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    cluster TEXT NOT NULL,
+    user TEXT NOT NULL,
+    synced_until INTEGER NOT NULL,
+    PRIMARY KEY (cluster, user)
+);
+"""
+
+_RECORD_COLUMNS = ", ".join(HistoryRecord._fields)
+
+# Newest first. Ties are broken by the rest of the key so that positions are stable.
+_ORDER = "ORDER BY end_time DESC, cluster DESC, job_id DESC"
+
+
+class HistoryCache(object):
+    """
+    The finished jobs of each (cluster, user) in an SQLite database that outlives
+    stui, so sacct is only ever asked for what ended since the last sync rather than
+    for weeks of history at a time.
+
+    sync() brings the cache up to date on a background thread. Everything else reads
+    the database directly and is meant to be cheap enough for the UI thread: the list
+    is read a page at a time and state, partition and time filters are answered from
+    indexes. Each thread gets its own connection, and in WAL mode readers never wait
+    for a sync that's writing.
+
+    `fetch(cluster, user, since)` returns the HistoryRecords of the jobs of `user`
+    that were around at `since` or later, finished or not.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fetch: Callable[[str, str, int], List[HistoryRecord]],
+        on_synced: Optional[Callable[[], None]] = None,
+        interval=SYNC_INTERVAL,
+    ):
+        self.path = path
+        self.fetch = fetch
+        self.on_synced = on_synced
+        self.interval = interval
+
+        self.local = threading.local()
+
+        self.wanted = []
+        self.in_flight = None
+        # (cluster, user) -> monotonic time of the last sync, whether or not it worked
+        self.last_sync = {}
+        self.errors = {}
+        # Goes up whenever a sync has written something
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread = None
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self.local.conn = conn
+        return conn
+
+    def sync(self, keys: Iterable[Tuple[str, str]]):
+        """
+        Fetches what's new for each (cluster, user) in `keys` in the background,
+        unless that was done less than `interval` seconds ago.
+        """
+        now = time.monotonic()
+        with self.lock:
+            stale = [
+                k
+                for k in keys
+                if k != self.in_flight
+                and k not in self.wanted
+                and now - self.last_sync.get(k, -self.interval) >= self.interval
+            ]
+            self.wanted.extend(stale)
+            if stale:
+                self.wakeup.notify()
+
+        if stale and self.thread is None:
+            self.thread = threading.Thread(target=self._thread_fn, daemon=True)
+            self.thread.start()
+
+    def is_syncing(self, keys: Iterable[Tuple[str, str]]) -> bool:
+        with self.lock:
+            return any(k == self.in_flight or k in self.wanted for k in keys)
+
+    def _thread_fn(self):
+        while True:
+            with self.lock:
+                while not self.wanted:
+                    self.wakeup.wait()
+                key = self.in_flight = self.wanted.pop(0)
+
+            error = None
+            written = 0
+            try:
+                written = self._sync(key)
+            except Exception as e:
+                logger.warning(f"Fetching the job history of {key} failed: {e}")
+                error = e
+
+            with self.lock:
+                self.in_flight = None
+                self.last_sync[key] = time.monotonic()
+                self.errors[key] = error
+                if written:
+                    self.generation += 1
+
+            if self.on_synced is not None:
+                self.on_synced()
+
+    def _sync(self, key: Tuple[str, str]) -> int:
+        cluster, user = key
+        conn = self._connection()
+
+        row = conn.execute(
+            "SELECT synced_until FROM sync_state WHERE cluster = ? AND user = ?", key
+        ).fetchone()
+        started = int(time.time())
+        if row is None:
+            since = started - INITIAL_DAYS * 24 * 3600
+        else:
+            since = row[0] - SYNC_OVERLAP
+
+        # Jobs that haven't ended yet are still in squeue and come back next time
+        records = [r for r in self.fetch(cluster, user, since) if r.end_time]
+
+        placeholders = ", ".join("?" * (2 + len(HistoryRecord._fields)))
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO jobs (cluster, user, {_RECORD_COLUMNS}) "
+                f"VALUES ({placeholders})",
+                ((cluster, user, *r) for r in records),
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE cluster = ? AND user = ? AND end_time < ?",
+                (cluster, user, started - RETENTION_DAYS * 24 * 3600),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                (cluster, user, started),
+            )
+        return len(records)
+
+    @staticmethod
+    def _where(keys: List[Tuple[str, str]], query: HistoryQuery):
+        if not keys:
+            return "0", []
+
+        clauses = ["(" + " OR ".join(["(cluster = ? AND user = ?)"] * len(keys)) + ")"]
+        params = [v for k in keys for v in k]
+
+        if query.states is not None:
+            clauses.append(f"state IN ({', '.join('?' * len(query.states))})")
+            params.extend(query.states)
+        if query.partitions is not None:
+            clauses.append(f"partition IN ({', '.join('?' * len(query.partitions))})")
+            params.extend(query.partitions)
+        if query.ended_after is not None:
+            clauses.append("end_time >= ?")
+            params.append(query.ended_after)
+        if query.text:
+            # Not something an index can help with, but it only looks at the rows
+            # the other conditions have already picked.
+            clauses.append("(instr(lower(name), ?) > 0 OR instr(job_id, ?) > 0)")
+            params.extend((query.text.lower(), query.text))
+
+        return " AND ".join(clauses), params
+
+    def count(self, keys: List[Tuple[str, str]], query=HistoryQuery()) -> int:
+        where, params = self._where(keys, query)
+        sql = f"SELECT COUNT(*) FROM jobs WHERE {where}"
+        return self._connection().execute(sql, params).fetchone()[0]
+
+    def page(
+        self, keys: List[Tuple[str, str]], query, offset: int, limit: int
+    ) -> List[Tuple[str, HistoryRecord]]:
+        """Rows offset to offset + limit of the history, newest first."""
+        where, params = self._where(keys, query)
+        sql = (
+            f"SELECT cluster, {_RECORD_COLUMNS} FROM jobs WHERE {where} {_ORDER} "
+            "LIMIT ? OFFSET ?"
+        )
+        rows = self._connection().execute(sql, (*params, limit, offset))
+        return [(row[0], HistoryRecord(*row[1:])) for row in rows]
+
+    def position(
+        self, keys: List[Tuple[str, str]], query, cluster: str, record: HistoryRecord
+    ) -> int:
+        """Where `record` is (or would be) in the history."""
+        where, params = self._where(keys, query)
+        sql = (
+            f"SELECT COUNT(*) FROM jobs WHERE {where} "
+            "AND (end_time, cluster, job_id) > (?, ?, ?)"
+        )
+        params = (*params, record.end_time, cluster, record.job_id)
+        return self._connection().execute(sql, params).fetchone()[0]
@@ -0,0 +1,116 @@
+import functools
+import re
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+__all__ = ["compress_hostlist", "expand_hostlist"]
+
+_NUMBERED_HOST = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+
+def _split_top_level(hostlist: str) -> List[str]:
+    """Splits on the commas that aren't inside brackets."""
+    parts = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(hostlist):
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            parts.append(hostlist[start:i])
+            start = i + 1
+    parts.append(hostlist[start:])
+    return [p for p in parts if p]
+
+
+def _expand_range(r: str) -> List[str]:
+    lo, sep, hi = r.partition("-")
+    if not sep:
+        return [lo]
+
+    # Slurm pads every number in a range to the width of the lower bound
+    width = len(lo)
+    return [f"{i:0{width}d}" for i in range(int(lo), int(hi) + 1)]
+
+
+def _expand_host(host: str) -> List[str]:
+    start = host.find("[")
+    if start == -1:
+        return [host]
+
+    end = host.index("]", start)
+    prefix = host[:start]
+    numbers = [n for r in host[start + 1 : end].split(",") for n in _expand_range(r)]
+
+    # There can be more bracketed ranges after this one, e.g. rack[1-2]-node[1-4]
+    rests = _expand_host(host[end + 1 :])
+    return [prefix + n + rest for n in numbers for rest in rests]
+
+
+@functools.lru_cache(maxsize=4096)
+def expand_hostlist(hostlist: str) -> Tuple[str, ...]:
+    """
+    Expands a Slurm hostlist like "gpu[001-003,010],cpu[1-2]-ib" into individual
+    host names. Results are cached as the same few hostlists show up in every poll.
+    """
+    if "[" not in hostlist:
+        # By far the most common case: a single node, or nothing at all
+        return tuple(h for h in hostlist.split(",") if h)
+
+    hosts = []
+    for part in _split_top_level(hostlist):
+        hosts.extend(_expand_host(part))
+    return tuple(hosts)
+
+
+def _compress_numbers(numbers: List[str]) -> List[str]:
+    # Ties like "9" and "09" are broken by the text so the result doesn't depend
+    # on the set's order
+    numbers = sorted(set(numbers), key=lambda n: (int(n), n))
+
+    ranges = []
+    lo = hi = numbers[0]
+    for n in numbers[1:]:
+        # Only extend a range if the number is written the way Slurm would write it
+        # as part of that range, i.e. padded to the width of the lower bound.
+        if int(n) == int(hi) + 1 and n == f"{int(n):0{len(lo)}d}":
+            hi = n
+        else:
+            ranges.append(lo if lo == hi else f"{lo}-{hi}")
+            lo = hi = n
+    ranges.append(lo if lo == hi else f"{lo}-{hi}")
+
+    return ranges
+
+
+@functools.lru_cache(maxsize=4096)
+def _compress(hosts: Tuple[str, ...]) -> str:
+    groups = OrderedDict()
+    for host in hosts:
+        m = _NUMBERED_HOST.match(host)
+        if m is None:
+            groups.setdefault((host, None), [])
+        else:
+            prefix, number, suffix = m.groups()
+            groups.setdefault((prefix, suffix), []).append(number)
+
+    parts = []
+    for (prefix, suffix), numbers in groups.items():
+        if suffix is None:
+            parts.append(prefix)
+            continue
+
+        ranges = _compress_numbers(numbers)
+        if len(ranges) == 1 and "-" not in ranges[0]:
+            parts.append(f"{prefix}{ranges[0]}{suffix}")
+        else:
+            parts.append(f"{prefix}[{','.join(ranges)}]{suffix}")
+
+    return ",".join(parts)
+
+
+def compress_hostlist(hosts: Iterable[str]) -> str:
+    """The inverse of expand_hostlist(): ["gpu001", "gpu002"] -> "gpu[001-002]"."""
+    return _compress(tuple(hosts))
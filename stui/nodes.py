@@ -0,0 +1,244 @@
+import re
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from stui.util import to_int
+
+__all__ = [
+    "NodeTable",
+    "is_gpu",
+    "parse_gres",
+    "parse_oneliner",
+    "parse_scontrol_nodes",
+]
+
+# `scontrol show ... --oneliner` prints one `Key=value` list per node (or job).
+# Values can have spaces in them (OS=Linux 5.15.0 #1 SMP ..., Reason=...) so a value
+# runs up to the next ` Key=`. Some keys have odd characters: Socks/Node=*,
+# NtasksPerN:B:S:C=0:0:*:*
+_ONELINER_KEY = re.compile(r"(?:^|\s)([A-Za-z][\w/:]*)=")
+
+_GRES_INDEX = re.compile(r"\([^)]*\)")
+
+# Flags scontrol/sinfo append to node states, e.g. "DOWN*" or "IDLE~"
+_STATE_FLAGS = "*~#!%$@^-"
+
+
+def parse_oneliner(line: str) -> Dict[str, str]:
+    matches = list(_ONELINER_KEY.finditer(line))
+    values = {}
+    for m, next_m in zip(matches, matches[1:] + [None]):
+        end = next_m.start() if next_m is not None else len(line)
+        values[m.group(1)] = line[m.end() : end].strip()
+    return values
+
+
+def parse_gres(gres: str) -> Tuple[Tuple[str, int], ...]:
+    """
+    Turns a GRES string like "gpu:a100:4(S:0-1),shard:8" (or GresUsed's
+    "gpu:a100:2(IDX:0-1)") into (("gpu:a100", 4), ("shard", 8)).
+    """
+    if not gres or gres in ("(null)", "N/A"):
+        return ()
+
+    out = []
+    for item in _GRES_INDEX.sub("", gres).split(","):
+        parts = [p for p in item.split(":") if p and p != "no_consume"]
+        if not parts:
+            continue
+        count = 1
+        if len(parts) > 1 and parts[-1].isdigit():
+            count = int(parts.pop())
+        out.append((sys.intern(":".join(parts)), count))
+    return tuple(out)
+
+
+def is_gpu(name: str) -> bool:
+    return name == "gpu" or name.startswith("gpu:")
+
+
+def _gpus(gres: Tuple[Tuple[str, int], ...]) -> int:
+    return sum(n for name, n in gres if is_gpu(name))
+
+
+def base_state(state: str) -> str:
+    # "IDLE+DRAIN" -> "IDLE", "DOWN*" -> "DOWN"
+    return state.partition("+")[0].rstrip(_STATE_FLAGS)
+
+
+def is_unavailable(state: str) -> bool:
+    return summary_state(state) in ("DOWN", "DRAIN")
+
+
+def summary_state(state: str) -> str:
+    # Like base_state() but a drained or down node counts as such whatever its base
+    # state is.
+    flags = [s.rstrip(_STATE_FLAGS) for s in state.split("+")]
+    if "DOWN" in flags or "FAIL" in flags:
+        return "DOWN"
+    if any(f.startswith("DRAIN") for f in flags):
+        return "DRAIN"
+    return flags[0]
+
+
+class NodeTable(object):
+    """
+    The state of every node of a cluster (or several), stored column by column:
+    numbers go in arrays and strings, which mostly repeat from node to node, are
+    interned. A 2000 node cluster fits in a few hundred KB and whole columns can be
+    summed or compared at C speed.
+
+    A new table is made for every poll. `generation` only goes up when something
+    changed, so consumers can tell whether they're up to date by comparing it.
+    """
+
+    # Columns in the order row() returns them
+    COLUMNS = (
+        "clusters",
+        "names",
+        "states",
+        "cpus_alloc",
+        "cpus_idle",
+        "cpus_total",
+        "mem_alloc",
+        "mem_total",
+        "gres",
+        "gres_used",
+        "partitions",
+        "features",
+    )
+
+    def __init__(self, generation=0):
+        self.generation = generation
+
+        self.clusters = []  # type: List[str]
+        self.names = []  # type: List[str]
+        self.states = []  # type: List[str]
+        self.cpus_alloc = array("l")
+        self.cpus_idle = array("l")
+        self.cpus_total = array("l")
+        # In MB, like Slurm reports it
+        self.mem_alloc = array("q")
+        self.mem_total = array("q")
+        # ((name[:type], count), ...), see parse_gres()
+        self.gres = []  # type: List[Tuple[Tuple[str, int], ...]]
+        self.gres_used = []  # type: List[Tuple[Tuple[str, int], ...]]
+        self.gpus_alloc = array("l")
+        self.gpus_total = array("l")
+        self.partitions = []  # type: List[Tuple[str, ...]]
+        self.features = []  # type: List[str]
+
+        self.index = {}  # type: Dict[Tuple[str, str], int]
+
+    def append(
+        self,
+        cluster: str,
+        name: str,
+        state: str,
+        cpus_alloc: int,
+        cpus_total: int,
+        mem_alloc: int,
+        mem_total: int,
+        gres: Tuple[Tuple[str, int], ...] = (),
+        gres_used: Tuple[Tuple[str, int], ...] = (),
+        partitions: Iterable[str] = (),
+        features: str = "",
+    ):
+        intern = sys.intern
+        self.index[(cluster, name)] = len(self.names)
+
+        self.clusters.append(intern(cluster))
+        self.names.append(name)
+        self.states.append(intern(state))
+        self.cpus_alloc.append(cpus_alloc)
+        # Like sinfo's %C, CPUs of nodes that can't run jobs aren't idle
+        idle = 0 if is_unavailable(state) else max(cpus_total - cpus_alloc, 0)
+        self.cpus_idle.append(idle)
+        self.cpus_total.append(cpus_total)
+        self.mem_alloc.append(mem_alloc)
+        self.mem_total.append(mem_total)
+        self.gres.append(gres)
+        self.gres_used.append(gres_used)
+        self.gpus_alloc.append(_gpus(gres_used))
+        self.gpus_total.append(_gpus(gres))
+        self.partitions.append(tuple(intern(p) for p in partitions))
+        self.features.append(intern(features))
+
+    def __len__(self):
+        return len(self.names)
+
+    def set_cluster(self, cluster: str):
+        """Drivers don't know which Cluster they belong to, this fills it in."""
+        self.clusters = [sys.intern(cluster)] * len(self.names)
+        self.index = {(cluster, name): i for i, name in enumerate(self.names)}
+
+    def key_at(self, i: int) -> Tuple[str, str]:
+        return (self.clusters[i], self.names[i])
+
+    def row(self, i: int) -> tuple:
+        """Everything about the i-th node, as a tuple that compares by value."""
+        return tuple(getattr(self, c)[i] for c in self.COLUMNS)
+
+    def changes_since(self, old: "NodeTable") -> Tuple[List[int], List[int]]:
+        """
+        Positions of the rows of `old` that are gone or have changed, and of the rows
+        of this table that are new or have changed.
+        """
+        gone, new = [], []
+        for i in range(len(self)):
+            j = old.index.get(self.key_at(i))
+            if j is None:
+                new.append(i)
+            elif old.row(j) != self.row(i):
+                gone.append(j)
+                new.append(i)
+        gone.extend(j for key, j in old.index.items() if key not in self.index)
+        return gone, new
+
+    def same_as(self, other: "NodeTable") -> bool:
+        return all(getattr(self, c) == getattr(other, c) for c in self.COLUMNS)
+
+    def state_counts(self) -> Counter:
+        return Counter(map(summary_state, self.states))
+
+    @classmethod
+    def concat(cls, tables: Iterable["NodeTable"], generation=0) -> "NodeTable":
+        out = cls(generation)
+        for table in tables:
+            offset = len(out)
+            for column in cls.COLUMNS + ("gpus_alloc", "gpus_total"):
+                getattr(out, column).extend(getattr(table, column))
+            out.index.update((k, i + offset) for k, i in table.index.items())
+        return out
+
+
+def parse_scontrol_nodes(lines: Iterable[str], cluster: str = "") -> NodeTable:
+    """Builds a NodeTable out of `scontrol show nodes --oneliner` output."""
+    table = NodeTable()
+    for line in lines:
+        if not line.startswith("NodeName="):
+            continue
+        d = parse_oneliner(line)
+
+        # CPUEfctv leaves out CPUs reserved for the system (CoreSpec), older Slurm
+        # versions don't have it.
+        cpus_total = to_int(d.get("CPUEfctv") or d.get("CPUTot"))
+        partitions = d.get("Partitions", "")
+        features = d.get("ActiveFeatures") or d.get("AvailableFeatures") or ""
+
+        table.append(
+            cluster,
+            d["NodeName"],
+            d.get("State", "UNKNOWN"),
+            to_int(d.get("CPUAlloc")),
+            cpus_total,
+            to_int(d.get("AllocMem")),
+            to_int(d.get("RealMemory")),
+            parse_gres(d.get("Gres", "")),
+            parse_gres(d.get("GresUsed", "")),
+            partitions.split(",") if partitions and partitions != "(null)" else (),
+            "" if features == "(null)" else features,
+        )
+    return table
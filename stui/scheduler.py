@@ -0,0 +1,171 @@
+import logging
+import random
+import threading
+import time
+from queue import Queue
+
+__all__ = ["PollScheduler", "PollingPool"]
+
+logger = logging.getLogger("stui.scheduler")
+
+# No matter what the user asks for, never query slurmctld more often than this. With
+# many people running stui against the same controller this is what keeps it happy.
+MIN_POLL_INTERVAL = 1.0
+
+
+class PollScheduler(object):
+    """
+    Decides when the next squeue should run.
+
+    The interval starts at the user's --refresh-interval and is stretched when:
+      * polling takes too long: the interval is always at least long enough for
+        polling to stay under `max_duty_cycle` of wall time.
+      * the queue is quiet: after `quiet_polls` polls without any interesting
+        change the interval grows by `backoff` up to `max_interval`.
+
+    poke() is called after user actions (e.g. a cancel) to snap back to the base
+    interval and to poll as soon as the rate limit allows.
+    """
+
+    def __init__(
+        self,
+        interval=1.0,
+        max_duty_cycle=0.25,
+        max_interval=None,
+        backoff=1.5,
+        quiet_polls=5,
+        jitter=0.1,
+    ):
+        self.base_interval = max(float(interval), MIN_POLL_INTERVAL)
+        self.max_duty_cycle = max_duty_cycle
+        self.max_interval = (
+            max_interval if max_interval is not None else self.base_interval * 8
+        )
+        self.backoff = backoff
+        self.quiet_polls = quiet_polls
+        self.jitter = jitter
+
+        self.interval = self.base_interval
+        self.poll_duration = 0.0
+        self.consecutive_quiet_polls = 0
+        self.last_poll_start = None
+        self.jitter_factor = 1.0
+
+        self.poked = threading.Event()
+        self.on_poke = None
+
+    def poll_started(self):
+        if self.poked.is_set():
+            logger.debug("Polling early after a user action")
+        self.poked.clear()
+        self.last_poll_start = time.monotonic()
+
+    def poll_finished(self, quiet=False):
+        duration = time.monotonic() - self.last_poll_start
+
+        # Smooth the measurement so one slow squeue doesn't throw everything off
+        # but a consistently slow one is picked up within a few polls.
+        if self.poll_duration == 0.0:
+            self.poll_duration = duration
+        else:
+            self.poll_duration = 0.7 * self.poll_duration + 0.3 * duration
+
+        if quiet:
+            self.consecutive_quiet_polls += 1
+            if self.consecutive_quiet_polls >= self.quiet_polls:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+        else:
+            self.consecutive_quiet_polls = 0
+            self.interval = self.base_interval
+
+        # Spread the polls of many clients that were started at the same time.
+        self.jitter_factor = 1 + random.uniform(-self.jitter, self.jitter)
+
+    def current_interval(self) -> float:
+        """Time between the start of two consecutive polls."""
+        min_for_duty_cycle = self.poll_duration / self.max_duty_cycle
+        return max(self.interval, min_for_duty_cycle, MIN_POLL_INTERVAL)
+
+    def next_poll_at(self) -> float:
+        if self.last_poll_start is None:
+            # Never polled, so it's overdue
+            return float("-inf")
+
+        if self.poked.is_set():
+            interval = max(MIN_POLL_INTERVAL, self.poll_duration)
+        else:
+            interval = self.current_interval() * self.jitter_factor
+
+        return self.last_poll_start + interval
+
+    def poke(self):
+        self.consecutive_quiet_polls = 0
+        self.interval = self.base_interval
+        self.poked.set()
+        if self.on_poke is not None:
+            self.on_poke()
+
+
+class PollingPool(object):
+    """
+    Polls any number of clusters on a pool of worker threads. Each cluster keeps its
+    own PollScheduler and a dispatcher thread hands whichever polls are due to the
+    workers. A cluster is never polled twice at the same time and there's a worker
+    for every cluster, so one that's slow (or hangs) only ever holds up itself.
+    """
+
+    def __init__(self):
+        self.queue = Queue()
+        self.clusters = []
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, cluster):
+        """`cluster` needs a `scheduler` and a `poll_once()` method."""
+        cluster.scheduler.on_poke = self.wakeup.set
+
+        with self.lock:
+            self.clusters.append(cluster)
+            # Daemon threads so that quitting never waits on a hung squeue
+            threading.Thread(target=self._worker_fn, daemon=True).start()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._thread_fn, daemon=True)
+                self.thread.start()
+
+        self.wakeup.set()
+
+    def _thread_fn(self):
+        while True:
+            # Cleared before looking at the schedulers so that a poke or a finished
+            # poll that comes in while we're busy isn't lost.
+            self.wakeup.clear()
+
+            now = time.monotonic()
+            next_at = None
+            with self.lock:
+                for c in self.clusters:
+                    if c in self.in_flight:
+                        continue
+
+                    at = c.scheduler.next_poll_at()
+                    if at <= now:
+                        self.in_flight.add(c)
+                        self.queue.put(c)
+                    elif next_at is None or at < next_at:
+                        next_at = at
+
+            self.wakeup.wait(None if next_at is None else next_at - now)
+
+    def _worker_fn(self):
+        while True:
+            cluster = self.queue.get()
+            try:
+                cluster.poll_once()
+            except Exception:
+                logger.exception("Polling failed")
+            finally:
+                with self.lock:
+                    self.in_flight.discard(cluster)
+                self.wakeup.set()
@@ -0,0 +1,128 @@
+import functools
+import re
+from collections import defaultdict
+from typing import Callable, Iterable, Set
+
+__all__ = ["SEARCH_MODES", "NameIndex", "make_matcher"]
+
+SEARCH_MODES = ("substring", "regex", "fuzzy")
+
+
+@functools.lru_cache(maxsize=64)
+def make_matcher(pattern: str, mode: str = "substring") -> Callable[[str], bool]:
+    """
+    Returns a function that checks a job name against `pattern`. Matching is
+    case-insensitive unless the pattern has upper case letters in it (smart case),
+    except for fuzzy matching which always ignores case.
+    """
+    ignore_case = pattern == pattern.lower()
+
+    if mode == "substring":
+        if ignore_case:
+            return lambda name: pattern in name.lower()
+        return lambda name: pattern in name
+
+    if mode == "regex":
+        flags = re.IGNORECASE if ignore_case else 0
+        try:
+            regex = re.compile(pattern, flags)
+        except re.error:
+            # Half-typed patterns like "train(" are very common while typing
+            regex = re.compile(re.escape(pattern), flags)
+        return lambda name: regex.search(name) is not None
+
+    if mode == "fuzzy":
+        # The characters of the pattern, in order, with anything in between
+        regex = re.compile(".*?".join(map(re.escape, pattern)), re.IGNORECASE)
+        return lambda name: regex.search(name) is not None
+
+    raise ValueError(f"Unknown search mode: {mode}")
+
+
+def _trigrams(s: str) -> Set[str]:
+    return {s[i : i + 3] for i in range(len(s) - 2)}
+
+
+class NameIndex(object):
+    """
+    Maps job names to job keys and keeps an n-gram index over the distinct names:
+    every character and every trigram of a (lower-cased) name points at the names
+    containing it. A search only has to check the names that have all of the
+    pattern's trigrams (or characters, for short and fuzzy patterns) instead of
+    every job. Many jobs share a name so there are far fewer names than jobs.
+    """
+
+    def __init__(self):
+        self.keys_by_name = defaultdict(set)
+        self.names_by_gram = defaultdict(set)
+
+    def __len__(self):
+        return len(self.keys_by_name)
+
+    @staticmethod
+    def _grams(name: str) -> Set[str]:
+        lower = name.lower()
+        return set(lower) | _trigrams(lower)
+
+    def add(self, key, name: str):
+        keys = self.keys_by_name[name]
+        if not keys:
+            for g in self._grams(name):
+                self.names_by_gram[g].add(name)
+        keys.add(key)
+
+    def remove(self, key, name: str):
+        keys = self.keys_by_name.get(name)
+        if keys is None:
+            return
+
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_name[name]
+            for g in self._grams(name):
+                names = self.names_by_gram[g]
+                names.discard(name)
+                if not names:
+                    del self.names_by_gram[g]
+
+    def _names_with(self, grams: Iterable[str]) -> Set[str]:
+        sets = []
+        for g in grams:
+            names = self.names_by_gram.get(g)
+            if names is None:
+                return set()
+            sets.append(names)
+
+        sets.sort(key=len)
+        return sets[0].intersection(*sets[1:])
+
+    def search(self, pattern: str, mode: str = "substring") -> Set:
+        """Keys of all jobs whose name matches `pattern`."""
+        matcher = make_matcher(pattern, mode)
+        lower = pattern.lower()
+
+        if mode == "regex" and re.escape(pattern) == pattern:
+            # No special characters so it's just a substring
+            mode = "substring"
+
+        if mode == "substring":
+            grams = _trigrams(lower) if len(lower) >= 3 else set(lower)
+        elif mode == "fuzzy":
+            grams = set(lower)
+        else:
+            grams = set()
+
+        if grams:
+            names = self._names_with(grams)
+        else:
+            names = self.keys_by_name.keys()
+
+        # When the names were found through the pattern's own single character or
+        # trigram they match already, no need to check them again.
+        if mode == "substring" and len(lower) in (1, 3) and lower == pattern:
+            matches = names
+        else:
+            matches = filter(matcher, names)
+
+        keys_by_name = self.keys_by_name
+        return set().union(*(keys_by_name[name] for name in matches))
@@ -0,0 +1,510 @@
+import codecs
+import contextlib
+import getpass
+import http.client
+import json
+import logging
+import os
+import time
+from queue import Empty, Full, LifoQueue
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import quote, urlsplit
+
+from stui.backend import Driver, Job, JobQuery
+from stui.history import HistoryRecord
+from stui.nodes import NodeTable, parse_gres
+from stui.util import format_elapsed
+
+__all__ = ["SlurmRestDriver", "SlurmRestError", "iter_json_array"]
+
+logger = logging.getLogger("stui.slurmrestd")
+
+DEFAULT_API_VERSION = "v0.0.39"
+
+
+class SlurmRestError(Exception):
+    def __init__(self, method: str, path: str, status: int, body: str = ""):
+        self.status = status
+        super().__init__(f"{method} {path} returned {status}: {body.strip()}")
+
+
+class ConnectionPool(object):
+    """
+    A handful of keep-alive HTTP connections to slurmrestd shared by all threads.
+    A connection is checked out for the duration of one request and handed back once
+    its response has been read completely.
+    """
+
+    def __init__(self, url: str, size=4, timeout=30):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported slurmrestd URL: {url}")
+
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.connections = LifoQueue(maxsize=size)
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def _get(self) -> http.client.HTTPConnection:
+        try:
+            return self.connections.get(block=False)
+        except Empty:
+            return self._new_connection()
+
+    def _put(self, conn: http.client.HTTPConnection):
+        try:
+            self.connections.put(conn, block=False)
+        except Full:
+            conn.close()
+
+    @contextlib.contextmanager
+    def request(self, method: str, path: str, headers: Dict[str, str]):
+        conn = self._get()
+        url = self.base_path + path
+        try:
+            try:
+                conn.request(method, url, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # The server dropped an idle keep-alive connection, try a fresh one
+                conn.close()
+                conn = self._new_connection()
+                conn.request(method, url, headers=headers)
+                response = conn.getresponse()
+
+            yield response
+
+            # Whatever the caller didn't consume has to go before the connection
+            # can be reused.
+            response.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.connections.get(block=False).close()
+            except Empty:
+                break
+
+
+class _JSONStream(object):
+    """Incrementally decodes JSON values from a file-like object of bytes."""
+
+    WHITESPACE = " \t\r\n"
+
+    def __init__(self, stream, chunk_size=65536):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+
+        data = self.stream.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            self.buf += self.text_decoder.decode(b"", final=True)
+            return False
+
+        # Drop what has already been consumed so the buffer stays small
+        self.buf = self.buf[self.pos :] + self.text_decoder.decode(data)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in self.WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON document")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at {self.buf[self.pos:][:20]!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                obj, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+
+            # A number right at the end of the buffer might continue in the next
+            # chunk.
+            if end == len(self.buf) and self._fill():
+                continue
+
+            self.pos = end
+            return obj
+
+
+def iter_json_array(stream, key: str) -> Iterator[Any]:
+    """
+    Yields the elements of the array stored under `key` in the top-level JSON object
+    read from `stream`, one at a time. The other top-level values are skipped. Only
+    one element (plus a read chunk) is held in memory at any time.
+    """
+    s = _JSONStream(stream)
+
+    s.expect("{")
+    if s.peek() == "}":
+        return
+
+    while True:
+        name = s.value()
+        s.expect(":")
+
+        if name == key:
+            s.expect("[")
+            if s.peek() == "]":
+                s.pos += 1
+            else:
+                while True:
+                    yield s.value()
+                    if s.peek() == ",":
+                        s.pos += 1
+                    else:
+                        s.expect("]")
+                        break
+        else:
+            s.value()
+
+        if s.peek() == ",":
+            s.pos += 1
+        else:
+            s.expect("}")
+            return
+
+
+def _number(value) -> Optional[int]:
+    # Most integers are wrapped as {"set": true, "infinite": false, "number": 3}
+    if isinstance(value, dict):
+        if not value.get("set", True) or value.get("infinite", False):
+            return None
+        return value.get("number")
+    return value
+
+
+def job_from_json(d: Dict[str, Any], now: float) -> Job:
+    """Converts one element of slurmrestd's `jobs` array into a Job."""
+    job_id = str(d["job_id"])
+
+    state = d.get("job_state", "")
+    if isinstance(state, list):
+        state = state[0] if state else ""
+
+    array_job_id = _number(d.get("array_job_id"))
+    array_task_id = _number(d.get("array_task_id"))
+    if array_job_id:
+        job_id_base = str(array_job_id)
+        if array_task_id is not None:
+            job_id_idx = str(array_task_id)
+            job_id_combined = f"{job_id_base}_{job_id_idx}"
+        else:
+            job_id_idx = d.get("array_task_string") or ""
+            throttle = _number(d.get("array_max_tasks"))
+            if throttle:
+                job_id_idx = f"{job_id_idx}%{throttle}"
+            job_id_combined = f"{job_id_base}_[{job_id_idx}]"
+    else:
+        job_id_base = job_id
+        job_id_idx = "N/A"
+        job_id_combined = job_id
+
+    start_time = _number(d.get("start_time"))
+    if state != "PENDING" and start_time:
+        time_str = format_elapsed(now - start_time)
+    else:
+        time_str = "0:00"
+
+    cpus = _number(d.get("cpus"))
+    nice = _number(d.get("nice"))
+
+    return Job.from_values(
+        job_id,
+        job_id_combined=job_id_combined,
+        job_id_base=job_id_base,
+        job_id_idx=job_id_idx,
+        nodes_str=d.get("nodes") or "",
+        partition=d.get("partition") or "",
+        name=d.get("name") or "",
+        user=d.get("user_name") or "",
+        state=state,
+        time=time_str,
+        nice="" if nice is None else str(nice),
+        cpus="" if cpus is None else str(cpus),
+        gres=d.get("tres_per_node") or "N/A",
+    )
+
+
+def _str_list(value) -> List[str]:
+    # Lists in newer API versions, comma separated strings in older ones
+    if isinstance(value, list):
+        return [str(v) for v in value]
+    return [v for v in (value or "").split(",") if v]
+
+
+def node_table_from_json(nodes: List[Dict[str, Any]]) -> NodeTable:
+    """Converts slurmrestd's `nodes` array into a NodeTable."""
+    table = NodeTable()
+    for d in nodes:
+        state = d.get("state") or "UNKNOWN"
+        if isinstance(state, list):
+            state = "+".join(state)
+        cpus = _number(d.get("effective_cpus")) or _number(d.get("cpus")) or 0
+        features = d.get("active_features") or d.get("features")
+
+        table.append(
+            "",
+            d["name"],
+            state.upper(),
+            _number(d.get("alloc_cpus")) or 0,
+            cpus,
+            _number(d.get("alloc_memory")) or 0,
+            _number(d.get("real_memory")) or 0,
+            parse_gres(d.get("gres") or ""),
+            parse_gres(d.get("gres_used") or ""),
+            _str_list(d.get("partitions")),
+            ",".join(_str_list(features)),
+        )
+    return table
+
+
+# `scontrol show job` name -> slurmrestd's, for the details the job pane shows
+JOB_DETAIL_FIELDS = {
+    "JobId": "job_id",
+    "JobName": "name",
+    "UserId": "user_name",
+    "JobState": "job_state",
+    "Reason": "state_reason",
+    "Partition": "partition",
+    "NodeList": "nodes",
+    "NumNodes": "node_count",
+    "NumCPUs": "cpus",
+    "ReqTRES": "tres_req_str",
+    "AllocTRES": "tres_alloc_str",
+    "TimeLimit": "time_limit",
+    "SubmitTime": "submit_time",
+    "StartTime": "start_time",
+    "Dependency": "dependency",
+    "WorkDir": "current_working_directory",
+    "Command": "command",
+    "StdOut": "standard_output",
+    "StdErr": "standard_error",
+    "Comment": "comment",
+}
+
+
+def job_details_from_json(d: Dict[str, Any]) -> Dict[str, str]:
+    details = {}
+    for name, field in JOB_DETAIL_FIELDS.items():
+        value = d.get(field)
+        if isinstance(value, dict):
+            value = _number(value)
+        elif isinstance(value, list):
+            value = ",".join(str(v) for v in value)
+        if name.endswith("Time") and isinstance(value, int):
+            # Formatted like scontrol does
+            value = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(value))
+        if value is not None and value != "":
+            details[name] = str(value)
+    return details
+
+
+def _tres_str(tres: List[Dict[str, Any]]) -> str:
+    # [{"type": "gres", "name": "gpu", "count": 1}, ...] -> "gres/gpu=1", like sacct
+    items = []
+    for t in tres:
+        name = t.get("type", "")
+        if t.get("name"):
+            name += "/" + t["name"]
+        items.append(f"{name}={t.get('count', 0)}")
+    return ",".join(items)
+
+
+def history_record_from_json(d: Dict[str, Any]) -> HistoryRecord:
+    """Converts one element of slurmdbd's `jobs` array into a HistoryRecord."""
+    job_id = str(d["job_id"])
+    array = d.get("array") or {}
+    array_job_id = _number(array.get("job_id"))
+    array_task_id = _number(array.get("task_id"))
+    if array_job_id and array_task_id is not None:
+        job_id = f"{array_job_id}_{array_task_id}"
+
+    state = (d.get("state") or {}).get("current") or ""
+    if isinstance(state, list):
+        state = state[0] if state else ""
+
+    # Formatted like sacct's ExitCode, "return code:signal"
+    exit_code = d.get("exit_code") or {}
+    return_code = _number(exit_code.get("return_code")) or 0
+    signal = _number((exit_code.get("signal") or {}).get("id")) or 0
+
+    times = d.get("time") or {}
+    allocated = (d.get("tres") or {}).get("allocated") or []
+    cpus = sum(t.get("count", 0) for t in allocated if t.get("type") == "cpu")
+
+    return HistoryRecord(
+        job_id,
+        d.get("name") or "",
+        d.get("partition") or "",
+        state,
+        f"{return_code}:{signal}",
+        _number(times.get("submission")) or None,
+        _number(times.get("start")) or None,
+        _number(times.get("end")) or None,
+        _number(times.get("elapsed")) or 0,
+        cpus,
+        d.get("nodes") or "",
+        _tres_str(allocated),
+    )
+
+
+class SlurmRestDriver(Driver):
+    """
+    Talks to slurmrestd over HTTP(S) using JWT authentication. A whole poll is a single
+    GET on a pooled keep-alive connection and the (potentially huge) response is
+    parsed one job at a time as it comes in.
+
+    The user name and token default to $SLURM_USER_NAME/$USER and $SLURM_JWT, the
+    same variables `scontrol token` users already have set up.
+    """
+
+    def __init__(self, url, user=None, token=None, api_version=DEFAULT_API_VERSION):
+        self.url = url
+        self.user = user or os.environ.get("SLURM_USER_NAME") or getpass.getuser()
+        self.token = token if token is not None else os.environ.get("SLURM_JWT")
+        self.api_version = api_version
+        self.pool = ConnectionPool(url)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Accept": "application/json", "X-SLURM-USER-NAME": self.user}
+        if self.token:
+            headers["X-SLURM-USER-TOKEN"] = self.token
+        return headers
+
+    def _path(self, endpoint: str, plugin="slurm") -> str:
+        # The accounting endpoints live under /slurmdb/ instead
+        return f"/{plugin}/{self.api_version}/{endpoint}"
+
+    @contextlib.contextmanager
+    def _request(self, method: str, endpoint: str, plugin="slurm"):
+        path = self._path(endpoint, plugin)
+        with self.pool.request(method, path, self._headers()) as response:
+            if response.status != 200:
+                body = response.read().decode("utf-8", errors="replace")
+                raise SlurmRestError(method, path, response.status, body)
+            yield response
+
+    def _get_json(self, endpoint: str, plugin="slurm") -> Dict[str, Any]:
+        with self._request("GET", endpoint, plugin) as response:
+            return json.load(response)
+
+    def _iter_jobs(self) -> Iterator[Dict[str, Any]]:
+        with self._request("GET", "jobs") as response:
+            yield from iter_json_array(response, "jobs")
+
+    def connect(self, ssh_username=None, ssh_password=None):
+        try:
+            self._get_json("ping")
+        except SlurmRestError as e:
+            if e.status in (401, 403):
+                raise SystemExit(
+                    "slurmrestd rejected the credentials (is SLURM_JWT set?)"
+                )
+            raise SystemExit(str(e))
+        except OSError as e:
+            raise SystemExit(f"Could not connect to slurmrestd: {e}")
+
+    def whoami(self):
+        return self.user
+
+    def get_config(self):
+        meta = self._get_json("ping").get("meta", {})
+        cluster_name = meta.get("slurm", {}).get("cluster", "N/A")
+        return {"ClusterName": cluster_name}
+
+    def get_partition_info(self):
+        partitions = self._get_json("partitions").get("partitions", [])
+        all_p = [p["name"] for p in partitions]
+
+        # The API doesn't say which partitions the user is allowed to use, so treat
+        # all of them as the user's.
+        return list(all_p), all_p
+
+    def get_node_names(self):
+        return [n["name"] for n in self._get_json("nodes").get("nodes", [])]
+
+    def get_nodes(self):
+        return node_table_from_json(self._get_json("nodes").get("nodes", []))
+
+    def get_jobs(self, query: JobQuery = JobQuery()) -> List[Job]:
+        # The jobs endpoint has no filtering parameters so the query is ignored and
+        # everything is filtered client-side.
+        now = time.time()
+        return [job_from_json(d, now) for d in self._iter_jobs()]
+
+    def get_user_job_ids(self, user, newest_first):
+        jobs = [
+            (_number(d.get("submit_time")) or 0, str(d["job_id"]))
+            for d in self._iter_jobs()
+            if d.get("user_name") == user
+        ]
+        jobs.sort(reverse=newest_first)
+        return [job_id for _, job_id in jobs]
+
+    def get_job_details(self, job_id):
+        jobs = self._get_json(f"job/{job_id}").get("jobs", [])
+        # An array's id gets all of its tasks
+        d = next((d for d in jobs if str(d.get("job_id")) == job_id), None)
+        if d is None:
+            d = jobs[0] if jobs else {}
+        return job_details_from_json(d)
+
+    def get_job_history(self, user, since):
+        endpoint = f"jobs?users={quote(user)}&start_time={int(since)}"
+        with self._request("GET", endpoint, plugin="slurmdb") as response:
+            return [
+                history_record_from_json(d) for d in iter_json_array(response, "jobs")
+            ]
+
+    def cancel_jobs(self, job_ids):
+        errors = {}
+        for job_id in job_ids:
+            try:
+                with self._request("DELETE", f"job/{job_id}"):
+                    pass
+            except (SlurmRestError, OSError) as e:
+                logger.warning(f"Cancelling {job_id} failed: {e}")
+                errors[job_id] = e
+        return errors
+
+    def cancel_user_jobs(self, user):
+        job_ids = self.get_user_job_ids(user, newest_first=True)
+        errors = self.cancel_jobs(job_ids)
+        if errors:
+            raise next(iter(errors.values()))
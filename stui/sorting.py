@@ -0,0 +1,179 @@
+import bisect
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from stui.backend import Job
+
+__all__ = ["SortedJobs", "make_sort_key"]
+
+
+class _Descending(object):
+    """Wraps a value so that it sorts the other way around."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def _descending(value):
+    if isinstance(value, (int, float)):
+        return -value
+    if isinstance(value, tuple):
+        return tuple(_descending(v) for v in value)
+    return _Descending(value)
+
+
+def make_sort_key(
+    columns: List[Tuple[Callable[[Job], Any], bool]], order: Dict[tuple, int]
+) -> Tuple[Callable[[Job], Any], bool]:
+    """
+    Builds a sort key out of (value getter, descending) pairs, most significant
+    first. Jobs that compare equal stay in their `order` (i.e. squeue's order) which
+    also makes every job's sort key unique.
+
+    Returns the key and whether the resulting order needs to be reversed. When all
+    columns go the same way it's much cheaper to sort ascending and read the result
+    backwards than to wrap every value.
+    """
+    getters = [getter for getter, _ in columns]
+    directions = {descending for _, descending in columns}
+
+    if not getters:
+        return (lambda j: order[j.key]), False
+
+    if len(directions) == 1:
+        reverse = directions == {True}
+        # The tie-break has to go the other way too so that it comes out right
+        # after reversing.
+        sign = -1 if reverse else 1
+        if len(getters) == 1:
+            getter = getters[0]
+            return (lambda j: (getter(j), sign * order[j.key])), reverse
+        return (
+            (lambda j: (*[g(j) for g in getters], sign * order[j.key])),
+            reverse,
+        )
+
+    def mixed_key(j):
+        values = [
+            _descending(getter(j)) if descending else getter(j)
+            for getter, descending in columns
+        ]
+        return (*values, order[j.key])
+
+    return mixed_key, False
+
+
+class SortedJobs(object):
+    """
+    The jobs shown in the Jobs tab, in display order. It's sorted once when the sort
+    order or the filters change. After that, jobs that are added, removed or changed
+    are moved into place by bisection instead of sorting everything again.
+
+    Behaves like a read-only sequence of jobs for the list walker.
+    """
+
+    def __init__(self):
+        self.key_fn = lambda j: 0
+        self.reverse = False
+        # (sort key, job key, job), sorted. Job keys are unique so the jobs
+        # themselves never get compared.
+        self.entries = []  # type: List[Tuple[Any, tuple, Job]]
+        self.sort_keys = {}  # type: Dict[tuple, Any]
+
+    def reset(self, jobs: Iterable[Job], key_fn=None, reverse=None):
+        if key_fn is not None:
+            self.key_fn = key_fn
+        if reverse is not None:
+            self.reverse = reverse
+
+        jobs = list(jobs)
+        keys = [j.key for j in jobs]
+        sort_keys = list(map(self.key_fn, jobs))
+
+        self.sort_keys = dict(zip(keys, sort_keys))
+        self.entries = list(zip(sort_keys, keys, jobs))
+        self.entries.sort()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.sort_keys
+
+    def keys(self):
+        """The keys of all the jobs, in no particular order."""
+        return self.sort_keys.keys()
+
+    def _index(self, position: int) -> int:
+        if position < 0 or position >= len(self.entries):
+            raise IndexError(position)
+        return len(self.entries) - 1 - position if self.reverse else position
+
+    def key_at(self, position: int) -> tuple:
+        return self.entries[self._index(position)][1]
+
+    def __getitem__(self, position: int) -> Job:
+        return self.entries[self._index(position)][2]
+
+    def __iter__(self) -> Iterator[Job]:
+        entries = reversed(self.entries) if self.reverse else self.entries
+        return (job for _, _, job in entries)
+
+    def _find(self, key) -> Optional[int]:
+        sk = self.sort_keys.get(key)
+        if sk is None:
+            return None
+        # (sk, key) sorts right before the entry that starts with it
+        return bisect.bisect_left(self.entries, (sk, key))
+
+    def get(self, key) -> Optional[Job]:
+        i = self._find(key)
+        return None if i is None else self.entries[i][2]
+
+    def position_of(self, key) -> Optional[int]:
+        i = self._find(key)
+        if i is None:
+            return None
+        return len(self.entries) - 1 - i if self.reverse else i
+
+    def discard(self, key) -> bool:
+        i = self._find(key)
+        if i is None:
+            return False
+        del self.sort_keys[key]
+        del self.entries[i]
+        return True
+
+    def replace(self, job: Job) -> bool:
+        """
+        Swaps in a new version of `job` that's known to sort the same, without
+        working out its sort key again. Returns False if the job isn't there.
+        """
+        i = self._find(job.key)
+        if i is None:
+            return False
+        entry = self.entries[i]
+        self.entries[i] = (entry[0], entry[1], job)
+        return True
+
+    def add(self, job: Job):
+        """Adds `job` or, if it's already there, replaces it and moves it if needed."""
+        key = job.key
+        sk = self.key_fn(job)
+
+        i = self._find(key)
+        if i is not None:
+            if self.entries[i][0] == sk:
+                self.entries[i] = (sk, key, job)
+                return
+            del self.entries[i]
+
+        self.sort_keys[key] = sk
+        bisect.insort(self.entries, (sk, key, job))
@@ -1,14 +1,23 @@
 import asyncio
+import functools
 import logging
+import time
 from datetime import datetime
+from urllib.parse import urlsplit
 
 import urwid
 
 import stui.widgets as widgets
 from stui import backend
+from stui.slurmrestd import SlurmRestDriver
+from stui.trends import LEVELS, TREND_METRICS, TimeSeries, sample_utilization
+from stui.utilization import JOB_FIELDS, Utilization
 from stui.views.admin import AdminTab
-from stui.views.jobs import JobsTab
+from stui.views.history import HistoryTab
+from stui.views.jobs import JobQueueWidget, JobsTab
 from stui.views.nodes import NodesTab
+from stui.views.trends import TrendsPanel
+from stui.views.utilization import UtilizationPanel
 
 
 logger = logging.getLogger("stui")
@@ -19,11 +28,17 @@ logger_fh.setFormatter(
 )
 logger.addHandler(logger_fh)
 
-UPDATE_INTERVAL = 1
+# How long to wait after the last change to the filters (e.g. a keystroke in the
+# search box) before refreshing the job list.
+FILTER_DEBOUNCE = 0.15
+
+# How often the History tab checks whether its cache is due a sync. What the syncs
+# bring back arrives through the notifier like everything else.
+HISTORY_REFRESH_INTERVAL = 10.0
 
 
 class StuiWidget(urwid.WidgetWrap):
-    def __init__(self, cluster):
+    def __init__(self, cluster, hidden_columns=()):
 
         self.cluster = cluster
 
@@ -39,14 +54,37 @@ class StuiWidget(urwid.WidgetWrap):
         )
         header = urwid.AttrMap(header, "bold")
 
-        self.jobs_tab = JobsTab(self.cluster)
+        self.utilization = Utilization()
+        self.utilization_panel = UtilizationPanel()
+
+        self.trends = TimeSeries(TREND_METRICS)
+        # Minutes by default, enough to see the last hour
+        self.trend_level = 1
+        self.trends_panel = TrendsPanel(TREND_METRICS)
+
+        header = urwid.Pile([header, self.utilization_panel, self.trends_panel])
+
+        # Hidden columns aren't fetched, and that includes what the summary would
+        # count jobs by. It then makes do with the node table.
+        hidden_fields = {
+            f for c in hidden_columns for f in JobQueueWidget.column_fields[c]
+        }
+        extra_fields = () if hidden_fields & JOB_FIELDS else JOB_FIELDS
+        self.jobs_tab = JobsTab(self.cluster, hidden_columns, extra_fields)
         self.nodes_tab = NodesTab(self.cluster)
+        self.history_tab = HistoryTab(self.cluster)
         self.admin_tab = AdminTab(self.cluster)
 
         tabbed = widgets.Tabbed(
-            ["Jobs", "Nodes", "Admin"],
-            [self.jobs_tab.get_view(), self.nodes_tab.view, self.admin_tab.view],
+            ["Jobs", "Nodes", "History", "Admin"],
+            [
+                self.jobs_tab.get_view(),
+                self.nodes_tab.view,
+                self.history_tab.view,
+                self.admin_tab.view,
+            ],
         )
+        urwid.connect_signal(tabbed, "tab_changed", self.tab_changed)
 
         self.view = urwid.Frame(tabbed, header)
 
@@ -62,11 +100,42 @@ class StuiWidget(urwid.WidgetWrap):
         )
 
     def update_time(self):
-        time = datetime.now().strftime("%X")
-        self.header_time.set_text(time)
-
-    def refresh_jobs(self):
-        self.jobs_tab.refresh()
+        now = datetime.now().strftime("%X")
+        if now != self.header_time.text:
+            self.header_time.set_text(now)
+
+    def refresh_jobs(self) -> bool:
+        """Returns whether anything on screen had to change."""
+        return self.jobs_tab.refresh()
+
+    def update_trends(self):
+        if self.utilization.generation is None:
+            return
+
+        my_keys = [(c.name, c.me) for c in self.cluster.ready_clusters()]
+        sample = sample_utilization(self.utilization, my_keys)
+        self.trends.record(time.time(), sample)
+        self.trends_panel.update(self.trends, self.trend_level)
+
+    def cycle_trend_level(self):
+        self.trend_level = (self.trend_level + 1) % len(LEVELS)
+        if self.trends.last_sample is not None:
+            self.trends_panel.update(self.trends, self.trend_level)
+
+    def tab_changed(self, tabbed, view):
+        # The history is only fetched while somebody is looking at it
+        self.history_tab.set_active(view is self.history_tab.view)
+
+    def refresh(self) -> bool:
+        jobs_changed = self.jobs_tab.refresh()
+        nodes_changed = self.nodes_tab.refresh()
+        history_changed = self.history_tab.refresh()
+        # After the jobs tab, which sets the job queries the totals depend on
+        utilization_changed = self.utilization.refresh(self.cluster)
+        if utilization_changed:
+            multi_cluster = len(self.cluster.clusters) > 1
+            self.utilization_panel.update(self.utilization, multi_cluster)
+        return jobs_changed or nodes_changed or history_changed or utilization_changed
 
     def connecting_popup(self):
         w = urwid.Text("Connecting to Slurm instance ...")
@@ -106,7 +175,7 @@ class StuiWidget(urwid.WidgetWrap):
 
     def cluster_connected_callback(self):
         self.set_cluster_name(self.cluster.get_name())
-        self.refresh_jobs()
+        self.refresh()
         self.close_popup()
 
     def close_popup(self, *args, **kwargs):
@@ -134,45 +203,92 @@ class StuiApp(object):
         ("underline", "underline", ""),
         ("highlight", "black", "yellow", ""),
         ("highlight_out_of_focus", "black", "brown", ""),
+        ("node_state_idle", "light green", ""),
+        ("node_state_mixed", "yellow", ""),
+        ("node_state_allocated", "light cyan", ""),
+        ("node_state_down", "light red", ""),
+        ("job_state_completed", "light green", ""),
+        ("job_state_failed", "light red", ""),
     ]
 
     def __init__(self, args):
         super().__init__()
 
-        self.backend = backend.Cluster(args.ssh)
-        self.topmost_widget = StuiWidget(self.backend)
+        clusters = []
+        for url in args.slurmrestd or []:
+            driver = SlurmRestDriver(url)
+            name = urlsplit(url).hostname
+            clusters.append(
+                backend.Cluster(None, args.refresh_interval, driver, name=name)
+            )
+        for remote in args.ssh or []:
+            clusters.append(backend.Cluster(remote, args.refresh_interval))
+        if not clusters:
+            clusters.append(backend.Cluster(None, args.refresh_interval))
+
+        self.backend = backend.ClusterGroup(clusters)
+        self.topmost_widget = StuiWidget(self.backend, args.hide_columns)
 
         self.loop = urwid.MainLoop(
             self.topmost_widget,
             self.palette,
             handle_mouse=True,
-            unhandled_input=self.exit_on_q,
+            unhandled_input=self.unhandled_input,
             event_loop=urwid.AsyncioEventLoop(loop=asyncio.get_event_loop()),
             pop_ups=False,
         )
 
-        self.fd = self.loop.watch_pipe(self.cluster_connect_callback)
-        self.backend.connect(self.fd)
+        # Each cluster connects in its own thread and reports back on its own pipe
+        self.fds = {}
+        for cluster in clusters:
+            callback = functools.partial(self.cluster_connect_callback, cluster)
+            self.fds[cluster] = self.loop.watch_pipe(callback)
+            cluster.connect(self.fds[cluster])
+
+        # The backend tells us as soon as there are new jobs or nodes to show, through
+        # this pipe, so the tabs are only refreshed when there's something new.
+        self.notifier = backend.UpdateNotifier(
+            self.loop.watch_pipe(self.backend_updated)
+        )
+        self.backend.set_notifier(self.notifier)
+
+        self.clock_registered = False
 
-    def ssh_login_provided_callback(self, user, password):
+        # Filter changes are applied right away rather than on the next tick, once
+        # the user stops typing for a moment.
+        self.filter_alarm = None
+        urwid.connect_signal(
+            self.topmost_widget.jobs_tab.fpanel, "filters_changed", self.filters_changed
+        )
+        urwid.connect_signal(
+            self.topmost_widget.history_tab.fpanel,
+            "filters_changed",
+            self.filters_changed,
+        )
+
+    def ssh_login_provided_callback(self, cluster, user, password):
         self.topmost_widget.connecting_popup()
-        self.backend.connect(self.fd, user, password)
+        cluster.connect(self.fds[cluster], user, password)
 
-    def cluster_connect_callback(self, message) -> bool:
+    def cluster_connect_callback(self, cluster, message) -> bool:
         if message == b"need password" or message == b"wrong password":
 
             def exit(*args, **kwargs):
                 raise urwid.ExitMainLoop()
 
             self.topmost_widget.password_prompt_popup(
-                ok_handler=self.ssh_login_provided_callback, cancel_handler=exit
+                ok_handler=functools.partial(self.ssh_login_provided_callback, cluster),
+                cancel_handler=exit,
             )
             return True
 
         elif message == b"connection established":
-            self.fd = None  # TODO: delattr?
-            self.register_refresh()
+            del self.fds[cluster]
             self.topmost_widget.cluster_connected_callback()
+            if not self.clock_registered:
+                self.clock_registered = True
+                self.register_clock()
+                self.refresh_history()
 
             # Return False will remove the watch from the event loop and closes the
             # "read-end" of the pipe. The write-end of the pipe will be closed
@@ -195,14 +311,43 @@ class StuiApp(object):
         finally:
             self.loop.screen.write(RESTORE_NORMAL_BUFFER)
 
-    def exit_on_q(self, key):
+    def unhandled_input(self, key):
         if key in ("q", "Q"):
             raise urwid.ExitMainLoop()
-
-    def refresh_time(self, loop, user_data):
+        if key == "t":
+            self.topmost_widget.cycle_trend_level()
+
+    def backend_updated(self, data) -> bool:
+        # Acknowledged first so that anything published during the refresh wakes us
+        # up again.
+        self.notifier.acknowledge()
+        # Finished actions wake us up too, even if they didn't change any jobs (e.g.
+        # a failed cancel), and refresh() reports them.
+        self.topmost_widget.refresh()
+        return True
+
+    def tick(self, loop, user_data):
         self.topmost_widget.update_time()
+        # Sampled once a second whether or not anything changed, the time series
+        # takes care of averaging.
+        self.topmost_widget.update_trends()
+        self.register_clock()
+
+    def refresh_history(self, loop=None, user_data=None):
+        # Keeps the history up to date even when nothing else is happening
+        self.topmost_widget.history_tab.refresh()
+        self.loop.set_alarm_in(HISTORY_REFRESH_INTERVAL, self.refresh_history)
+
+    def filters_changed(self):
+        if self.filter_alarm is not None:
+            self.loop.remove_alarm(self.filter_alarm)
+        self.filter_alarm = self.loop.set_alarm_in(FILTER_DEBOUNCE, self.apply_filters)
+
+    def apply_filters(self, loop, user_data):
+        self.filter_alarm = None
         self.topmost_widget.refresh_jobs()
-        self.register_refresh()
+        self.topmost_widget.history_tab.refresh()
 
-    def register_refresh(self):
-        self.loop.set_alarm_in(UPDATE_INTERVAL, self.refresh_time)
+    def register_clock(self):
+        # Right after the next full second, when the displayed time changes
+        self.loop.set_alarm_in(1 - time.time() % 1 + 0.01, self.tick)
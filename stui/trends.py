@@ -0,0 +1,162 @@
+import math
+from array import array
+from typing import Iterable, List, Sequence, Tuple
+
+__all__ = ["LEVELS", "TREND_METRICS", "TimeSeries", "sample_utilization"]
+
+# (bucket length in seconds, number of buckets) of each resolution: 10 minutes in
+# 5 second steps, 2 hours in minutes and 2 days in hours.
+LEVELS = ((5, 120), (60, 120), (3600, 48))
+
+TREND_METRICS = ("jobs_pending", "jobs_running", "gpus_used", "my_jobs")
+
+
+class _Level(object):
+    """
+    One resolution of a TimeSeries: the average of every metric over each of the
+    last `capacity` buckets of `step` seconds, in a ring of preallocated slots.
+    """
+
+    def __init__(self, step: float, capacity: int, n_metrics: int):
+        self.step = step
+        self.capacity = capacity
+        self.n = n_metrics
+
+        # Bucket after bucket, each a row of n metrics, like UsageCounters
+        self.values = array("d", [math.nan]) * (capacity * n_metrics)
+        self.head = 0  # Where the next closed bucket goes
+        self.size = 0
+
+        # The bucket being filled: when it started, each metric integrated over the
+        # time it has covered so far and how long that is. Metrics that are NaN
+        # (unknown) for a while cover less of the bucket.
+        self.bucket_start = None
+        self.integrals = array("d", [0.0]) * n_metrics
+        self.covered = array("d", [0.0]) * n_metrics
+
+    def start(self, t: float):
+        self.bucket_start = t - t % self.step
+
+    def _close(self, sample: Sequence[float]):
+        start = self.head * self.n
+        for i in range(self.n):
+            if self.covered[i]:
+                self.values[start + i] = self.integrals[i] / self.covered[i]
+            else:
+                self.values[start + i] = sample[i]
+            self.integrals[i] = 0.0
+            self.covered[i] = 0.0
+
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        self.bucket_start += self.step
+
+    def advance(self, t0: float, t1: float, sample: Sequence[float]):
+        """Accounts for `sample` having held from t0 until t1."""
+        # After a long gap (e.g. a suspended laptop) every bucket would end up
+        # holding `sample` anyway, so skip to the last few.
+        skip_to = t1 - t1 % self.step - self.capacity * self.step
+        if self.bucket_start < skip_to:
+            self._close(sample)
+            self.bucket_start = skip_to
+            t0 = max(t0, skip_to)
+
+        while t0 < t1:
+            end = min(t1, self.bucket_start + self.step)
+            dt = end - t0
+            for i, v in enumerate(sample):
+                if not math.isnan(v):
+                    self.integrals[i] += v * dt
+                    self.covered[i] += dt
+            t0 = end
+            if end >= self.bucket_start + self.step:
+                self._close(sample)
+
+    def column(self, i: int) -> List[float]:
+        """Metric `i` of the closed buckets, oldest first."""
+        column = self.values[i :: self.n]
+        if self.size < self.capacity:
+            return list(column[: self.size])
+        return list(column[self.head :] + column[: self.head])
+
+
+class TimeSeries(object):
+    """
+    How some metrics have changed over time, at each of the resolutions in `levels`,
+    in a fixed amount of memory however long stui runs.
+
+    Samples are taken to hold until the next one comes in, so each bucket holds the
+    time-weighted average of the metrics over its time span no matter how often (or
+    how irregularly) record() is called. A metric that's NaN in a sample is unknown
+    until the next one: the buckets average over the rest of their time, and the
+    ones with nothing else are NaN too.
+    """
+
+    def __init__(
+        self,
+        metrics: Iterable[str] = TREND_METRICS,
+        levels: Sequence[Tuple[float, int]] = LEVELS,
+    ):
+        self.metrics = tuple(metrics)
+        self.levels = [_Level(step, n, len(self.metrics)) for step, n in levels]
+
+        self.last_time = None
+        self.last_sample = None
+
+    def record(self, t: float, sample: Sequence[float]):
+        if self.last_time is None:
+            for level in self.levels:
+                level.start(t)
+        elif t > self.last_time:
+            for level in self.levels:
+                level.advance(self.last_time, t, self.last_sample)
+        else:
+            # The clock went backwards, keep the old sample's time
+            t = self.last_time
+
+        self.last_time = t
+        self.last_sample = tuple(sample)
+
+    def series(self, metric: str, level=0) -> List[float]:
+        """
+        `metric` at resolution `level`, oldest first. The last value is for the
+        bucket that's still being filled.
+        """
+        if self.last_sample is None:
+            return []
+
+        i = self.metrics.index(metric)
+        lv = self.levels[level]
+        values = lv.column(i)
+        if lv.covered[i]:
+            values.append(lv.integrals[i] / lv.covered[i])
+        else:
+            values.append(self.last_sample[i])
+        return values
+
+    def latest(self, metric: str) -> float:
+        return self.last_sample[self.metrics.index(metric)]
+
+
+def sample_utilization(utilization, my_keys) -> Tuple[float, ...]:
+    """
+    TREND_METRICS out of a Utilization. `my_keys` are the (cluster, user) pairs
+    whose jobs are "my jobs". What's counted from the jobs is NaN while they're
+    filtered or incomplete, the trend would only show the filters changing.
+    """
+    gpus_used = utilization.by_cluster.total("gpus_used")
+    if utilization.partial or not utilization.jobs_known:
+        return (math.nan, math.nan, gpus_used, math.nan)
+
+    by_user = utilization.by_user
+    mine = 0
+    for key in my_keys:
+        counts = by_user.get(key)
+        mine += counts["jobs_running"] + counts["jobs_pending"]
+
+    return (
+        utilization.by_cluster.total("jobs_pending"),
+        by_user.total("jobs_running"),
+        gpus_used,
+        mine,
+    )
@@ -0,0 +1,21 @@
+from typing import Optional
+
+__all__ = ["format_elapsed", "to_int"]
+
+
+def to_int(s: Optional[str], default=0) -> int:
+    """A number from Slurm's output, `default` for anything else (e.g. "N/A")."""
+    return int(s) if s and s.isdigit() else default
+
+
+def format_elapsed(seconds: int) -> str:
+    """Formats a duration the way squeue's %M does."""
+    days, seconds = divmod(max(int(seconds), 0), 24 * 3600)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    if days:
+        return f"{days}-{hours:02}:{minutes:02}:{seconds:02}"
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
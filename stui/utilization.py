@@ -0,0 +1,265 @@
+import functools
+import operator
+from array import array
+from typing import Dict, Iterable, List, Tuple
+
+from stui.arrays import count_tasks
+from stui.backend import Job, JobDelta
+from stui.hostlist import expand_hostlist
+from stui.nodes import NodeTable, is_gpu, parse_gres
+
+__all__ = ["JOB_FIELDS", "METRICS", "UsageCounters", "Utilization"]
+
+METRICS = (
+    "cpus_used",
+    "cpus_total",
+    "gpus_used",
+    "gpus_total",
+    "cpus_pending",
+    "gpus_pending",
+    "jobs_pending",
+    "jobs_running",
+)
+_N = len(METRICS)
+_ZEROS = (0,) * _N
+
+# The Job attributes the aggregation looks at. Without them only what the node table
+# says is counted, see Utilization.jobs_known.
+JOB_FIELDS = frozenset(("cpus", "gres", "nodes_str", "partition", "user", "state"))
+
+_usage_fields = operator.attrgetter("cluster", *sorted(JOB_FIELDS), "job_id_idx")
+
+
+class UsageCounters(object):
+    """
+    A row of METRICS for every key (a partition, a user, ...) with all the rows
+    stored back to back in one flat array. Adding a contribution touches a handful
+    of slots in place and a metric over all keys is a strided slice of the array.
+    """
+
+    def __init__(self):
+        self.slots = {}  # key -> row
+        self.keys = []
+        self.values = array("q")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _start(self, key) -> int:
+        row = self.slots.get(key)
+        if row is None:
+            row = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.values.extend(_ZEROS)
+        return row * _N
+
+    def add(self, key, contribution: Tuple[int, ...], sign=1):
+        start = self._start(key)
+        values = self.values
+        for i, n in enumerate(contribution):
+            if n:
+                values[start + i] += sign * n
+
+    def get(self, key) -> Dict[str, int]:
+        row = self.slots.get(key)
+        if row is None:
+            return dict(zip(METRICS, _ZEROS))
+        return dict(zip(METRICS, self.values[row * _N : (row + 1) * _N]))
+
+    def column(self, metric: str) -> array:
+        """`metric` of every key, in the order of self.keys."""
+        return self.values[METRICS.index(metric) :: _N]
+
+    def total(self, metric: str) -> int:
+        return sum(self.column(metric))
+
+    def top(self, metric: str, n: int) -> List[Tuple[tuple, int]]:
+        """The `n` keys with the highest non-zero `metric`."""
+        counts = [(v, k) for k, v in zip(self.keys, self.column(metric)) if v > 0]
+        counts.sort(reverse=True)
+        return [(k, v) for v, k in counts[:n]]
+
+
+@functools.lru_cache(maxsize=1024)
+def job_gpus(gres: str) -> Tuple[Tuple[str, int], ...]:
+    """GPUs per node by type from squeue's %b, e.g. "gres:gpu:a100:2"."""
+    gres = gres.replace("gres:", "").replace("gres/", "")
+    return tuple((name, n) for name, n in parse_gres(gres) if is_gpu(name))
+
+
+def job_usage(job: Job):
+    """
+    What `job` adds to the counters, as a row of METRICS and the GPUs it adds by
+    type. None if it neither holds nor waits for resources.
+    """
+    running = job.is_running()
+    if not running and not job.is_pending():
+        return None
+
+    cpus = int(job.cpus) if job.cpus.isdigit() else 0
+    gpus = job_gpus(job.gres)
+
+    if running:
+        nodes = len(expand_hostlist(job.nodes_str)) if gpus else 1
+        n_gpus = sum(n for _, n in gpus) * nodes
+        return (cpus, 0, n_gpus, 0, 0, 0, 0, 1), ()
+
+    # A pending array row stands for all of its pending tasks. Pending jobs don't
+    # have nodes yet so the GPUs are per node of the first (usually only) one.
+    tasks = count_tasks(job)
+    n_gpus = sum(n for _, n in gpus) * tasks
+    by_type = tuple((t, (0, 0, 0, 0, 0, n * tasks, 0, 0)) for t, n in gpus)
+    return (0, 0, 0, 0, cpus * tasks, n_gpus, tasks, 0), by_type
+
+
+class Utilization(object):
+    """
+    How much of each cluster is in use and how much is waiting, per cluster,
+    partition, user and GPU type.
+
+    CPUs and GPUs in use and in total come from the node table and are attributed
+    to partitions the way sinfo does it: a node counts towards every partition it's
+    in. Users only get what their running jobs use, and running jobs are only counted
+    per user. Pending demand comes from the pending jobs, and a job submitted to
+    several partitions counts in all of them.
+
+    Everything is kept up to date from the differences between polls: the jobs'
+    JobDeltas (only changes to the fields above matter, not the ever-changing
+    elapsed times) and the node rows that have changed.
+    """
+
+    def __init__(self):
+        self.by_cluster = UsageCounters()
+        self.by_partition = UsageCounters()  # (cluster, partition) -> row
+        self.by_user = UsageCounters()  # (cluster, user) -> row
+        self.by_gpu_type = UsageCounters()  # (cluster, "gpu[:type]") -> row
+
+        self.nodes = NodeTable()
+        self.generation = None
+        # Whether the job queries are restricted by the filters, in which case
+        # pending demand and the per user counts only cover the jobs fetched.
+        self.partial = False
+        # Whether the jobs come with all of JOB_FIELDS. Hidden columns aren't
+        # fetched, and the jobs aren't counted at all without them.
+        self.jobs_known = True
+
+    def _add_job(self, job: Job, sign: int):
+        if not self.jobs_known:
+            return
+        usage = job_usage(job)
+        if usage is None:
+            return
+        row, gpus_by_type = usage
+        cluster = job.cluster
+
+        self.by_user.add((cluster, job.user), row, sign)
+        if job.is_pending():
+            self.by_cluster.add(cluster, row, sign)
+            for partition in job.partition.split(","):
+                self.by_partition.add((cluster, partition), row, sign)
+            for gpu_type, gpu_row in gpus_by_type:
+                self.by_gpu_type.add((cluster, gpu_type), gpu_row, sign)
+
+    def _add_node(self, nodes: NodeTable, i: int, sign: int):
+        cluster = nodes.clusters[i]
+        row = (
+            nodes.cpus_alloc[i],
+            nodes.cpus_total[i],
+            nodes.gpus_alloc[i],
+            nodes.gpus_total[i],
+            0,
+            0,
+            0,
+            0,
+        )
+        self.by_cluster.add(cluster, row, sign)
+        for partition in nodes.partitions[i]:
+            self.by_partition.add((cluster, partition), row, sign)
+
+        used = dict(nodes.gres_used[i])
+        for name, count in nodes.gres[i]:
+            if is_gpu(name):
+                gpu_row = (0, 0, used.get(name, 0), count, 0, 0, 0, 0)
+                self.by_gpu_type.add((cluster, name), gpu_row, sign)
+
+    def rebuild(self, jobs: Iterable[Job], nodes: NodeTable):
+        self.by_cluster = UsageCounters()
+        self.by_partition = UsageCounters()
+        self.by_user = UsageCounters()
+        self.by_gpu_type = UsageCounters()
+
+        self.nodes = nodes
+        for i in range(len(nodes)):
+            self._add_node(nodes, i, 1)
+        for job in jobs:
+            self._add_job(job, 1)
+
+    def apply_job_delta(self, delta: JobDelta):
+        for before, after in delta.pairs():
+            if (
+                before is not None
+                and after is not None
+                and _usage_fields(before) == _usage_fields(after)
+            ):
+                continue
+            if before is not None:
+                self._add_job(before, -1)
+            if after is not None:
+                self._add_job(after, 1)
+
+    def apply_nodes(self, nodes: NodeTable):
+        gone, new = nodes.changes_since(self.nodes)
+        for i in gone:
+            self._add_node(self.nodes, i, -1)
+        for i in new:
+            self._add_node(nodes, i, 1)
+        self.nodes = nodes
+
+    def refresh(self, cluster) -> bool:
+        """
+        Catches up with `cluster` (a ClusterGroup). Returns whether anything has
+        changed.
+        """
+        changed = False
+        nodes = cluster.get_nodes()
+
+        queries = cluster.job_queries().values()
+        partial = any(
+            q.users is not None
+            or q.states is not None
+            or q.partitions is not None
+            or q.nodes is not None
+            for q in queries
+        )
+        if partial != self.partial:
+            self.partial = partial
+            changed = True
+        jobs_known = all(q.fields is None or JOB_FIELDS <= q.fields for q in queries)
+        if jobs_known != self.jobs_known:
+            # What's been counted so far was counted the other way
+            self.jobs_known = jobs_known
+            self.generation = None
+
+        if cluster.has_changed(self.generation):
+            deltas = None
+            if self.generation is not None:
+                deltas = cluster.get_job_deltas(self.generation)
+
+            if deltas is None:
+                snapshot = cluster.get_snapshot()
+                self.generation = snapshot.generation
+                self.rebuild(snapshot.jobs, nodes)
+            else:
+                self.generation, delta = deltas
+                self.apply_job_delta(delta)
+            changed = True
+
+        if nodes is not self.nodes:
+            self.apply_nodes(nodes)
+            changed = True
+
+        return changed
+
+    def totals(self) -> Dict[str, int]:
+        """METRICS summed over all the clusters."""
+        return {m: self.by_cluster.total(m) for m in METRICS}
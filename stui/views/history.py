@@ -0,0 +1,349 @@
+import functools
+import sqlite3
+import time
+import urwid
+from collections import OrderedDict
+
+import stui.widgets as widgets
+from stui.history import HistoryQuery
+from stui.util import format_elapsed
+
+# What the state filter offers and the sacct states each choice stands for
+STATE_CHOICES = OrderedDict(
+    [
+        ("Completed", ("COMPLETED",)),
+        ("Failed", ("FAILED", "NODE_FAIL", "BOOT_FAIL", "OUT_OF_MEMORY")),
+        ("Timeout", ("TIMEOUT", "DEADLINE")),
+        ("Cancelled", ("CANCELLED", "PREEMPTED", "REVOKED")),
+    ]
+)
+
+# "Ended in the last ..." choices, in seconds. None is everything in the cache.
+PERIODS = OrderedDict(
+    [
+        ("Day", 24 * 3600),
+        ("Week", 7 * 24 * 3600),
+        ("Month", 30 * 24 * 3600),
+        ("All", None),
+    ]
+)
+
+
+def _state_attr(state):
+    if state == "COMPLETED":
+        return "job_state_completed"
+    if state in ("CANCELLED", "PREEMPTED", "REVOKED"):
+        return "dark_gray"
+    return "job_state_failed"
+
+
+def _time(t):
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(t)) if t else ""
+
+
+class HistoryWidget(widgets.RowWidget):
+    def __init__(self, column_keys):
+        columns = OrderedDict((k, urwid.Text("", wrap="ellipsis")) for k in column_keys)
+        columns["state"] = urwid.AttrMap(columns["state"], None)
+
+        super().__init__(
+            columns,
+            column_keys,
+            HistoryQueueWidget.column_widths,
+            focus_map={
+                None: "highlight",
+                "job_state_completed": "highlight",
+                "job_state_failed": "highlight",
+                "dark_gray": "highlight",
+            },
+        )
+
+    def update_values(self, row):
+        cluster, record = row
+
+        self._set_text("cluster", cluster)
+        self._set_text("job_id", record.job_id)
+        self._set_text("name", record.name)
+        self._set_text("partition", record.partition)
+        self._set_text("state", record.state.title())
+        self._set_text("exit_code", record.exit_code)
+        self._set_text("cpus", str(record.cpus))
+        self._set_text("end_time", _time(record.end_time))
+        self._set_text("elapsed", format_elapsed(record.elapsed))
+        self._set_text("node_list", record.node_list)
+
+        self._set_attr("state", _state_attr(record.state))
+
+
+class HistoryListWalker(widgets.CachedListWalker):
+    """
+    Reads the history a page at a time as the ListBox scrolls through it, so only
+    the rows around what's on screen are ever in memory. The last few pages are
+    kept around for scrolling back and forth.
+    """
+
+    def __init__(self, make_widget, page_size=200, cache_pages=8, cache_size=256):
+        super().__init__(make_widget, cache_size)
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+
+        self.length = 0
+        # (offset, limit) -> [(cluster, HistoryRecord), ...]
+        self.fetch_page = None
+        self.pages = OrderedDict()
+
+    def set_source(self, length, fetch_page, focus=0):
+        self.length = length
+        self.fetch_page = fetch_page
+        self.pages.clear()
+        self.set_focus(min(focus, max(length - 1, 0)))
+
+    def row_at(self, position):
+        number, i = divmod(position, self.page_size)
+        page = self.pages.get(number)
+        if page is None:
+            page = self.fetch_page(number * self.page_size, self.page_size)
+            self.pages[number] = page
+            if len(self.pages) > self.cache_pages:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(number)
+        # Jobs past their retention period can disappear under us
+        return page[i] if i < len(page) else None
+
+    def get_focus_row(self):
+        if self.focus < self.length:
+            return self.row_at(self.focus)
+        return None
+
+    def row_count(self):
+        return self.length
+
+    def get_row(self, position):
+        row = self.row_at(position)
+        if row is None:
+            return None
+        return (row[0], row[1].job_id), row
+
+
+class HistoryQueueWidget(urwid.WidgetWrap):
+
+    column_labels = OrderedDict(
+        [
+            ("cluster", "Cluster"),
+            ("job_id", "Job ID"),
+            ("name", "Name"),
+            ("partition", "Partition"),
+            ("state", "State"),
+            ("exit_code", "Exit"),
+            ("cpus", "CPUs"),
+            ("end_time", "Ended"),
+            ("elapsed", "Elapsed"),
+            ("node_list", "Nodes"),
+        ]
+    )
+
+    column_widths = {
+        "cluster": ("weight", 1),
+        "job_id": ("weight", 1),
+        "name": ("weight", 2),
+        "partition": ("weight", 1),
+        "state": (14,),
+        "exit_code": (6,),
+        "cpus": (6,),
+        "end_time": (17,),
+        "elapsed": (12,),
+        "node_list": ("weight", 1),
+    }
+
+    def __init__(self, show_cluster=False):
+
+        self.visible_columns = [
+            k for k in self.column_labels if show_cluster or k != "cluster"
+        ]
+
+        header_w = urwid.Columns(
+            [
+                (
+                    *self.column_widths[k],
+                    urwid.Padding(urwid.Text(self.column_labels[k], wrap="ellipsis")),
+                )
+                for k in self.visible_columns
+            ]
+        )
+
+        self.walker = HistoryListWalker(self.new_history_widget)
+        w = widgets.FancyListBox(self.walker)
+        w = urwid.Frame(w, header_w)
+
+        super().__init__(w)
+
+    def new_history_widget(self):
+        return HistoryWidget(self.visible_columns)
+
+
+class HistoryFilterWidget(urwid.WidgetWrap):
+
+    signals = ["filters_changed"]
+
+    def __init__(self):
+
+        self.filter_text = urwid.Edit()
+        self.filter_partition = urwid.Edit()
+        self.filter_states = OrderedDict(
+            (label, widgets.FancyCheckBox(label)) for label in STATE_CHOICES
+        )
+        self.periods = []
+        self.period_buttons = OrderedDict(
+            (label, urwid.RadioButton(self.periods, label, state=label == "All"))
+            for label in PERIODS
+        )
+
+        for w in [
+            self.filter_text,
+            self.filter_partition,
+            *self.filter_states.values(),
+            *self.period_buttons.values(),
+        ]:
+            urwid.connect_signal(w, "postchange", self._filters_changed)
+
+        w = urwid.Pile(
+            [
+                urwid.Divider(),
+                urwid.Text("Job Name or ID:"),
+                urwid.LineBox(self.filter_text),
+                urwid.Divider(),
+                *self.filter_states.values(),
+                urwid.Divider(),
+                urwid.Text("Partition:"),
+                urwid.LineBox(self.filter_partition),
+                urwid.Divider(),
+                urwid.Text("Ended in the last:"),
+                urwid.Columns(
+                    [("pack", b) for b in self.period_buttons.values()],
+                    dividechars=1,
+                ),
+                urwid.Divider(),
+            ]
+        )
+        w = widgets.FancyLineBox(w, "Filter")
+        w = urwid.Filler(w, valign="top")
+
+        super().__init__(w)
+
+    def _filters_changed(self, *args):
+        urwid.emit_signal(self, "filters_changed")
+
+    def get_query(self) -> HistoryQuery:
+        states = [
+            s
+            for label, w in self.filter_states.items()
+            if w.get_state()
+            for s in STATE_CHOICES[label]
+        ]
+        partitions = [
+            p.strip() for p in self.filter_partition.get_edit_text().split(",")
+        ]
+        partitions = [p for p in partitions if p]
+
+        period = next(
+            PERIODS[label] for label, b in self.period_buttons.items() if b.state
+        )
+        ended_after = None
+        if period is not None:
+            # To the minute so that the query doesn't change on every refresh
+            ended_after = int(time.time()) // 60 * 60 - period
+
+        return HistoryQuery(
+            text=self.filter_text.get_edit_text().strip(),
+            states=tuple(states) or None,
+            partitions=tuple(partitions) or None,
+            ended_after=ended_after,
+        )
+
+
+class HistoryTab(object):
+    """
+    Finished jobs from sacct, read from the cache kept by ClusterGroup. Nothing is
+    fetched until the tab is first looked at, and only while it's on screen.
+    """
+
+    def __init__(self, cluster):
+        super().__init__()
+
+        self.cluster = cluster
+        self.cache = cluster.finished_jobs
+        self.active = False
+        # What the list was last read for, see refresh()
+        self.source = None
+        self.count = 0
+        self.error = None
+
+        self.summary = urwid.Text("")
+        self.qpanel = HistoryQueueWidget(show_cluster=len(cluster.clusters) > 1)
+        self.fpanel = HistoryFilterWidget()
+
+        w = urwid.Frame(self.qpanel, urwid.Pile([self.summary, urwid.Divider()]))
+        w = widgets.FancyLineBox(w, "History")
+        self.view = urwid.Columns(
+            [("weight", 80, w), ("weight", 20, self.fpanel)], dividechars=1
+        )
+
+    def set_active(self, active):
+        self.active = active
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Returns whether anything on screen had to change."""
+        if not self.active:
+            return False
+
+        keys = self.cluster.history_keys()
+        self.cache.sync(keys)
+
+        query = self.fpanel.get_query()
+        source = (tuple(keys), query, self.cache.generation)
+        changed = False
+        if source != self.source:
+            self.source = source
+            try:
+                self.read_history(keys, query)
+                self.error = None
+            except sqlite3.Error as e:
+                self.error = e
+            changed = True
+
+        text = self.summary_text(keys)
+        if text != self.summary.text:
+            self.summary.set_text(text)
+            changed = True
+        return changed
+
+    def read_history(self, keys, query):
+        walker = self.qpanel.walker
+        focus = 0
+        focus_row = walker.get_focus_row() if walker.fetch_page else None
+        if focus_row is not None:
+            # Stay on the same job, newer ones may have been added above it
+            focus = self.cache.position(keys, query, *focus_row)
+
+        self.count = self.cache.count(keys, query)
+        fetch_page = functools.partial(self.cache.page, keys, query)
+        walker.set_source(self.count, fetch_page, focus)
+
+    def summary_text(self, keys) -> str:
+        if not keys:
+            return "Waiting for the clusters to connect ..."
+        if self.error is not None:
+            return f"Couldn't read the history cache: {self.error}"
+
+        text = f"{self.count} finished jobs"
+        if self.cache.is_syncing(keys):
+            text += ", fetching the latest from sacct ..."
+
+        for cluster, user in keys:
+            e = self.cache.errors.get((cluster, user))
+            if e is not None:
+                text += f"  Couldn't fetch the history of {cluster}: "
+                text += str(e) or type(e).__name__
+        return text
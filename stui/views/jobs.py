@@ -2,9 +2,15 @@ import urwid
 from collections import OrderedDict
 
 import stui.widgets as widgets
+from stui.arrays import ArrayGroup, ArrayGroupRow, GroupedRows, group_key, row_sort_key
+from stui.backend import JobQuery
+from stui.filters import JobFilter, JobIndex
+from stui.search import SEARCH_MODES
+from stui.sorting import SortedJobs, make_sort_key
+from stui.util import format_elapsed, to_int
 
 
-class JobWidget(urwid.WidgetWrap):
+class JobWidget(widgets.RowWidget):
 
     STATE_ATTR_MAPPING = {
         "BOOT FAIL": {None: ""},
@@ -33,50 +39,74 @@ class JobWidget(urwid.WidgetWrap):
         "TIMEOUT": {None: ""},
     }
 
-    def __init__(self, job):
+    def __init__(self, column_keys=None):
 
-        self.columns = OrderedDict()
-        self.columns["selected"] = urwid.Text("", wrap="ellipsis")
-        self.columns["job_id"] = urwid.Text("", wrap="ellipsis")
-        self.columns["array"] = urwid.Text("", wrap="ellipsis")
-        self.columns["user"] = urwid.Text("", wrap="ellipsis")
-        self.columns["name"] = urwid.Text("", wrap="ellipsis")
-        self.columns["state"] = urwid.AttrMap(urwid.Text("", wrap="ellipsis"), None)
-        self.columns["partition"] = urwid.Text("", wrap="ellipsis")
-        self.columns["nodes"] = urwid.Text("", wrap="ellipsis")
-        self.columns["cpus"] = urwid.Text("", wrap="ellipsis")
-        self.columns["gres"] = urwid.Text("", wrap="ellipsis")
-        self.columns["time"] = urwid.Text("", wrap="ellipsis")
+        if column_keys is None:
+            column_keys = JobQueueWidget.column_labels.keys()
 
-        self.update_values(job)
+        columns = OrderedDict()
+        columns["selected"] = urwid.Text("", wrap="ellipsis")
+        columns["cluster"] = urwid.Text("", wrap="ellipsis")
+        columns["job_id"] = urwid.Text("", wrap="ellipsis")
+        columns["array"] = urwid.Text("", wrap="ellipsis")
+        columns["user"] = urwid.Text("", wrap="ellipsis")
+        columns["name"] = urwid.Text("", wrap="ellipsis")
+        columns["state"] = urwid.AttrMap(urwid.Text("", wrap="ellipsis"), None)
+        columns["partition"] = urwid.Text("", wrap="ellipsis")
+        columns["nodes"] = urwid.Text("", wrap="ellipsis")
+        columns["cpus"] = urwid.Text("", wrap="ellipsis")
+        columns["gres"] = urwid.Text("", wrap="ellipsis")
+        columns["time"] = urwid.Text("", wrap="ellipsis")
 
-        w = widgets.SelectableColumns(
-            [
-                (*weight, urwid.Padding(c))
-                for weight, c in zip(
-                    JobQueueWidget.column_widths, self.columns.values()
-                )
-            ]
-        )
-        w = urwid.AttrMap(w, None)  # Details be handled by the JobQueueWidget
+        self.state = None
 
-        self.selected = False
-
-        super().__init__(w)
+        # The focus map is set by JobQueueWidget, see set_selected_attr()
+        super().__init__(columns, column_keys, JobQueueWidget.column_widths)
 
     def update_values(self, job):
-        self.columns["job_id"].set_text(job.job_id)
-        self.columns["array"].set_text(job.array_str())
-        self.columns["user"].set_text(job.user)
-        self.columns["name"].set_text(job.name)
-        self.columns["state"]._original_widget.set_text(job.state.title())
-        self.columns["partition"].set_text(job.partition)
-        self.columns["nodes"].set_text(job.nodes)
-        self.columns["cpus"].set_text(job.cpus)
-        self.columns["gres"].set_text(job.gres)
-        self.columns["time"].set_text(job.time)
-
-        self.columns["state"].set_attr_map(self.STATE_ATTR_MAPPING[job.state])
+        if job.__class__ is ArrayGroupRow:
+            self.update_group_values(job)
+            return
+
+        self._set_text("cluster", job.cluster or "")
+        self._set_text("job_id", job.job_id)
+        self._set_text("array", job.array_str())
+        self._set_text("user", job.user)
+        self._set_text("name", job.name)
+        self._set_text("partition", job.partition)
+        self._set_text("nodes", job.nodes_str)
+        self._set_text("cpus", job.cpus)
+        self._set_text("gres", job.gres)
+        self._set_text("time", job.time)
+
+        if job.state != self.state:
+            self.state = job.state
+            self._set_text("state", job.state.title())
+            self.columns["state"].set_attr_map(self.STATE_ATTR_MAPPING[job.state])
+
+    def update_group_values(self, row):
+        job = row.job
+        arrow = "▾" if row.expanded else "▸"
+        self._set_text("cluster", job.cluster or "")
+        self._set_text("job_id", f"{arrow} {job.job_id_base}")
+        self._set_text("array", row.array_str())
+        self._set_text("user", job.user)
+        self._set_text("name", job.name)
+        self._set_text("partition", job.partition)
+        self._set_text("nodes", "")
+        self._set_text("cpus", "")
+        self._set_text("gres", job.gres)
+
+        min_time, max_time = (format_elapsed(t) for t in (row.min_time, row.max_time))
+        if min_time == max_time:
+            self._set_text("time", max_time)
+        else:
+            self._set_text("time", f"{min_time}-{max_time}")
+
+        # Not a real state, so the next job shown here has to set it again
+        self.state = None
+        self._set_text("state", row.state_str())
+        self.columns["state"].set_attr_map({None: ""})
 
     def set_selected_attr(self, in_focus):
         if in_focus:
@@ -93,82 +123,299 @@ class JobWidget(urwid.WidgetWrap):
             }
         )
 
-    def keypress(self, size, key):
-        if key == " ":
-            self.toggle_select()
+    def set_selected(self, selected):
+        self._set_text("selected", "✘" if selected else "")
+
+
+class JobListWalker(widgets.CachedListWalker):
+    """
+    Hands out JobWidgets for a list of jobs on demand, cached by job key. Job objects
+    (and group rows) are replaced whenever anything about them changes so widgets
+    only need updating when they're handed a different object.
+
+    The selection is a set of job keys that belongs to JobsTab, so it doesn't care
+    about widgets coming and going.
+
+    The rows are jobs and array group rows, in a sequence like arrays.GroupedRows
+    which the owner updates in place before calling set_jobs() again.
+    """
+
+    def __init__(self, make_widget, cache_size=256):
+        super().__init__(make_widget, cache_size)
+
+        self.jobs = GroupedRows(SortedJobs(), {}, set())
+        self.selected = set()
+        # The job in focus, remembered separately as self.jobs may have changed
+        # under us by the time set_jobs() is called.
+        self.focus_key = None
+        self.focus_changed_callback = None
+
+    def set_jobs(self, jobs):
+        self.jobs = jobs
+
+        # Stay on the same job if it's still there, wherever it has been sorted to
+        focus = self.focus
+        if self.focus_key is not None:
+            position = jobs.position_of(self.focus_key)
+            if position is None:
+                focus = min(focus, max(len(jobs) - 1, 0))
+            else:
+                focus = position
+
+        if focus != self.focus:
+            self.set_focus(focus)
         else:
-            return super().keypress(size, key)
+            self.focus_key = self.get_focus_key()
+            self._modified()
 
-    def toggle_select(self):
-        if not self.selected:
-            self.columns["selected"].set_text("✘")
+    def get_focus_key(self):
+        if self.focus < len(self.jobs):
+            return self.jobs.key_at(self.focus)
+        return None
+
+    def get_focus_job(self):
+        if self.focus < len(self.jobs):
+            return self.jobs[self.focus]
+        return None
+
+    def set_selection(self, selected):
+        self.selected = selected
+        self._modified()
+
+    def toggle_selected(self, position):
+        row = self.jobs[position]
+        if row.__class__ is ArrayGroupRow:
+            # The whole group
+            keys = row.job_keys()
+            if self.selected.isdisjoint(keys):
+                self.selected.update(keys)
+            else:
+                self.selected.difference_update(keys)
+        elif row.key in self.selected:
+            self.selected.remove(row.key)
         else:
-            self.columns["selected"].set_text("")
-        self.selected = not self.selected
+            self.selected.add(row.key)
+        self._modified()
 
-    def is_selected(self):
-        return self.selected
+    def _is_selected(self, row):
+        if row.__class__ is ArrayGroupRow:
+            # Marked if any of its elements are, which is cheap to check
+            return not self.selected.isdisjoint(row.job_keys())
+        return row.key in self.selected
 
+    def row_count(self):
+        return len(self.jobs)
 
-class JobQueueWidget(urwid.WidgetWrap):
+    def get_row(self, position):
+        job = self.jobs[position]
+        return job.key, job
 
-    signals = ["focus_changed"]
-
-    column_widths = [
-        (2,),
-        (10,),
-        (10,),
-        ("weight", 1),
-        ("weight", 2),
-        (14,),
-        ("weight", 1),
-        ("weight", 1),
-        (6,),
-        ("weight", 1),
-        (11,),
-    ]
+    def __getitem__(self, position):
+        widget = super().__getitem__(position)
+        widget.set_selected(self._is_selected(self.jobs[position]))
+        return widget
+
+    def set_focus(self, position):
+        self.focus = position
+        self.focus_key = self.get_focus_key()
+        super().set_focus(position)
+        if self.focus_changed_callback is not None:
+            self.focus_changed_callback(position)
 
-    def __init__(self):
 
-        column_labels = [
-            "",
-            "Job ID",
-            "Job Array",
-            "User",
-            "Name",
-            "State",
-            "Partition",
-            "Node(s)",
-            "CPUs",
-            "GRES",
-            "Time",
+class JobQueueWidget(urwid.WidgetWrap):
+
+    signals = ["focus_changed", "sort_changed", "selection_changed", "group_toggled"]
+
+    column_labels = OrderedDict(
+        [
+            ("selected", ""),
+            ("cluster", "Cluster"),
+            ("job_id", "Job ID"),
+            ("array", "Job Array"),
+            ("user", "User"),
+            ("name", "Name"),
+            ("state", "State"),
+            ("partition", "Partition"),
+            ("nodes", "Node(s)"),
+            ("cpus", "CPUs"),
+            ("gres", "GRES"),
+            ("time", "Time"),
         ]
+    )
+
+    column_widths = {
+        "selected": (2,),
+        "cluster": ("weight", 1),
+        "job_id": (10,),
+        "array": (10,),
+        "user": ("weight", 1),
+        "name": ("weight", 2),
+        "state": (14,),
+        "partition": ("weight", 1),
+        "nodes": ("weight", 1),
+        "cpus": (6,),
+        "gres": ("weight", 1),
+        "time": (11,),
+    }
+
+    # Job attributes displayed by each column. Only these get fetched from Slurm.
+    column_fields = {
+        "selected": (),
+        "cluster": (),
+        "job_id": (),
+        "array": (),
+        "user": ("user",),
+        "name": ("name",),
+        "state": ("state",),
+        "partition": ("partition",),
+        "nodes": ("nodes_str",),
+        "cpus": ("cpus",),
+        "gres": ("gres",),
+        "time": ("time",),
+    }
+
+    # What each column is sorted by. Numbers are sorted as numbers.
+    column_sort_keys = {
+        "cluster": lambda j: j.cluster or "",
+        "job_id": lambda j: (to_int(j.job_id_base), to_int(j.job_id_idx, -1)),
+        "array": lambda j: j.array_str(),
+        "user": lambda j: j.user,
+        "name": lambda j: j.name,
+        "state": lambda j: j.state,
+        "partition": lambda j: j.partition,
+        "nodes": lambda j: j.nodes_str,
+        "cpus": lambda j: to_int(j.cpus, -1),
+        "gres": lambda j: j.gres,
+        "time": lambda j: j.elapsed_seconds(),
+    }
 
-        header_w = [
-            (*weight, urwid.Padding(urwid.Text(c, wrap="ellipsis")),)
-            for c, weight in zip(column_labels, self.column_widths)
+    hideable_columns = (
+        "cluster",
+        "array",
+        "user",
+        "name",
+        "partition",
+        "nodes",
+        "cpus",
+        "gres",
+        "time",
+    )
+
+    def __init__(self, hidden_columns=()):
+
+        self.visible_columns = [
+            k for k in self.column_labels if k not in hidden_columns
         ]
-        header_w = urwid.Columns(header_w)
 
-        self.walker = urwid.SimpleFocusListWalker([])
+        # (column, descending) pairs, most significant first. Empty means squeue's
+        # order.
+        self.sort_columns = []
+
+        self.header_labels = OrderedDict()
+        for k in self.visible_columns:
+            w = widgets.ClickableText(self.column_labels[k], wrap="ellipsis")
+            if k in self.column_sort_keys:
+                urwid.connect_signal(w, "click", self._header_clicked, user_args=[k])
+            self.header_labels[k] = w
+
+        header_w = urwid.Columns(
+            [
+                (*self.column_widths[k], urwid.Padding(self.header_labels[k]))
+                for k in self.visible_columns
+            ]
+        )
+
+        self.walker = JobListWalker(self.new_job_widget)
         w = widgets.FancyListBox(self.walker)
         w = urwid.Frame(w, header_w)
         w = widgets.FancyLineBox(w, "Queue")
 
-        self.walker.set_focus_changed_callback(self._focus_changed)
+        self.walker.focus_changed_callback = self._focus_changed
 
         super().__init__(w)
 
-    def update_job_widgets(self, job_widgets):
-        self.walker[:] = job_widgets
+    def new_job_widget(self):
+        return JobWidget(self.visible_columns)
 
-    def get_focused_job_idx(self):
-        _, job_idx = self.walker.get_focus()
-        return job_idx
+    def set_jobs(self, jobs):
+        self.walker.set_jobs(jobs)
 
-    def get_selected_job_idices(self):
-        indices = [idx for idx, w in enumerate(self.walker) if w.is_selected()]
-        return indices
+    def get_focused_job(self):
+        return self.walker.get_focus_job()
+
+    def set_selection(self, selected):
+        """Shows `selected`, a set of job keys, as selected. Call again on changes."""
+        self.walker.set_selection(selected)
+
+    def get_sort_key_getters(self):
+        return [(self.column_sort_keys[k], desc) for k, desc in self.sort_columns]
+
+    def sort_by(self, column, add=False):
+        """
+        Makes `column` the one to sort by or, with `add`, an extra one after those
+        already sorted by. Picking a column that's already sorted by reverses it.
+        """
+        columns = OrderedDict(self.sort_columns)
+        if add:
+            columns[column] = not columns[column] if column in columns else False
+        elif list(columns) == [column]:
+            columns[column] = not columns[column]
+        else:
+            columns = OrderedDict([(column, False)])
+
+        self.set_sort_columns(list(columns.items()))
+
+    def set_sort_columns(self, sort_columns):
+        self.sort_columns = sort_columns
+
+        numbered = len(sort_columns) > 1
+        positions = {k: (i, desc) for i, (k, desc) in enumerate(sort_columns)}
+        for k, w in self.header_labels.items():
+            label = self.column_labels[k]
+            if k in positions:
+                i, desc = positions[k]
+                label += " ▼" if desc else " ▲"
+                if numbered:
+                    label += str(i + 1)
+            w.set_text(label)
+
+        urwid.emit_signal(self, "sort_changed")
+
+    def _header_clicked(self, column, w, button):
+        # Left click sorts by the column alone, right click adds it to the others
+        self.sort_by(column, add=button == 3)
+
+    def _cycle_sort_column(self):
+        columns = [k for k in self.visible_columns if k in self.column_sort_keys]
+        if not self.sort_columns:
+            self.set_sort_columns([(columns[0], False)])
+            return
+
+        i = columns.index(self.sort_columns[0][0]) + 1
+        if i < len(columns):
+            self.set_sort_columns([(columns[i], False)])
+        else:
+            self.set_sort_columns([])
+
+    def keypress(self, size, key):
+        key = super().keypress(size, key)
+        if key == " " and self.walker.get_focus_job() is not None:
+            self.walker.toggle_selected(self.walker.focus)
+            urwid.emit_signal(self, "selection_changed")
+            return None
+        if key == "enter":
+            row = self.walker.get_focus_job()
+            if row.__class__ is ArrayGroupRow:
+                urwid.emit_signal(self, "group_toggled", row.key)
+                return None
+        if key == "o":
+            self._cycle_sort_column()
+            return None
+        if key == "O" and self.sort_columns:
+            self.sort_by(self.sort_columns[0][0])
+            return None
+        return key
 
     def _focus_changed(self, idx):
         # TODO: Do something smarter with idx
@@ -185,7 +432,10 @@ class JobQueueWidget(urwid.WidgetWrap):
 
 
 class JobFilterWidget(urwid.WidgetWrap):
-    def __init__(self):
+
+    signals = ["filters_changed"]
+
+    def __init__(self, cluster_names=()):
 
         self.filter_all_partitions = widgets.FancyCheckBox("All Partitions")
         self.filter_my_jobs = widgets.FancyCheckBox("My Jobs")
@@ -193,12 +443,47 @@ class JobFilterWidget(urwid.WidgetWrap):
         self.filter_gpu = widgets.FancyCheckBox("Use GPU")
         self.filter_job_name = urwid.Edit()
         self.filter_node_name = urwid.Edit()
+
+        self.job_name_modes = []
+        self.job_name_mode_buttons = OrderedDict(
+            (mode, urwid.RadioButton(self.job_name_modes, mode.title()))
+            for mode in SEARCH_MODES
+        )
         # self.filter_interactive = widgets.FancyCheckBox("Interactive")
         # self.select_all = widgets.FancyButton("Select All")
         # self.deselect_all = widgets.FancyButton("Deselect All")
 
+        # Bumped whenever any of the filters is changed so that JobsTab can tell
+        # nothing has changed without reading all of them.
+        self.generation = 0
+
+        # Only worth showing when there's more than one cluster to choose from
+        self.filter_clusters = OrderedDict()
+        if len(cluster_names) > 1:
+            for name in cluster_names:
+                self.filter_clusters[name] = widgets.FancyCheckBox(name, state=True)
+
+        for w in [
+            self.filter_all_partitions,
+            self.filter_my_jobs,
+            self.filter_running,
+            self.filter_gpu,
+            self.filter_job_name,
+            self.filter_node_name,
+            *self.filter_clusters.values(),
+            *self.job_name_mode_buttons.values(),
+        ]:
+            urwid.connect_signal(w, "postchange", self._filters_changed)
+
+        self.job_name_box = urwid.LineBox(self.filter_job_name)
+
+        cluster_filters = list(self.filter_clusters.values())
+        if cluster_filters:
+            cluster_filters.insert(0, urwid.Divider())
+
         self.pile = urwid.Pile(
             [
+                *cluster_filters,
                 urwid.Divider(),
                 self.filter_all_partitions,
                 self.filter_my_jobs,
@@ -207,7 +492,11 @@ class JobFilterWidget(urwid.WidgetWrap):
                 # self.filter_interactive,
                 urwid.Divider(),
                 urwid.Text("Job Name:"),
-                urwid.LineBox(self.filter_job_name),
+                self.job_name_box,
+                urwid.Columns(
+                    [("pack", b) for b in self.job_name_mode_buttons.values()],
+                    dividechars=1,
+                ),
                 urwid.Divider(),
                 urwid.Text("Node Name:"),
                 urwid.LineBox(self.filter_node_name),
@@ -223,6 +512,10 @@ class JobFilterWidget(urwid.WidgetWrap):
 
         super().__init__(w)
 
+    def _filters_changed(self, *args):
+        self.generation += 1
+        urwid.emit_signal(self, "filters_changed")
+
     def all_partitions_selected(self):
         return self.filter_all_partitions.get_state()
 
@@ -238,12 +531,22 @@ class JobFilterWidget(urwid.WidgetWrap):
     def job_name_filter(self):
         return self.filter_job_name.get_edit_text()
 
+    def job_name_mode(self):
+        return next(m for m, b in self.job_name_mode_buttons.items() if b.state)
+
     def node_name_filter(self):
         return self.filter_node_name.get_edit_text()
 
+    def selected_clusters(self):
+        """Names of the clusters whose jobs are shown. None means all of them."""
+        if not self.filter_clusters:
+            return None
+        return tuple(n for n, w in self.filter_clusters.items() if w.get_state())
+
     def set_focus_to_job_name_box(self):
         # TODO: This looks very hacky!
-        self.pile.focus_position = 7
+        widgets_in_pile = [w for w, _ in self.pile.contents]
+        self.pile.focus_position = widgets_in_pile.index(self.job_name_box)
 
 
 class JobActionsWidget(urwid.WidgetWrap):
@@ -254,6 +557,10 @@ class JobActionsWidget(urwid.WidgetWrap):
         "cancel_oldest",
         "cancel_selected",
         "attach_to_selected",
+        "select_all",
+        "select_none",
+        "invert_selection",
+        "select_regex",
     ]
 
     def __init__(self):
@@ -278,10 +585,28 @@ class JobActionsWidget(urwid.WidgetWrap):
         self.cancel_newest = widgets.FancyButton("Cancel Newest", self._relay_signals)
         self.cancel_oldest = widgets.FancyButton("Cancel Oldest", self._relay_signals)
 
-        w = urwid.Pile(
+        self.selection_label = urwid.Text("Selected Job(s):")
+        self.select_all = widgets.FancyButton("All", self._relay_signals)
+        self.select_none = widgets.FancyButton("None", self._relay_signals)
+        self.invert_selection = widgets.FancyButton("Invert", self._relay_signals)
+        self.select_regex = urwid.Edit()
+        self.select_regex_box = urwid.LineBox(self.select_regex)
+
+        self.pile = urwid.Pile(
             [
                 urwid.Divider(),
-                urwid.Text("Selected Job(s):"),
+                urwid.Text("Select:"),
+                urwid.GridFlow(
+                    [self.select_all, self.select_none, self.invert_selection],
+                    cell_width=10,
+                    h_sep=1,
+                    v_sep=0,
+                    align="left",
+                ),
+                urwid.Text("By name (regex):"),
+                self.select_regex_box,
+                urwid.Divider(),
+                self.selection_label,
                 self.nice_spinbutton,
                 self.throttle_spinbutton,
                 urwid.Columns(
@@ -294,7 +619,7 @@ class JobActionsWidget(urwid.WidgetWrap):
                 urwid.Padding(self.cancel_oldest, width="pack"),
             ]
         )
-        w = urwid.Filler(w, valign="top")
+        w = urwid.Filler(self.pile, valign="top")
         w = widgets.FancyLineBox(w, "Actions")
 
         super().__init__(w)
@@ -317,6 +642,18 @@ class JobActionsWidget(urwid.WidgetWrap):
     def set_throttle_value(self, value):
         self.throttle_spinbutton.set_value(str(value))
 
+    def set_selection_count(self, count):
+        label = f"Selected Job(s): {count}" if count else "Selected Job(s):"
+        if label != self.selection_label.text:
+            self.selection_label.set_text(label)
+
+    def keypress(self, size, key):
+        key = super().keypress(size, key)
+        if key == "enter" and self.pile.focus is self.select_regex_box:
+            urwid.emit_signal(self, "select_regex", self.select_regex.get_edit_text())
+            return None
+        return key
+
     def _relay_signals(self, src):
         if src is self.attach:
             urwid.emit_signal(self, "attach_to_selected")
@@ -328,36 +665,147 @@ class JobActionsWidget(urwid.WidgetWrap):
             urwid.emit_signal(self, "cancel_newest")
         elif src is self.cancel_oldest:
             urwid.emit_signal(self, "cancel_oldest")
+        elif src is self.select_all:
+            urwid.emit_signal(self, "select_all")
+        elif src is self.select_none:
+            urwid.emit_signal(self, "select_none")
+        elif src is self.invert_selection:
+            urwid.emit_signal(self, "invert_selection")
+
+
+class JobDetailWidget(urwid.WidgetWrap):
+
+    # Shown first, in this order. Whatever else scontrol has to say comes after.
+    important_fields = (
+        "JobId",
+        "JobName",
+        "UserId",
+        "JobState",
+        "Reason",
+        "Partition",
+        "NodeList",
+        "NumNodes",
+        "NumCPUs",
+        "TRES",
+        "ReqTRES",
+        "AllocTRES",
+        "TimeLimit",
+        "SubmitTime",
+        "StartTime",
+        "Dependency",
+        "WorkDir",
+        "Command",
+        "StdOut",
+        "StdErr",
+    )
+
+    def __init__(self):
+        self.walker = urwid.SimpleListWalker([])
+        # The job and details on screen
+        self.job_key = None
+        self.details = None
+
+        w = urwid.ListBox(self.walker)
+        w = widgets.FancyLineBox(w, "Details")
+
+        super().__init__(w)
+
+    def show(self, job, details):
+        """`details` as returned by ClusterGroup.get_job_details()."""
+        key = None if job is None else job.key
+        if key == self.job_key and details is self.details:
+            return
+        self.job_key = key
+        self.details = details
+
+        if job is None:
+            lines = []
+        elif details is None:
+            lines = [urwid.Text(f"Fetching the details of job {job.job_id} ...")]
+        elif isinstance(details, Exception):
+            lines = [
+                urwid.Text(f"Couldn't fetch the details of {job.job_id}: {details}")
+            ]
+        else:
+            fields = [f for f in self.important_fields if f in details]
+            fields += [f for f in details if f not in self.important_fields]
+            lines = [
+                urwid.Text([("bold", f"{f}: "), details[f]])
+                for f in fields
+                if details[f] not in ("", "(null)")
+            ]
+
+        self.walker[:] = lines
 
 
 class JobTabWidget(urwid.WidgetWrap):
-    def __init__(self):
 
-        self.qpanel = JobQueueWidget()
-        self.fpanel = JobFilterWidget()
+    signals = ["details_toggled"]
+
+    # The detail pane gets this much of the height, the job list the rest
+    detail_weight = 1 / 3
+
+    def __init__(self, hidden_columns=(), cluster_names=()):
+
+        self.qpanel = JobQueueWidget(hidden_columns)
+        self.dpanel = JobDetailWidget()
+        self.fpanel = JobFilterWidget(cluster_names)
         self.apanel = JobActionsWidget()
         right_col = urwid.Pile([("pack", self.fpanel), self.apanel])
 
+        self.left_col = urwid.Pile([self.qpanel])
+        self.details_visible = False
+        self.toggle_details()
+
         w = urwid.Columns(
-            [("weight", 80, self.qpanel), ("weight", 20, right_col)], dividechars=1
+            [("weight", 80, self.left_col), ("weight", 20, right_col)], dividechars=1
         )
 
         super().__init__(w)
 
+    def toggle_details(self):
+        self.details_visible = not self.details_visible
+        if self.details_visible:
+            queue_options = self.left_col.options("weight", 1 - self.detail_weight)
+            options = self.left_col.options("weight", self.detail_weight)
+            self.left_col.contents[0] = (self.qpanel, queue_options)
+            self.left_col.contents.append((self.dpanel, options))
+        else:
+            del self.left_col.contents[1:]
+        self.left_col.focus_position = 0
+        urwid.emit_signal(self, "details_toggled")
+
     def keypress(self, size, key):
         if key == "/":
             # TODO: This looks very hacky.
             self.fpanel.set_focus_to_job_name_box()
             self._wrapped_widget.set_focus_path([1, 0])
-        else:
-            return super().keypress(size, key)
+            return None
+
+        # Only if nobody else wanted it, e.g. to type it into a filter
+        key = super().keypress(size, key)
+        if key == "d":
+            self.toggle_details()
+            return None
+        return key
 
 
 class JobsTab(object):
-    def __init__(self, cluster):
+
+    # How many jobs on either side of the one in focus get their details prefetched
+    detail_prefetch = 2
+
+    def __init__(self, cluster, hidden_columns=(), extra_fields=()):
         super().__init__()
 
+        # A ClusterGroup, which looks like a single cluster to us
         self.cluster = cluster
+        # Job attributes somebody other than the job list needs, see build_job_query
+        self.extra_fields = frozenset(extra_fields)
+
+        cluster_names = cluster.get_cluster_names()
+        if len(cluster_names) == 1:
+            hidden_columns = (*hidden_columns, "cluster")
 
         # self.qpanel = JobQueueWidget()
         # self.fpanel = JobFilterWidget()
@@ -368,17 +816,48 @@ class JobsTab(object):
         #     [("weight", 80, self.qpanel), ("weight", 20, right_col)], dividechars=1
         # )
 
-        self.view = JobTabWidget()
+        self.view = JobTabWidget(hidden_columns, cluster_names)
         # TODO: This is hacky - I don't like it
         self.qpanel = self.view.qpanel
+        self.dpanel = self.view.dpanel
         self.fpanel = self.view.fpanel
         self.apanel = self.view.apanel
 
         self.view_placeholder = urwid.WidgetPlaceholder(self.view)
 
-        self.job_widgets_dict = {}
+        # The top-level rows: jobs and array groups
+        self.jobs = SortedJobs()
+        # Array groups of the visible array jobs by group key, and the group key of
+        # each of their elements.
+        self.groups = {}
+        self.element_groups = {}
+        self.expanded = set()
+        self.sort_key = None
+        self.rows = GroupedRows(self.jobs, self.groups, self.expanded)
+        # Keys of the selected jobs. They stay selected while they're filtered out
+        # and until they leave the queue.
+        self.selected = set()
+        self.qpanel.set_selection(self.selected)
+        # key -> Job, how each selected job looked when it was last fetched
+        self.selected_seen = {}
+        self.generation = None
+        self.index = JobIndex()
+        self.job_filter = None
+        self.job_predicate = None
+        self.pending_actions = []
+        self.filter_generation = None
 
         urwid.connect_signal(self.qpanel, "focus_changed", self.on_jobs_focus_changed)
+        urwid.connect_signal(self.view, "details_toggled", self.update_details)
+        urwid.connect_signal(self.qpanel, "sort_changed", self.on_sort_changed)
+        urwid.connect_signal(self.qpanel, "group_toggled", self.toggle_group)
+        urwid.connect_signal(
+            self.qpanel, "selection_changed", self.on_selection_changed
+        )
+        urwid.connect_signal(self.apanel, "select_all", self.select_all)
+        urwid.connect_signal(self.apanel, "select_none", self.select_none)
+        urwid.connect_signal(self.apanel, "invert_selection", self.invert_selection)
+        urwid.connect_signal(self.apanel, "select_regex", self.select_regex)
         urwid.connect_signal(self.apanel, "cancel_all", self.cancel_all_init)
         urwid.connect_signal(self.apanel, "cancel_newest", self.cancel_newest_init)
         urwid.connect_signal(self.apanel, "cancel_oldest", self.cancel_oldest_init)
@@ -386,6 +865,7 @@ class JobsTab(object):
         urwid.connect_signal(self.apanel, "attach_to_selected", self.attach_popup)
 
     def on_jobs_focus_changed(self):
+        self.update_details()
         job = self.get_focus_job()
 
         if job is None:
@@ -402,97 +882,378 @@ class JobsTab(object):
                 self.apanel.enable_throttle()
                 self.apanel.set_throttle_value(job.array_throttle)
 
-    def filter_jobs(self, jobs):
-
-        all_partitions_filter = (
-            lambda j: True
-            if self.fpanel.all_partitions_selected()
-            else j.partition in self.cluster.my_partitions
-        )
-
-        my_job_filter = (
-            lambda j: True
-            if not self.fpanel.my_jobs_selected()
-            else j.user == self.cluster.me
-        )
-
-        running_filter = (
-            lambda j: True
-            if not self.fpanel.running_jobs_selected()
-            else j.is_running()
-        )
-
-        gpu_filter = (
-            lambda j: True if not self.fpanel.use_gpu_selected() else j.uses_gpu()
-        )
-
-        job_name_filter = (
-            lambda j: True
-            if self.fpanel.job_name_filter() == ""
-            else self.fpanel.job_name_filter() in j.name
+    def build_job_filter(self):
+        clusters = self.fpanel.selected_clusters()
+        if clusters is not None:
+            clusters = frozenset(clusters)
+
+        ready = self.cluster.ready_clusters()
+
+        partitions = None
+        if not self.fpanel.all_partitions_selected():
+            partitions = frozenset((c.name, p) for c in ready for p in c.my_partitions)
+
+        users = None
+        if self.fpanel.my_jobs_selected():
+            users = frozenset((c.name, c.me) for c in ready)
+
+        states = None
+        if self.fpanel.running_jobs_selected():
+            states = frozenset(["RUNNING"])
+
+        return JobFilter(
+            clusters=clusters,
+            partitions=partitions,
+            users=users,
+            states=states,
+            gpu=self.fpanel.use_gpu_selected(),
+            name=self.fpanel.job_name_filter(),
+            name_mode=self.fpanel.job_name_mode(),
+            node=self.fpanel.node_name_filter(),
         )
 
-        node_name_filter = (
-            lambda j: True
-            if self.fpanel.node_name_filter() == ""
-            else self.fpanel.node_name_filter() in ",".join(j.nodes)
-        )
-
-        filters = (
-            all_partitions_filter,
-            my_job_filter,
-            running_filter,
-            gpu_filter,
-            job_name_filter,
-            node_name_filter,
-        )
+    def filter_jobs(self, jobs):
+        return list(filter(self.job_predicate, jobs))
 
-        for f in filters:
-            jobs = filter(f, jobs)
-        jobs = list(jobs)
+    def get_focus_job(self):
+        row = self.qpanel.get_focused_job()
+        if row.__class__ is ArrayGroupRow:
+            return row.job
+        return row
+
+    def check_pending_actions(self):
+        still_pending = []
+        for handle in self.pending_actions:
+            if not handle.is_done():
+                still_pending.append(handle)
+            elif handle.error is not None:
+                msg = f"{handle.description} failed:\n{handle.error}"
+                self.show_message(msg, "Error")
+        self.pending_actions = still_pending
+
+    def build_job_query(self, cluster):
+        """
+        Turns the filters that squeue can evaluate itself into a JobQuery for one
+        member `cluster` so narrow views don't need the whole queue. The rest is still
+        filtered in filter_jobs.
+        """
+        query = {}
+
+        if not self.fpanel.all_partitions_selected():
+            query["partitions"] = tuple(cluster.my_partitions)
+        if self.fpanel.my_jobs_selected():
+            query["users"] = (cluster.me,)
+        if self.fpanel.running_jobs_selected():
+            query["states"] = ("RUNNING",)
+
+        # The node filter matches substrings of node names, which squeue can't do.
+        # Asking for the jobs on all the nodes that match gets the same jobs though,
+        # as long as we know of every node.
+        node_name = self.fpanel.node_name_filter()
+        if node_name != "":
+            nodes = sorted(n for n in cluster.node_names if node_name in n)
+            if nodes:
+                query["nodes"] = tuple(nodes)
+
+        # Only ask for what's displayed or needed by the active filters. The state
+        # is used for colouring, and the nice value and the name by the actions panel
+        # (selecting by name has to work with the name column hidden too).
+        fields = {"state", "nice", "name", *self.extra_fields}
+        for column in self.qpanel.visible_columns:
+            fields.update(JobQueueWidget.column_fields[column])
+        if not self.fpanel.all_partitions_selected():
+            fields.add("partition")
+        if self.fpanel.my_jobs_selected():
+            fields.add("user")
+        if self.fpanel.use_gpu_selected():
+            fields.add("gres")
+        if node_name != "":
+            fields.add("nodes_str")
+        query["fields"] = frozenset(fields)
+
+        return JobQuery(**query)
+
+    def neighbour_jobs(self):
+        """The jobs around the one in focus, nearest first."""
+        focus = self.qpanel.walker.focus
+        for offset in range(1, self.detail_prefetch + 1):
+            for position in (focus + offset, focus - offset):
+                if 0 <= position < len(self.rows):
+                    row = self.rows[position]
+                    yield row.job if row.__class__ is ArrayGroupRow else row
+
+    def update_details(self):
+        if not self.view.details_visible:
+            return
 
-        return jobs
+        # Whatever isn't there yet is fetched in the background and we're called
+        # again (through refresh()) once it's arrived.
+        job = self.get_focus_job()
+        details = None
+        if job is not None:
+            details = self.cluster.get_job_details(job, self.neighbour_jobs())
+        self.dpanel.show(job, details)
+
+    def refresh(self) -> bool:
+        changed = self.refresh_jobs()
+        # Also picks up details that have arrived in the meantime
+        self.update_details()
+        return changed
+
+    def refresh_jobs(self) -> bool:
+        """
+        Brings the job list up to date. Returns False, having done next to nothing,
+        if neither the filters nor the backend's job snapshot have changed.
+        """
+        self.check_pending_actions()
+
+        # Filters are only read again when one of them has been touched or a
+        # cluster has finished connecting (which changes my partitions etc.)
+        ready_clusters = self.cluster.ready_clusters()
+        filter_generation = (self.fpanel.generation, len(ready_clusters))
+        filter_changed = filter_generation != self.filter_generation
+        if filter_changed:
+            self.filter_generation = filter_generation
+            job_filter = self.build_job_filter()
+            for c in ready_clusters:
+                c.set_job_query(self.build_job_query(c))
+
+        if not filter_changed and not self.cluster.has_changed(self.generation):
+            return False
+
+        deltas = None
+        if self.generation is not None:
+            deltas = self.cluster.get_job_deltas(self.generation)
+
+        if deltas is None:
+            snapshot = self.cluster.get_snapshot()
+            self.generation = snapshot.generation
+            self.index.rebuild(snapshot.jobs)
+            self.prune_selection()
+            self.set_job_filter(job_filter if filter_changed else self.job_filter)
+            return True
+
+        self.generation, delta = deltas
+        # The index follows every change, whether it's visible or not, so that it's
+        # ready for the next change of filters.
+        self.index.apply_delta(delta)
+        self.prune_selection()
+
+        if filter_changed and job_filter != self.job_filter:
+            self.set_job_filter(job_filter)
+            return True
+        elif not delta.is_empty():
+            return self.apply_job_delta(delta)
+
+        return False
+
+    def get_selected_jobs(self):
+        """
+        The selected jobs that have been fetched, in squeue's order. Those filtered
+        out by the job queries aren't known until the filters let them through again.
+        """
+        keys = [k for k in self.selected if k in self.index.jobs]
+        keys.sort(key=self.index.order.__getitem__)
+        return [self.index.jobs[k] for k in keys]
+
+    def prune_selection(self):
+        """Unselects the jobs that have left the queue."""
+        if not self.selected:
+            self.selected_seen.clear()
+            return
 
-    def create_job_widgets(self, jobs):
+        # A job that's missing from a filtered squeue may well still be queued, so
+        # it only counts as gone if the latest query would have fetched it.
+        queries = None
+        gone = []
+        for key in self.selected:
+            job = self.index.jobs.get(key)
+            if job is not None:
+                self.selected_seen[key] = job
+                continue
+            if queries is None:
+                queries = self.cluster.job_queries()
+            seen = self.selected_seen.get(key)
+            query = queries.get(key[0])
+            if seen is not None and query is not None and query.would_fetch(seen):
+                gone.append(key)
+
+        if len(self.selected_seen) > len(self.selected):
+            for key in set(self.selected_seen).difference(self.selected):
+                del self.selected_seen[key]
+        if gone:
+            self.selected.difference_update(gone)
+            for key in gone:
+                del self.selected_seen[key]
+            self.on_selection_changed()
+
+    def on_selection_changed(self):
+        self.apanel.set_selection_count(len(self.selected))
+
+    def _selection_updated(self):
+        self.qpanel.set_selection(self.selected)
+        self.on_selection_changed()
+
+    def visible_keys(self):
+        """Keys of all the jobs that pass the filters, including grouped ones."""
+        for key in self.jobs.keys():
+            group = self.groups.get(key)
+            if group is None:
+                yield key
+            else:
+                yield from group.jobs
+
+    def is_visible(self, key):
+        return key in self.element_groups or key in self.jobs
+
+    def select_all(self):
+        """Selects all the jobs that pass the filters."""
+        self.selected.update(self.visible_keys())
+        self._selection_updated()
+
+    def select_none(self):
+        self.selected.clear()
+        self._selection_updated()
+
+    def invert_selection(self):
+        """Inverts the selection of the jobs that pass the filters."""
+        self.selected.symmetric_difference_update(self.visible_keys())
+        self._selection_updated()
+
+    def select_regex(self, pattern):
+        """Adds the jobs that pass the filters and whose name matches `pattern`."""
+        if pattern == "":
+            # Would match everything, which is what select_all is for
+            return
+        keys = self.index.names.search(pattern, "regex")
+        self.selected.update(k for k in keys if self.is_visible(k))
+        self._selection_updated()
 
-        if len(jobs) == 0:
-            return []
-        jobs = self.filter_jobs(jobs)
-        jobs_widgets = [JobWidget(j) for j in jobs]
-        return jobs_widgets
+    def make_sort_key(self):
+        # Ties are broken by the index's table order, so this has to be made again
+        # whenever the index is rebuilt.
+        return make_sort_key(self.qpanel.get_sort_key_getters(), self.index.order)
 
-    def get_focus_job(self):
-        job_idx = self.qpanel.get_focused_job_idx()
+    def on_sort_changed(self):
+        if self.job_filter is None:
+            return
 
-        if job_idx is None:
-            return None
+        # Groups sort their elements too so it's easiest to start over
+        self.set_job_filter(self.job_filter)
+
+    def set_job_filter(self, job_filter):
+        self.job_filter = job_filter
+        self.job_predicate = job_filter.compile()
+
+        key_fn, reverse = self.make_sort_key()
+        self.sort_key = key_fn, reverse
+
+        # Array elements go into their groups, everything else is a row of its own
+        self.groups.clear()
+        self.element_groups.clear()
+        rows = []
+        for job in self.index.select(job_filter):
+            if job.is_array_job:
+                self._add_to_group(job)
+            else:
+                rows.append(job)
+        rows += [self._group_row(g) for g in self.groups.values()]
+
+        self.jobs.reset(rows, row_sort_key(key_fn), reverse)
+        self.update_rows()
+
+    def update_rows(self):
+        # Row widgets are only built for what's on screen, by the walker
+        self.rows.update()
+        self.qpanel.set_jobs(self.rows)
+
+    def _group_row(self, group):
+        return ArrayGroupRow(group, group.key in self.expanded)
+
+    def _add_to_group(self, job):
+        key = group_key(job)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = ArrayGroup(key, *self.sort_key)
+        group.add(job)
+        self.element_groups[job.key] = key
+        return key
+
+    def _remove_from_group(self, job_key):
+        key = self.element_groups.pop(job_key, None)
+        if key is not None:
+            self.groups[key].remove(job_key)
+        return key
+
+    def toggle_group(self, key):
+        if key in self.expanded:
+            self.expanded.remove(key)
         else:
-            return self.jobs[job_idx]
-
-    def refresh(self):
-        self.jobs = self.filter_jobs(self.cluster.get_jobs())
-        # job_widgets = self.create_job_widgets(self.jobs)
-
-        job_widgets_ordered = []
-        job_widgets_dict = {}
-        for job in self.jobs:
-            try:
-                w = self.job_widgets_dict[job.job_id]
-                w.update_values(job)
-                job_widgets_ordered.append(w)
-                job_widgets_dict[job.job_id] = w
-            except KeyError:
-                w = JobWidget(job)
-                job_widgets_ordered.append(w)
-                job_widgets_dict[job.job_id] = w
-
-        # I have to confirm this but I assume that the widgets living in
-        # self.job_widgets_dict in previous rounds for jobs that don't exist this time
-        # around will be garbage collected as soon as I set the self.job_widgets_dict to
-        # the new dictionary created in this function.
-        self.job_widgets_dict = job_widgets_dict
-
-        self.qpanel.update_job_widgets(job_widgets_ordered)
+            self.expanded.add(key)
+
+        group = self.groups.get(key)
+        if group is not None:
+            self.jobs.add(self._group_row(group))
+        self.update_rows()
+
+    def apply_job_delta(self, delta):
+        changed = False
+        # Groups get a new row once, after all their elements have been updated
+        touched_groups = set()
+
+        for key in delta.removed:
+            if self.jobs.discard(key):
+                changed = True
+            else:
+                touched_groups.add(self._remove_from_group(key))
+
+        # Nearly every running job's elapsed time changes on every poll. Unless the
+        # list is sorted by it, such a job stays where it is and still passes the
+        # filters (which don't look at the time) or not, so it's swapped in place.
+        in_place = all(column != "time" for column, _ in self.qpanel.sort_columns)
+
+        updated_jobs = list(delta.added.values())
+        for job, fields in delta.changed.values():
+            if not in_place or fields != ["time"]:
+                updated_jobs.append(job)
+                continue
+            group = self.element_groups.get(job.key)
+            if group is not None:
+                self.groups[group].update_time(job)
+                touched_groups.add(group)
+            elif self.jobs.replace(job):
+                changed = True
+
+        passing_keys = {j.key for j in self.filter_jobs(updated_jobs)}
+
+        # Each job is moved to where it belongs on its own, which is much cheaper
+        # than sorting everything when only a few jobs change per poll.
+        for job in updated_jobs:
+            if job.key not in passing_keys:
+                if self.jobs.discard(job.key):
+                    changed = True
+                else:
+                    touched_groups.add(self._remove_from_group(job.key))
+            elif job.is_array_job:
+                touched_groups.add(self._add_to_group(job))
+            else:
+                self.jobs.add(job)
+                changed = True
+
+        touched_groups.discard(None)
+        for key in touched_groups:
+            group = self.groups[key]
+            if len(group) == 0:
+                del self.groups[key]
+                self.jobs.discard(key)
+            else:
+                self.jobs.add(self._group_row(group))
+            changed = True
+
+        if changed:
+            self.update_rows()
+
+        return changed
 
     def show_popup(self, w):
         overlay = urwid.Overlay(
@@ -513,19 +1274,49 @@ class JobsTab(object):
         w = widgets.MessageWidget(msg, self.close_popup, title)
         self.show_popup(w)
 
+    def shown_clusters(self):
+        """Names of the ready clusters whose jobs are shown."""
+        names = self.fpanel.selected_clusters()
+        return [
+            c.name
+            for c in self.cluster.ready_clusters()
+            if names is None or c.name in names
+        ]
+
     def cancel_all_init(self):
+        # Like the other actions, only what's on screen. The clusters are decided
+        # now so that changing the filters behind the popup can't widen it.
+        names = self.shown_clusters()
+        if not names:
+            self.show_message("No cluster's jobs are shown!", "Error")
+            return
+
+        msg = "Are you sure you want to cancel all your job(s)"
+        if len(self.cluster.clusters) > 1:
+            msg += f" on {', '.join(names)}"
         w = widgets.ConfirmationWidget(
-            "Are you sure you want to cancel all your job(s)?",
-            self.cancel_all_finish,
-            self.close_popup,
+            msg + "?", self.cancel_all_finish, self.close_popup, names
         )
         self.show_popup(w)
 
-    def cancel_all_finish(self, *args, **kwargs):
-        self.cluster.cancel_my_jobs()
+    def cancel_all_finish(self, event_origin, names):
+        self.pending_actions.append(self.cluster.cancel_my_jobs(names))
         self.close_popup()
 
+    def single_cluster(self):
+        """The one cluster whose jobs are shown, or None if there's several."""
+        names = self.fpanel.selected_clusters()
+        if names is None:
+            names = self.cluster.get_cluster_names()
+        if len(names) != 1:
+            return None
+        return self.cluster.get_cluster(names[0])
+
     def cancel_newest_init(self):
+        if self.single_cluster() is None:
+            self.show_message("Only show a single cluster's jobs first!", "Error")
+            return
+
         w = widgets.ConfirmationWidget(
             "Are you sure you want to cancel your newest job?",
             self.cancel_newest_finish,
@@ -534,10 +1325,14 @@ class JobsTab(object):
         self.show_popup(w)
 
     def cancel_newest_finish(self, *args, **kwargs):
-        self.cluster.cancel_my_newest_job()
+        self.pending_actions.append(self.single_cluster().cancel_my_newest_job())
         self.close_popup()
 
     def cancel_oldest_init(self):
+        if self.single_cluster() is None:
+            self.show_message("Only show a single cluster's jobs first!", "Error")
+            return
+
         w = widgets.ConfirmationWidget(
             "Are you sure you want to cancel your oldest job?",
             self.cancel_oldest_finish,
@@ -546,18 +1341,19 @@ class JobsTab(object):
         self.show_popup(w)
 
     def cancel_oldest_finish(self, *args, **kwargs):
-        self.cluster.cancel_my_oldest_job()
+        self.pending_actions.append(self.single_cluster().cancel_my_oldest_job())
         self.close_popup()
 
     def cancel_selected_init(self):
-        job_indices = self.qpanel.get_selected_job_idices()
+        # Taken from the model, not the widgets, so that a refresh can't change
+        # what's cancelled behind our back.
+        selected_jobs = self.get_selected_jobs()
 
-        if len(job_indices) == 0:
+        if len(selected_jobs) == 0:
             self.show_message("No jobs have been selected!", "Error")
         else:
-            selected_jobs = [self.jobs[idx] for idx in job_indices]
             w = widgets.ConfirmationWidget(
-                f"Are you sure you want to cancel selected {len(job_indices)} job(s)?",
+                f"Are you sure you want to cancel selected {len(selected_jobs)} job(s)?",
                 self.cancel_selected_jobs_finish,
                 self.close_popup,
                 selected_jobs,
@@ -565,7 +1361,7 @@ class JobsTab(object):
             self.show_popup(w)
 
     def cancel_selected_jobs_finish(self, event_origin, selected_jobs):
-        self.cluster.cancel_jobs(selected_jobs)
+        self.pending_actions.append(self.cluster.cancel_jobs(selected_jobs))
         self.close_popup()
 
     def attach_popup(self):
@@ -578,8 +1374,9 @@ class JobsTab(object):
             assert False  # FIXME
 
         cmd = f"sattach {job.job_id}.0"
-        if self.cluster.remote:
-            cmd = f"ssh -T {self.cluster.remote} " + cmd
+        remote = self.cluster.get_cluster(job.cluster).remote
+        if remote:
+            cmd = f"ssh -T {remote} " + cmd
 
         cancel_button = widgets.FancyButton("Cancel")
         urwid.connect_signal(cancel_button, "click", self.close_popup, None)
@@ -1,6 +1,168 @@
 import urwid
+from collections import OrderedDict
 
 import stui.widgets as widgets
+from stui.nodes import NodeTable, base_state, is_unavailable
+
+
+def _state_attr(state):
+    if is_unavailable(state):
+        return "node_state_down"
+    return {
+        "IDLE": "node_state_idle",
+        "MIXED": "node_state_mixed",
+        "ALLOCATED": "node_state_allocated",
+        "COMPLETING": "node_state_allocated",
+    }.get(base_state(state))
+
+
+def _gb(mb):
+    return f"{mb / 1024:.0f}"
+
+
+def format_gres(gres, gres_used) -> str:
+    # (("gpu:a100", 4),) and (("gpu:a100", 1),) -> "gpu:a100 1/4"
+    used = dict(gres_used)
+    return ", ".join(f"{name} {used.get(name, 0)}/{count}" for name, count in gres)
+
+
+class NodeWidget(widgets.RowWidget):
+    def __init__(self, column_keys):
+        columns = OrderedDict((k, urwid.Text("", wrap="ellipsis")) for k in column_keys)
+        columns["state"] = urwid.AttrMap(columns["state"], None)
+
+        super().__init__(
+            columns,
+            column_keys,
+            NodeQueueWidget.column_widths,
+            focus_map={
+                None: "highlight",
+                "node_state_idle": "highlight",
+                "node_state_mixed": "highlight",
+                "node_state_allocated": "highlight",
+                "node_state_down": "highlight",
+            },
+        )
+
+    def update_values(self, row):
+        (
+            cluster,
+            name,
+            state,
+            cpus_alloc,
+            cpus_idle,
+            cpus_total,
+            mem_alloc,
+            mem_total,
+            gres,
+            gres_used,
+            partitions,
+            features,
+        ) = row
+
+        self._set_text("cluster", cluster)
+        self._set_text("name", name)
+        self._set_text("state", state.title())
+        self._set_text("cpus", f"{cpus_alloc}/{cpus_idle}/{cpus_total}")
+        self._set_text("memory", f"{_gb(mem_alloc)}/{_gb(mem_total)}")
+        self._set_text("gres", format_gres(gres, gres_used))
+        self._set_text("partitions", ",".join(partitions))
+        self._set_text("features", features)
+
+        self._set_attr("state", _state_attr(state))
+
+
+class NodeListWalker(widgets.CachedListWalker):
+    """
+    The Nodes tab's counterpart of JobListWalker: rows are read straight out of a
+    NodeTable. Tables are rebuilt on every poll so rows are compared by value.
+    """
+
+    def __init__(self, make_widget, cache_size=256):
+        super().__init__(make_widget, cache_size)
+
+        self.nodes = NodeTable()
+        self.focus_key = None
+
+    def set_nodes(self, nodes: NodeTable):
+        self.nodes = nodes
+
+        # Stay on the same node, new ones may have come before it
+        position = nodes.index.get(self.focus_key)
+        if position is None:
+            position = min(self.focus, max(len(nodes) - 1, 0))
+        self.set_focus(position)
+
+    def get_focus_key(self):
+        if self.focus < len(self.nodes):
+            return self.nodes.key_at(self.focus)
+        return None
+
+    def row_count(self):
+        return len(self.nodes)
+
+    def get_row(self, position):
+        return self.nodes.key_at(position), self.nodes.row(position)
+
+    def set_focus(self, position):
+        self.focus = position
+        self.focus_key = self.get_focus_key()
+        super().set_focus(position)
+
+
+class NodeQueueWidget(urwid.WidgetWrap):
+
+    column_labels = OrderedDict(
+        [
+            ("cluster", "Cluster"),
+            ("name", "Node"),
+            ("state", "State"),
+            ("cpus", "CPUs A/I/T"),
+            ("memory", "Mem GB"),
+            ("gres", "GRES Used/Total"),
+            ("partitions", "Partitions"),
+            ("features", "Features"),
+        ]
+    )
+
+    column_widths = {
+        "cluster": ("weight", 1),
+        "name": ("weight", 1),
+        "state": (16,),
+        "cpus": (14,),
+        "memory": (11,),
+        "gres": ("weight", 2),
+        "partitions": ("weight", 2),
+        "features": ("weight", 2),
+    }
+
+    def __init__(self, show_cluster=False):
+
+        self.visible_columns = [
+            k for k in self.column_labels if show_cluster or k != "cluster"
+        ]
+
+        header_w = urwid.Columns(
+            [
+                (
+                    *self.column_widths[k],
+                    urwid.Padding(urwid.Text(self.column_labels[k], wrap="ellipsis")),
+                )
+                for k in self.visible_columns
+            ]
+        )
+
+        self.walker = NodeListWalker(self.new_node_widget)
+        w = widgets.FancyListBox(self.walker)
+        w = urwid.Frame(w, header_w)
+
+        super().__init__(w)
+
+    def new_node_widget(self):
+        return NodeWidget(self.visible_columns)
+
+    def set_nodes(self, nodes: NodeTable):
+        self.walker.set_nodes(nodes)
 
 
 class NodesTab(object):
@@ -8,8 +170,36 @@ class NodesTab(object):
         super().__init__()
 
         self.cluster = cluster
+        # The table on screen, see refresh()
+        self.nodes = None
 
-        w = urwid.Text("Nodes: Under Construction ...")
-        w = urwid.Filler(w)
+        self.summary = urwid.Text(self.summary_text(NodeTable()))
+        self.qpanel = NodeQueueWidget(show_cluster=len(cluster.clusters) > 1)
 
+        w = urwid.Frame(self.qpanel, urwid.Pile([self.summary, urwid.Divider()]))
         self.view = widgets.FancyLineBox(w, "Nodes")
+
+    def refresh(self) -> bool:
+        """Returns whether anything on screen had to change."""
+        nodes = self.cluster.get_nodes()
+        if nodes is self.nodes:
+            return False
+
+        self.nodes = nodes
+        self.qpanel.set_nodes(nodes)
+        self.summary.set_text(self.summary_text(nodes))
+        return True
+
+    @staticmethod
+    def summary_text(nodes: NodeTable) -> str:
+        if not len(nodes):
+            return "Waiting for node information ..."
+
+        counts = sorted(nodes.state_counts().items(), key=lambda c: -c[1])
+        states = ", ".join(f"{n} {state.lower()}" for state, n in counts)
+        text = f"{len(nodes)} nodes ({states})"
+        text += f"  CPUs: {sum(nodes.cpus_alloc)}/{sum(nodes.cpus_total)} allocated"
+        gpus = sum(nodes.gpus_total)
+        if gpus:
+            text += f"  GPUs: {sum(nodes.gpus_alloc)}/{gpus} allocated"
+        return text
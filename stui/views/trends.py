@@ -0,0 +1,91 @@
+import math
+
+import urwid
+
+from stui.trends import LEVELS, TimeSeries
+
+BLOCKS = "▁▂▃▄▅▆▇█"
+
+LABELS = {
+    "jobs_pending": "Pending",
+    "jobs_running": "Running",
+    "gpus_used": "GPUs",
+    "my_jobs": "Mine",
+}
+
+
+def _duration(seconds):
+    if seconds >= 3600:
+        return f"{seconds // 3600}h"
+    if seconds >= 60:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+def sparkline(values, width) -> str:
+    """
+    The last `width` values as block characters, scaled to the biggest one. Unknown
+    (NaN) values are left blank.
+    """
+    values = values[-width:] if width > 0 else []
+    top = max((v for v in values if not math.isnan(v)), default=0)
+    scale = (len(BLOCKS) - 1) / top if top > 0 else 0
+    return "".join(
+        " " if math.isnan(v) else BLOCKS[int(v * scale + 0.5)] for v in values
+    )
+
+
+class Sparkline(urwid.Widget):
+    """`label`, a sparkline as wide as there's room for and the latest value."""
+
+    _sizing = frozenset(["flow"])
+
+    def __init__(self, label):
+        super().__init__()
+        self.label = label
+        self.values = []
+
+    def set_values(self, values):
+        # NaN != NaN, so lists with gaps would always look different
+        if str(values) != str(self.values):
+            self.values = values
+            self._invalidate()
+
+    def rows(self, size, focus=False):
+        return 1
+
+    def render(self, size, focus=False):
+        (maxcol,) = size
+        latest = ""
+        if self.values:
+            latest = " -" if math.isnan(self.values[-1]) else f" {self.values[-1]:.0f}"
+        width = maxcol - len(self.label) - 1 - len(latest)
+        text = f"{self.label} {sparkline(self.values, width)}{latest}"
+        return urwid.Text(text, wrap="ellipsis").render(size)
+
+
+class TrendsPanel(urwid.WidgetWrap):
+    """One sparkline per metric of a TimeSeries, at one of its resolutions."""
+
+    def __init__(self, metrics):
+        self.title = urwid.Text("")
+        self.sparklines = {m: Sparkline(LABELS.get(m, m)) for m in metrics}
+
+        self.columns = urwid.Columns(
+            [("pack", self.title), *self.sparklines.values()], dividechars=2
+        )
+        # Empty until there's something to show
+        self.lines = urwid.Pile([])
+        super().__init__(self.lines)
+
+    def update(self, trends: TimeSeries, level: int):
+        if not self.lines.contents:
+            self.lines.contents = [(self.columns, ("pack", None))]
+
+        step, capacity = LEVELS[level]
+        title = f"Last {_duration(step * capacity)} ({_duration(step)}):"
+        if title != self.title.text:
+            self.title.set_text(title)
+
+        for metric, w in self.sparklines.items():
+            w.set_values(trends.series(metric, level))
@@ -0,0 +1,108 @@
+import urwid
+
+from stui.utilization import Utilization
+
+# How many users the panel has room for
+TOP_USERS = 5
+
+
+def _percent(used, total):
+    return f"{100 * used // total}%" if total else "-"
+
+
+def _name(key, multi_cluster):
+    cluster, name = key
+    return f"{cluster}/{name}" if multi_cluster else name
+
+
+class UtilizationPanel(urwid.WidgetWrap):
+    """
+    The summary under the header: the use of all the clusters together, then CPU
+    use by partition, GPU use by type and the biggest users, one line each.
+    """
+
+    def __init__(self):
+        self.lines = urwid.Pile([])
+        # What each line currently shows
+        self.texts = []
+
+        super().__init__(self.lines)
+
+    def update(self, utilization: Utilization, multi_cluster=False):
+        texts = self.summary_lines(utilization, multi_cluster)
+        if texts == self.texts:
+            return
+        self.texts = texts
+        self.lines.contents = [
+            (urwid.Text(t, wrap="ellipsis"), ("pack", None)) for t in texts
+        ]
+
+    @staticmethod
+    def summary_lines(utilization: Utilization, multi_cluster=False):
+        totals = utilization.totals()
+        if not totals["cpus_total"] and not totals["jobs_pending"]:
+            return []
+
+        line = (
+            f"CPUs {totals['cpus_used']}/{totals['cpus_total']} "
+            f"({_percent(totals['cpus_used'], totals['cpus_total'])})"
+        )
+        if totals["gpus_total"]:
+            line += (
+                f"  GPUs {totals['gpus_used']}/{totals['gpus_total']} "
+                f"({_percent(totals['gpus_used'], totals['gpus_total'])})"
+            )
+        # With filters pushed down to squeue we only see some of the jobs, so
+        # anything counted from them says so.
+        filtered = " (filtered)" if utilization.partial else ""
+        if utilization.jobs_known:
+            line += f"  Pending{filtered}: {totals['jobs_pending']} jobs"
+            line += f", {totals['cpus_pending']} CPUs"
+            if totals["gpus_pending"]:
+                line += f", {totals['gpus_pending']} GPUs"
+        lines = [line]
+
+        by_partition = utilization.by_partition
+        partitions = []
+        for key in sorted(by_partition.keys):
+            p = by_partition.get(key)
+            if p["cpus_total"]:
+                used = _percent(p["cpus_used"], p["cpus_total"])
+                partitions.append(f"{_name(key, multi_cluster)} {used}")
+        if partitions:
+            lines.append("Partitions: " + "  ".join(partitions))
+
+        by_gpu_type = utilization.by_gpu_type
+        gpu_types = []
+        any_pending = False
+        for key in sorted(by_gpu_type.keys):
+            g = by_gpu_type.get(key)
+            if not g["gpus_total"] and not g["gpus_pending"]:
+                continue
+            # "gpu:a100" -> "a100", untyped requests stay "gpu"
+            name = _name((key[0], key[1].partition(":")[2] or key[1]), multi_cluster)
+            text = name
+            if g["gpus_total"]:
+                text += f" {g['gpus_used']}/{g['gpus_total']}"
+            if g["gpus_pending"]:
+                text += f" (+{g['gpus_pending']} pending)"
+                any_pending = True
+            gpu_types.append(text)
+        if gpu_types:
+            label = "GPUs: "
+            if any_pending and utilization.partial:
+                label = "GPUs (pending filtered): "
+            lines.append(label + "  ".join(gpu_types))
+
+        top = utilization.by_user.top("cpus_used", TOP_USERS)
+        if top:
+            users = []
+            for key, cpus in top:
+                gpus = utilization.by_user.get(key)["gpus_used"]
+                text = f"{_name(key, multi_cluster)} {cpus} CPUs"
+                if gpus:
+                    text += f"/{gpus} GPUs"
+                users.append(text)
+            lines.append(f"Top users{filtered}: " + "  ".join(users))
+
+        return lines
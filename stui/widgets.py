@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from typing import Optional
 import urwid
 from urwid.command_map import ACTIVATE
@@ -6,8 +7,11 @@ __all__ = [
     "FancyLineBox",
     "FancyCheckBox",
     "FancyButton",
+    "ClickableText",
     "SpinButton",
     "SelectableColumns",
+    "RowWidget",
+    "CachedListWalker",
     "TabLineBox",
     "FancyListBox",
     "Tabbed",
@@ -170,6 +174,19 @@ class FancyButton(urwid.WidgetWrap):
         return True
 
 
+class ClickableText(urwid.Text):
+    """Text that sends 'click' with the mouse button number when clicked."""
+
+    signals = ["click"]
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        if not urwid.util.is_mouse_press(event):
+            return False
+
+        self._emit("click", button)
+        return True
+
+
 class SpinButton(urwid.WidgetWrap):
     def __init__(self, min, max, start, step, label=None):
 
@@ -218,6 +235,110 @@ class SelectableColumns(urwid.Columns):
         return super().keypress(size, key)
 
 
+class RowWidget(urwid.WidgetWrap):
+    """
+    A row of a list: the `columns` in `column_keys` side by side. `columns` maps
+    column keys to Text widgets, possibly wrapped (e.g. in an AttrMap).
+    """
+
+    def __init__(self, columns, column_keys, column_widths, focus_map=None):
+        self.columns = columns
+        # What each column currently shows
+        self.texts = {}
+        self.attrs = {}
+
+        w = SelectableColumns(
+            [(*column_widths[k], urwid.Padding(columns[k])) for k in column_keys]
+        )
+        w = urwid.AttrMap(w, None, focus_map=focus_map)
+
+        super().__init__(w)
+
+    def _set_text(self, column, text):
+        # set_text() throws away the cached canvas even if the text is the same, so
+        # only call it when there's something new to show.
+        if column in self.columns and self.texts.get(column) != text:
+            self.texts[column] = text
+            self.columns[column].base_widget.set_text(text)
+
+    def _set_attr(self, column, attr):
+        """Sets the attribute of a column that's wrapped in an AttrMap."""
+        if self.attrs.get(column) != attr:
+            self.attrs[column] = attr
+            self.columns[column].set_attr_map({None: attr})
+
+
+class CachedListWalker(urwid.ListWalker):
+    """
+    Hands out row widgets on demand, for lists that can be far too long to have a
+    widget for every row. ListBox only ever asks for the rows around what's on
+    screen so those are the only ones that get a widget. Widgets are cached by row
+    key and once the cache is full the least recently used one is recycled for the
+    next row. A widget is only updated when the row it shows has changed, rows that
+    are replaced whenever they change can be told apart by identity.
+
+    Subclasses provide the rows with row_count() and get_row().
+    """
+
+    def __init__(self, make_widget, cache_size=256):
+        self.make_widget = make_widget
+        self.cache_size = cache_size
+        self.focus = 0
+
+        # key -> [row, widget], the row the widget currently shows
+        self.widgets = OrderedDict()
+
+    def row_count(self) -> int:
+        raise NotImplementedError
+
+    def get_row(self, position):
+        """(key, row) at `position`, or None if there's no such row."""
+        raise NotImplementedError
+
+    def __getitem__(self, position):
+        if position < 0 or position >= self.row_count():
+            raise IndexError(position)
+        key_row = self.get_row(position)
+        if key_row is None:
+            raise IndexError(position)
+        key, row = key_row
+
+        entry = self.widgets.get(key)
+        if entry is not None:
+            self.widgets.move_to_end(key)
+        else:
+            if len(self.widgets) >= self.cache_size:
+                _, entry = self.widgets.popitem(last=False)
+            else:
+                entry = [None, self.make_widget()]
+            self.widgets[key] = entry
+
+        if entry[0] is not row and entry[0] != row:
+            entry[1].update_values(row)
+            entry[0] = row
+
+        return entry[1]
+
+    def next_position(self, position):
+        if position + 1 >= self.row_count():
+            raise IndexError(position)
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(self.row_count() - 1, -1, -1)
+        return range(self.row_count())
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+
 class TabLineBox(urwid.LineBox):
     def __init__(self, original_widget):
         super().__init__(
@@ -285,6 +406,9 @@ class Tab(urwid.WidgetWrap):
 
 
 class Tabbed(urwid.WidgetWrap):
+
+    signals = ["tab_changed"]
+
     def __init__(self, labels, views):
 
         self.tabs = [Tab(label, view) for label, view in zip(labels, views)]
@@ -312,6 +436,8 @@ class Tabbed(urwid.WidgetWrap):
             else:
                 t.set_attr_inactive()
 
+        self._emit("tab_changed", tab.view)
+
     def set_active_next(self):
         next_idx = (self.tab_bar.focus_position + 1) % len(self.tabs)
         self.set_active_tab(self.tabs[next_idx])
@@ -0,0 +1,44 @@
+"""
+Fakes shared by the tests and the benchmarks. Clusters made by make_cluster() are
+ready to poll straight away, without connecting to anything.
+"""
+
+from stui import backend
+
+
+class FakeDriver(backend.Driver):
+    """
+    Serves `jobs`, a {job id: {attribute: value}} dict that can be changed between
+    polls, and honours the users and the fields of the query like squeue does.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def get_jobs(self, query=backend.JobQuery()):
+        jobs = []
+        for job_id, values in self.jobs.items():
+            if query.users is not None and values["user"] not in query.users:
+                continue
+            if query.fields is not None:
+                fields = query.fields | backend.REQUIRED_JOB_ATTRS
+                values = {k: v for k, v in values.items() if k in fields}
+            jobs.append(backend.Job.from_values(job_id, **values))
+        return jobs
+
+    def get_nodes(self):
+        return backend.NodeTable()
+
+    def cancel_user_jobs(self, user):
+        self.jobs = {k: v for k, v in self.jobs.items() if v["user"] != user}
+
+
+def make_cluster(driver, name="test", me="me", partitions=("cpu",)):
+    cluster = backend.Cluster(driver=driver, name=name)
+    cluster.me = me
+    cluster.config = {"ClusterName": name}
+    cluster.my_partitions = list(partitions)
+    cluster.all_partitions = list(partitions)
+    cluster.node_names = frozenset()
+    cluster.is_ready.set()
+    return cluster
@@ -0,0 +1,82 @@
+import threading
+
+from stui.actions import ActionExecutor, CommandError, gather
+
+
+def make_executor(log):
+    def cancel_jobs(job_ids):
+        log.append(("cancel", job_ids))
+        return {"13": CommandError("scancel 13", 1, "Invalid job id")}
+
+    return ActionExecutor(cancel_jobs)
+
+
+def submit(executor, log, name, fail=False):
+    def fn():
+        log.append(name)
+        if fail:
+            raise RuntimeError(name)
+
+    return executor.submit(fn, name)
+
+
+def test_consecutive_cancels_are_merged():
+    log = []
+    executor = make_executor(log)
+    handles = [
+        executor.cancel(["1", "2"]),
+        executor.cancel(["2", "3"]),
+        executor.cancel(["13"]),
+    ]
+    executor._run_batch([executor.queue.get() for _ in handles])
+
+    assert log == [("cancel", ["1", "2", "3", "13"])]
+    assert all(h.is_done() for h in handles)
+    assert handles[0].succeeded() and handles[1].succeeded()
+    assert isinstance(handles[2].error, CommandError)
+
+
+def test_submission_order():
+    log = []
+    executor = make_executor(log)
+    handles = [
+        executor.cancel(["1"]),
+        submit(executor, log, "hold"),
+        executor.cancel(["2"]),
+        executor.cancel(["3"]),
+        submit(executor, log, "release", fail=True),
+        executor.cancel(["4"]),
+    ]
+    executor._run_batch([executor.queue.get() for _ in handles])
+
+    assert log == [
+        ("cancel", ["1"]),
+        "hold",
+        ("cancel", ["2", "3"]),
+        "release",
+        ("cancel", ["4"]),
+    ]
+    assert isinstance(handles[4].error, RuntimeError)
+    assert all(h.succeeded() for i, h in enumerate(handles) if i != 4)
+
+
+def test_thread():
+    log = []
+    done = threading.Event()
+    executor = make_executor(log)
+    executor.on_completed = done.set
+    executor.start()
+
+    handle = gather(
+        [executor.cancel(["1"]), submit(executor, log, "hold")], "Cancel and hold"
+    )
+    assert handle.wait(5)
+    assert handle.succeeded()
+    assert done.wait(5)
+    assert log == [("cancel", ["1"]), "hold"]
+
+
+def test_nothing_to_cancel():
+    executor = make_executor([])
+    assert executor.cancel([]).succeeded()
+    assert executor.queue.empty()
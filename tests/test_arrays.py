@@ -0,0 +1,96 @@
+from stui.arrays import ArrayGroup, GroupedRows, count_tasks, group_key
+from stui.backend import Job
+from stui.sorting import SortedJobs
+
+
+def make_job(idx, state="RUNNING", time="0:00"):
+    job = Job.from_values(
+        f"100_{idx}",
+        job_id_base="100",
+        job_id_idx=idx,
+        state=state,
+        time=time,
+    )
+    job.cluster = "test"
+    return job
+
+
+def by_id(job):
+    return job.job_id
+
+
+def test_count_tasks():
+    assert count_tasks(make_job("[5-100:5%4]", state="PENDING")) == 20
+    assert count_tasks(make_job("[1,3,7-9]", state="PENDING")) == 5
+    assert count_tasks(make_job("3")) == 1
+
+
+def test_group_aggregates():
+    jobs = [
+        make_job("1", time="1:00"),
+        make_job("2", time="5:00"),
+        make_job("[3-10%2]", state="PENDING"),
+    ]
+    group = ArrayGroup(group_key(jobs[0]), by_id, reverse=False)
+    for job in jobs:
+        group.add(job)
+
+    assert group.state_counts == {"RUNNING": 2, "PENDING": 8}
+    assert group.time_range() == (0, 300)
+    assert group.throttle() == "2"
+    assert group.first_job() is jobs[0]
+
+    group.remove(jobs[0].key)
+    assert group.first_job() is jobs[1]
+    group.remove(jobs[2].key)
+    assert group.time_range() == (300, 300)
+    assert group.throttle() is None
+
+
+def test_group_update_time():
+    jobs = [make_job(str(i), time=f"{i}:00") for i in range(1, 4)]
+    group = ArrayGroup(group_key(jobs[0]), by_id, reverse=True)
+    for job in jobs:
+        group.add(job)
+    assert group.time_range() == (60, 180)
+    assert group.sorted_jobs() == jobs[::-1]
+
+    # The longest running one gets longer still
+    longer = make_job("3", time="4:00")
+    group.update_time(longer)
+    assert group.time_range() == (60, 240)
+    # The shortest catches up with the others
+    caught_up = make_job("1", time="2:00")
+    group.update_time(caught_up)
+    assert group.time_range() == (120, 240)
+    assert group.times == {120: 2, 240: 1}
+    assert group.sorted_jobs() == [longer, jobs[1], caught_up]
+
+
+def test_grouped_rows():
+    elements = [make_job(str(i)) for i in range(3)]
+    group = ArrayGroup(group_key(elements[0]), by_id, reverse=False)
+    for job in elements:
+        group.add(job)
+
+    others = [Job.from_values(job_id, job_id_idx="N/A") for job_id in ("1", "2")]
+    for job in others:
+        job.cluster = "test"
+
+    # A stand-in for the group's row, sorted between the other two
+    row = Job.from_values("100", job_id_idx="N/A")
+    row.key = group.key
+
+    rows = SortedJobs()
+    rows.reset([*others, row], key_fn=lambda j: j.job_id)
+    expanded = set()
+    grouped = GroupedRows(rows, {group.key: group}, expanded)
+    grouped.update()
+    assert list(grouped) == [others[0], row, others[1]]
+
+    expanded.add(group.key)
+    grouped.update()
+    assert list(grouped) == [others[0], row, *elements, others[1]]
+    assert grouped.position_of(elements[1].key) == 3
+    assert grouped.position_of(others[1].key) == 5
+    assert grouped.key_at(2) == elements[0].key
@@ -0,0 +1,270 @@
+import os
+
+import pytest
+
+from conftest import FakeDriver, make_cluster
+
+from stui.backend import (
+    DELTA_HISTORY_LEN,
+    SQUEUE_FIELDS,
+    ClusterGroup,
+    Job,
+    JobDelta,
+    JobHistory,
+    JobSnapshot,
+    SlurmCLIDriver,
+    UpdateNotifier,
+    make_squeue_format,
+)
+from stui.views.jobs import JobsTab
+
+
+def make_job(job_id, state="PENDING"):
+    job = Job.from_values(job_id, state=state, user="me")
+    job.cluster = "test"
+    return job
+
+
+def by_key(*jobs):
+    return {j.key: j for j in jobs}
+
+
+def test_between():
+    a, b, c = make_job("1"), make_job("2"), make_job("3")
+    b2 = make_job("2", "RUNNING")
+    delta = JobDelta.between(by_key(a, b), by_key(b2, c))
+
+    assert delta.added == by_key(c)
+    assert delta.removed == by_key(a)
+    assert delta.changed == {b.key: (b2, ["state"])}
+    assert JobDelta.between(by_key(a, b), by_key(a, make_job("2"))).is_empty()
+
+
+def test_merge_chain():
+    a, b, c = make_job("1"), make_job("2"), make_job("3")
+    a2, b2 = make_job("1", "RUNNING"), make_job("2", "RUNNING")
+
+    steps = [by_key(a, b), by_key(a2, b), by_key(a2, b2, c), by_key(a2, c)]
+    merged = JobDelta.between(steps[0], steps[1])
+    for old, new in zip(steps[1:], steps[2:]):
+        merged = merged.merge(JobDelta.between(old, new))
+
+    # The same as going there in one step
+    assert merged.added == by_key(c)
+    assert merged.removed == by_key(b)
+    assert merged.changed == {a.key: (a2, ["state"])}
+
+
+def test_merge_added_then_removed():
+    a, b = make_job("1"), make_job("2")
+    added = JobDelta.between(by_key(a), by_key(a, b))
+    removed = JobDelta.between(by_key(a, b), by_key(a))
+    assert added.merge(removed).is_empty()
+
+    # And the other way around, back as it was
+    assert removed.merge(added).is_empty()
+    # Or back with something different
+    b2 = make_job("2", "RUNNING")
+    readded = JobDelta.between(by_key(a), by_key(a, b2))
+    assert removed.merge(readded).changed == {b.key: (b2, ["state"])}
+
+
+def test_merge_changed_back():
+    a, a2 = make_job("1"), make_job("1", "RUNNING")
+    there = JobDelta.between(by_key(a), by_key(a2))
+    back = JobDelta.between(by_key(a2), by_key(a))
+    assert there.merge(back).is_empty()
+
+
+def publish(history, generation, jobs):
+    old = history.snapshot.jobs_by_id
+    snapshot = JobSnapshot(generation, jobs)
+    history.publish(snapshot, JobDelta.between(old, snapshot.jobs_by_id))
+
+
+def test_history_since():
+    history = JobHistory()
+    jobs = [make_job(str(i)) for i in range(DELTA_HISTORY_LEN + 4)]
+    for generation in range(1, len(jobs) + 1):
+        publish(history, generation, jobs[:generation])
+    latest = len(jobs)
+
+    snapshot, delta = history.since(latest - 3)
+    assert snapshot.generation == latest
+    assert delta.added == by_key(*jobs[-3:])
+    assert not delta.removed and not delta.changed
+
+    _, delta = history.since(latest)
+    assert delta.is_empty()
+
+    # Evicted, the caller has to start over from the snapshot
+    assert history.since(latest - DELTA_HISTORY_LEN)[1] is not None
+    assert history.since(latest - DELTA_HISTORY_LEN - 1)[1] is None
+    assert history.since(0)[1] is None
+    # From a history that's been replaced
+    assert history.since(latest + 1)[1] is None
+
+
+def read_wakeups(fd):
+    try:
+        return os.read(fd, 1024)
+    except BlockingIOError:
+        return b""
+
+
+def make_notifier():
+    r, w = os.pipe()
+    os.set_blocking(r, False)
+    return r, UpdateNotifier(w)
+
+
+def test_notifier_folds_wakeups():
+    r, notifier = make_notifier()
+    for _ in range(5):
+        notifier.notify()
+    assert read_wakeups(r) == b"\n"
+
+    notifier.acknowledge()
+    assert read_wakeups(r) == b""
+    notifier.notify()
+    notifier.notify()
+    assert read_wakeups(r) == b"\n"
+
+
+def test_finished_actions_notify():
+    r, notifier = make_notifier()
+    cluster = make_cluster(FakeDriver({"1": {"user": "me"}}))
+    cluster.notifier = notifier
+    cluster.actions.start()
+
+    assert cluster.cancel_my_jobs().wait(5)
+    # Told from the executor's thread right after the handle is done
+    os.set_blocking(r, True)
+    assert os.read(r, 1024) == b"\n"
+
+
+def test_squeue_format():
+    fields, squeue_format = make_squeue_format(None)
+    assert fields == tuple(SQUEUE_FIELDS)
+
+    fields, squeue_format = make_squeue_format(frozenset(["user"]))
+    # What's needed to tell jobs apart comes along anyway
+    assert fields == (
+        "job_id_unique",
+        "job_id_base_idx",
+        "job_id_base",
+        "job_id_idx",
+        "user",
+        "state",
+    )
+    assert squeue_format == "%A|%i|%F|%K|%u|%T"
+
+
+def test_hidden_columns_arent_fetched():
+    cluster = make_cluster(FakeDriver({}))
+    tab = JobsTab(ClusterGroup([cluster]), hidden_columns=["time", "nodes", "gres"])
+    query = tab.build_job_query(cluster)
+
+    driver = SlurmCLIDriver(remote=None)
+    values = {
+        "job_id_unique": "12",
+        "job_id_base_idx": "10_2",
+        "job_id_base": "10",
+        "job_id_idx": "2",
+        "cpus": "4",
+        "job_name": "train",
+        "partition": "cpu",
+        "user": "me",
+        "nice": "0",
+        "state": "RUNNING",
+    }
+    commands = []
+
+    def run_command(cmd):
+        commands.append(cmd)
+        fields = make_squeue_format(query.fields)[0]
+        return ["|".join(values[f] for f in fields)]
+
+    driver.run_command = run_command
+    (job,) = driver.get_jobs(query)
+
+    for spec in ("%M", "%N", "%b"):
+        assert spec not in commands[0]
+    assert (job.job_id, job.job_id_idx, job.user, job.state) == (
+        "12",
+        "2",
+        "me",
+        "RUNNING",
+    )
+    assert (job.name, job.cpus, job.partition, job.nice) == ("train", "4", "cpu", "0")
+    assert job.time == job.nodes_str == job.gres == ""
+
+
+def test_snapshots_are_immutable():
+    jobs = [make_job("1"), make_job("2")]
+    snapshot = JobSnapshot(1, jobs)
+    assert snapshot.jobs == tuple(jobs)
+    assert snapshot.jobs_by_id[("test", "2")] is jobs[1]
+
+    with pytest.raises(AttributeError):
+        snapshot.jobs = ()
+    with pytest.raises(TypeError):
+        snapshot.jobs_by_id[("test", "3")] = make_job("3")
+    # Later changes to the list it was made from don't show
+    jobs.append(make_job("3"))
+    assert len(snapshot) == 2
+
+
+def test_polls_publish_new_snapshots():
+    driver = FakeDriver({"1": {"user": "me"}, "2": {"user": "you"}})
+    cluster = make_cluster(driver)
+    cluster.poll_once()
+    first = cluster.get_snapshot()
+    assert not cluster.has_changed(first.generation)
+    assert cluster.get_jobs() is first.jobs
+
+    driver.jobs = {"1": {"user": "me"}}
+    cluster.poll_once()
+    assert cluster.has_changed(first.generation)
+    assert cluster.get_snapshot().generation == first.generation + 1
+    # Whoever still holds on to the old one sees it as it was
+    assert len(first) == 2
+    assert len(cluster.get_snapshot()) == 1
+
+    # Shared with the merged view of all the clusters, not copied
+    group = ClusterGroup([cluster])
+    assert group.get_snapshot().jobs[0] is cluster.get_jobs()[0]
+
+
+def parse(**values):
+    fields = tuple(SQUEUE_FIELDS)
+    defaults = dict.fromkeys(fields, "")
+    defaults.update(values)
+    return Job(fields, "|".join(defaults[f] for f in fields))
+
+
+def test_job_records():
+    job = parse(
+        job_id_unique="12",
+        job_id_base_idx="10_[1-100%5]",
+        job_id_base="10",
+        job_id_idx="1-100%5",
+        user="".join(["al", "ice"]),
+        state="PENDING",
+        nodes="gpu[01-02]",
+    )
+    other = parse(job_id_unique="13", user="alice", job_id_idx="N/A")
+
+    # No per-job dict, and the values jobs have in common are only stored once
+    assert not hasattr(job, "__dict__")
+    assert job.user is other.user
+    assert job.nodes == ("gpu01", "gpu02")
+
+    assert job.is_array_job
+    assert (job.array_total_jobs, job.array_throttle) == ("100", "5")
+    assert not other.is_array_job
+    assert other.array_total_jobs is None
+
+    running = parse(job_id_unique="12", user="alice", state="RUNNING")
+    assert running.changed_fields(parse(job_id_unique="12", user="alice")) == ["state"]
+    assert running.changed_fields(running) == []
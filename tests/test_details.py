@@ -0,0 +1,121 @@
+import threading
+from queue import Queue
+
+import pytest
+
+from stui import details
+from stui.details import JobDetailCache
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(details.time, "monotonic", clock)
+    return clock
+
+
+class FakeFetch(object):
+    """Numbers each fetch. Fetches wait while `gate` is clear."""
+
+    def __init__(self):
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, key):
+        self.gate.wait()
+        self.calls.append(key)
+        if key == "gone":
+            raise ValueError("Invalid job id specified")
+        return {"JobId": key, "fetch": len(self.calls)}
+
+
+def make_cache(**kwargs):
+    fetch = FakeFetch()
+    fetched = Queue()
+    cache = JobDetailCache(fetch, on_fetched=lambda: fetched.put(True), **kwargs)
+    return cache, fetch, fetched
+
+
+def wait_for(fetched, n=1):
+    for _ in range(n):
+        fetched.get(timeout=5)
+
+
+def test_fetches_in_the_background(clock):
+    cache, fetch, fetched = make_cache()
+    assert cache.get("1", prefetch=["2", "1", "3"]) is None
+    wait_for(fetched, 3)
+    # The job in focus first, then its neighbours
+    assert fetch.calls == ["1", "2", "3"]
+
+    assert cache.get("2")["JobId"] == "2"
+    assert cache.get("3", prefetch=["2"])["JobId"] == "3"
+    assert cache.wanted == []
+    assert fetch.calls == ["1", "2", "3"]
+
+
+def test_refetch_after_ttl(clock):
+    cache, fetch, fetched = make_cache(ttl=30)
+    cache.get("1")
+    wait_for(fetched)
+
+    clock.now += 29
+    assert cache.get("1")["fetch"] == 1
+    assert cache.wanted == []
+
+    # Stale, shown as it is while it's fetched again
+    clock.now += 2
+    assert cache.get("1")["fetch"] == 1
+    wait_for(fetched)
+    assert cache.get("1")["fetch"] == 2
+
+
+def test_size_bound(clock):
+    cache, fetch, fetched = make_cache(max_size=3)
+    for key in "123":
+        cache.get(key)
+        wait_for(fetched)
+
+    # Looked at again, so it's no longer the oldest
+    cache.get("1")
+    cache.get("4")
+    wait_for(fetched)
+
+    assert list(cache.entries) == ["3", "1", "4"]
+    assert cache.get("2") is None
+
+
+def test_never_blocks(clock):
+    cache, fetch, fetched = make_cache(ttl=30)
+    cache.get("1")
+    wait_for(fetched)
+
+    fetch.gate.clear()
+    clock.now += 60
+    assert cache.get("2") is None
+    # Straight back with what's there while the fetches are stuck
+    assert cache.get("1", prefetch=["2"])["fetch"] == 1
+
+    fetch.gate.set()
+    wait_for(fetched, 2)
+    assert cache.get("2")["JobId"] == "2"
+    assert cache.get("1")["fetch"] > 1
+
+
+def test_failures_are_cached(clock):
+    cache, fetch, fetched = make_cache()
+    cache.get("gone")
+    wait_for(fetched)
+
+    assert isinstance(cache.get("gone"), ValueError)
+    assert cache.wanted == []
+    assert fetch.calls == ["gone"]
@@ -0,0 +1,69 @@
+from stui.backend import Job, JobDelta
+from stui.filters import JobFilter, JobIndex
+
+
+def make_job(job_id, nodes="", **values):
+    job = Job.from_values(job_id, nodes_str=nodes, **values)
+    job.cluster = "test"
+    return job
+
+
+JOBS = [
+    make_job("1", "gpu[01-02]", user="alice", state="RUNNING", name="train"),
+    make_job("2", "gpu10", user="bob", state="RUNNING", name="eval"),
+    make_job("3", user="alice", state="PENDING", name="train more"),
+    make_job("4", "cpu1", user="carol", state="RUNNING", name="preprocess"),
+]
+
+
+def select(index, **kwargs):
+    f = JobFilter(**kwargs)
+    jobs = index.select(f)
+    # The index and the predicate have to agree
+    predicate = f.compile()
+    assert jobs == [j for j in index.jobs.values() if predicate(j)]
+    return [j.job_id for j in jobs]
+
+
+def test_select():
+    index = JobIndex()
+    index.rebuild(JOBS)
+
+    assert select(index) == ["1", "2", "3", "4"]
+    assert select(index, users=frozenset([("test", "alice")])) == ["1", "3"]
+    assert select(index, states=frozenset(["RUNNING"]), name="train") == ["1"]
+    # Node names are matched anywhere
+    assert select(index, node="gpu") == ["1", "2"]
+    assert select(index, node="gpu1") == ["2"]
+    assert select(index, node="pu0") == ["1"]
+
+
+def test_apply_delta():
+    index = JobIndex()
+    index.rebuild(JOBS)
+
+    moved = make_job("2", "cpu1", user="bob", state="RUNNING", name="eval")
+    new = make_job("5", "gpu02", user="dave", state="RUNNING", name="new")
+    old = {j.key: j for j in JOBS}
+    later = {**old, moved.key: moved, new.key: new}
+    del later[("test", "1")]
+    index.apply_delta(JobDelta.between(old, later))
+
+    assert select(index, node="gpu") == ["5"]
+    assert select(index, node="cpu1") == ["2", "4"]
+    assert select(index, name="train") == ["3"]
+    assert "gpu01" not in index.by_node
+
+
+def test_malformed_node_list():
+    broken = make_job("6", "gpu[001-", user="bob", state="RUNNING", name="odd")
+    index = JobIndex()
+    index.rebuild(JOBS + [broken])
+
+    # Indexed as it came, still found by what it says
+    assert index.by_node["gpu[001-"] == {broken.key}
+    assert select(index, node="gpu[0") == ["6"]
+    assert select(index, users=frozenset([("test", "bob")])) == ["2", "6"]
+
+    index.apply_delta(JobDelta.between({broken.key: broken}, {}))
+    assert "gpu[001-" not in index.by_node
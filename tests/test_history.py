@@ -0,0 +1,115 @@
+import re
+import time
+
+from stui import backend
+from stui.history import HistoryCache, HistoryQuery, HistoryRecord, parse_sacct
+
+SACCT = [
+    "100|COMPLETED|0:0|1700000000|1700000010|1700000100|90|4|node1|cpu=4|cpu|train",
+    "101|CANCELLED by 1234|0:15|1700000000|Unknown|1700000200|0|1||cpu=1|gpu|a|b",
+    "102|RUNNING|0:0|1700000000|1700000010|Unknown|50|2|node2|cpu=2|cpu|still going",
+    "not|enough|fields",
+]
+
+
+def record(job_id, end_time, state="COMPLETED", partition="cpu", name="job"):
+    return HistoryRecord(
+        job_id, name, partition, state, "0:0", 0, 0, end_time, 10, 1, "node1", ""
+    )
+
+
+def test_parse_sacct():
+    records = parse_sacct(SACCT)
+    assert len(records) == 3
+    assert records[0].end_time == 1700000100
+    assert records[0].elapsed == 90
+    # Job names can have "|" in them
+    assert records[1].name == "a|b"
+    assert records[1].state == "CANCELLED"
+    assert records[1].start_time is None
+    assert records[2].end_time is None
+
+
+def test_sacct_command():
+    commands = []
+    driver = backend.SlurmCLIDriver(remote=None)
+    driver.run_command = lambda cmd, check=False: commands.append(cmd) or SACCT
+
+    assert len(driver.get_job_history("alice", int(time.time()) - 3600)) == 3
+    # Neither the start nor the output depend on the cluster's timezone
+    assert commands[0].startswith("env SLURM_TIME_FORMAT=%s sacct ")
+    assert re.search(r"--starttime=now-360[01]seconds ", commands[0])
+
+
+def make_cache(tmp_path, records):
+    fetched = []
+
+    def fetch(cluster, user, since):
+        fetched.append((cluster, user, since))
+        return records
+
+    return HistoryCache(str(tmp_path / "history.sqlite"), fetch), fetched
+
+
+def test_cache_queries(tmp_path):
+    now = int(time.time())
+    records = [
+        record("1", now - 300, name="train"),
+        record("2", now - 200, state="FAILED", name="eval"),
+        record("3", now - 100, partition="gpu", name="train more"),
+        # Not finished yet, so not cached
+        record("4", None),
+    ]
+    cache, _ = make_cache(tmp_path, records)
+    assert cache._sync(("c", "alice")) == 3
+
+    keys = [("c", "alice")]
+    assert cache.count(keys) == 3
+    assert cache.count([("c", "bob")]) == 0
+    assert [r.job_id for _, r in cache.page(keys, HistoryQuery(), 0, 10)] == [
+        "3",
+        "2",
+        "1",
+    ]
+    assert [r.job_id for _, r in cache.page(keys, HistoryQuery(), 1, 1)] == ["2"]
+
+    assert cache.count(keys, HistoryQuery(text="TRAIN")) == 2
+    assert cache.count(keys, HistoryQuery(states=("FAILED",))) == 1
+    assert cache.count(keys, HistoryQuery(partitions=("gpu",))) == 1
+    assert cache.count(keys, HistoryQuery(ended_after=now - 250)) == 2
+
+    assert cache.position(keys, HistoryQuery(), "c", records[0]) == 2
+    assert cache.position(keys, HistoryQuery(text="train"), "c", records[0]) == 1
+
+
+def test_cache_sync_state(tmp_path):
+    now = int(time.time())
+    cache, fetched = make_cache(tmp_path, [record("1", now), record("old", 1)])
+    cache._sync(("c", "alice"))
+    # Past the retention period
+    assert cache.count([("c", "alice")]) == 1
+
+    # The next sync starts where the last one stopped, less the overlap
+    cache._sync(("c", "alice"))
+    first, second = fetched[0][2], fetched[1][2]
+    assert first < now - 24 * 3600
+    assert now - 600 <= second <= now
+    assert cache.count([("c", "alice")]) == 1
+
+
+def test_cache_background_sync(tmp_path):
+    now = int(time.time())
+    cache, fetched = make_cache(tmp_path, [record("1", now)])
+    cache.sync([("c", "alice"), ("c", "bob")])
+
+    deadline = time.monotonic() + 5
+    while cache.is_syncing([("c", "alice"), ("c", "bob")]):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert cache.generation == 2
+    assert cache.count([("c", "alice"), ("c", "bob")]) == 2
+
+    # Not again until the interval is up
+    cache.sync([("c", "alice")])
+    assert not cache.is_syncing([("c", "alice")])
+    assert len(fetched) == 2
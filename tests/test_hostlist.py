@@ -0,0 +1,34 @@
+from stui.hostlist import compress_hostlist, expand_hostlist
+
+
+def test_expand():
+    assert expand_hostlist("") == ()
+    assert expand_hostlist("node1") == ("node1",)
+    assert expand_hostlist("node1,node2") == ("node1", "node2")
+    assert expand_hostlist("gpu[001-003,010]") == (
+        "gpu001",
+        "gpu002",
+        "gpu003",
+        "gpu010",
+    )
+    assert expand_hostlist("cpu[1-2]-ib,login") == ("cpu1-ib", "cpu2-ib", "login")
+    assert expand_hostlist("rack[1-2]-n[1-2]") == (
+        "rack1-n1",
+        "rack1-n2",
+        "rack2-n1",
+        "rack2-n2",
+    )
+
+
+def test_compress():
+    assert compress_hostlist([]) == ""
+    assert compress_hostlist(["login"]) == "login"
+    assert compress_hostlist(["gpu01", "gpu02", "gpu03", "gpu05"]) == "gpu[01-03,05]"
+    assert compress_hostlist(["cpu1-ib", "cpu2-ib", "gpu1"]) == "cpu[1-2]-ib,gpu1"
+    # "n09" isn't how a range from 9 would write it, unlike "n10"
+    assert compress_hostlist(["n09", "n10", "n9"]) == "n[09,9-10]"
+
+
+def test_round_trip():
+    for hostlist in ["gpu[001-003,010]", "a[1-3],b7,c[08-12]-x", "login"]:
+        assert compress_hostlist(expand_hostlist(hostlist)) == hostlist
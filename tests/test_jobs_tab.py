@@ -0,0 +1,235 @@
+from conftest import FakeDriver, make_cluster
+
+import stui.widgets as widgets
+from stui import backend
+from stui.views.jobs import JobsTab
+
+
+def make_jobs(n, user):
+    return {
+        str(1000 + i): {"user": user, "state": "PENDING", "partition": "cpu"}
+        for i in range(n)
+    }
+
+
+def make_tab(jobs):
+    cluster = make_cluster(FakeDriver(jobs))
+    tab = JobsTab(backend.ClusterGroup([cluster]))
+    return cluster, tab
+
+
+def update(cluster, tab):
+    # Once to send the filters down as a query and once to see its results
+    tab.refresh()
+    cluster.poll_once()
+    tab.refresh()
+
+
+def test_selection_survives_filters():
+    jobs = make_jobs(5, "someone")
+    jobs["2000"] = {"user": "me", "state": "PENDING", "partition": "cpu"}
+    cluster, tab = make_tab(jobs)
+    update(cluster, tab)
+
+    tab.selected.update(k for k in tab.index.jobs if k[1] != "2000")
+    assert len(tab.selected) == 5
+
+    tab.fpanel.filter_my_jobs.set_state(True)
+    update(cluster, tab)
+    assert len(tab.index) == 1
+    assert len(tab.selected) == 5
+    assert tab.get_selected_jobs() == []
+
+    tab.fpanel.filter_my_jobs.set_state(False)
+    update(cluster, tab)
+    assert len(tab.selected) == 5
+    assert len(tab.get_selected_jobs()) == 5
+
+
+def test_selection_drops_jobs_that_left():
+    jobs = make_jobs(5, "someone")
+    cluster, tab = make_tab(jobs)
+    update(cluster, tab)
+    tab.selected.update(tab.index.jobs)
+
+    tab.fpanel.filter_my_jobs.set_state(True)
+    update(cluster, tab)
+    # Gone while we weren't looking
+    del jobs["1000"]
+    cluster.poll_once()
+    tab.refresh()
+    assert len(tab.selected) == 5
+
+    tab.fpanel.filter_my_jobs.set_state(False)
+    update(cluster, tab)
+    assert ("test", "1000") not in tab.selected
+    assert len(tab.selected) == 4
+
+    del jobs["1001"]
+    cluster.poll_once()
+    tab.refresh()
+    assert len(tab.selected) == 3
+
+
+def test_select_regex():
+    jobs = make_jobs(3, "me")
+    for job_id, name in zip(jobs, ["train-1", "train-2", "eval"]):
+        jobs[job_id]["name"] = name
+    cluster = make_cluster(FakeDriver(jobs))
+    tab = JobsTab(backend.ClusterGroup([cluster]), hidden_columns=["name"])
+    update(cluster, tab)
+
+    tab.select_regex("")
+    assert tab.selected == set()
+
+    # Names are there to match against even though they aren't shown
+    tab.select_regex("^train")
+    assert sorted(k[1] for k in tab.selected) == ["1000", "1001"]
+
+
+def test_query_would_fetch():
+    job = backend.Job.from_values("1", user="me", partition="cpu,gpu")
+    assert backend.JobQuery().would_fetch(job)
+    assert backend.JobQuery(users=("me",), partitions=("gpu",)).would_fetch(job)
+    assert not backend.JobQuery(users=("you",)).would_fetch(job)
+    assert not backend.JobQuery(partitions=("big",)).would_fetch(job)
+    # States change as jobs run so the job could just have moved on
+    assert not backend.JobQuery(states=("PENDING",)).would_fetch(job)
+
+
+def test_node_filter_pushdown():
+    cluster, tab = make_tab({})
+    cluster.node_names = frozenset(["gpu01", "gpu02", "gpu10", "cpu01"])
+
+    tab.fpanel.filter_node_name.set_edit_text("gpu0")
+    query = tab.build_job_query(cluster)
+    # Every node the substring matches, not just one named exactly
+    assert query.nodes == ("gpu01", "gpu02")
+
+    commands = []
+    driver = backend.SlurmCLIDriver(remote=None)
+    driver.run_command = lambda cmd: commands.append(cmd) or []
+    driver.get_jobs(query)
+    assert "--nodelist=gpu[01-02]" in commands[0]
+
+    job = backend.Job.from_values("1", nodes_str="gpu[01-02]", partition="cpu")
+    job.cluster = "test"
+    assert tab.build_job_filter().compile()(job)
+
+    tab.fpanel.filter_node_name.set_edit_text("gpu01")
+    assert tab.build_job_query(cluster).nodes == ("gpu01",)
+    # Still a substring match, like before anything was pushed down
+    job = backend.Job.from_values("1", nodes_str="gpu010", partition="cpu")
+    job.cluster = "test"
+    assert tab.build_job_filter().compile()(job)
+
+
+def test_cancel_all_only_on_shown_clusters(monkeypatch):
+    drivers = {name: FakeDriver(make_jobs(3, "me")) for name in ("a", "b")}
+    clusters = [make_cluster(d, name) for name, d in drivers.items()]
+    for c in clusters:
+        c.actions.start()
+    tab = JobsTab(backend.ClusterGroup(clusters))
+
+    popups = []
+    monkeypatch.setattr(widgets, "ConfirmationWidget", lambda *a: popups.append(a))
+    monkeypatch.setattr(tab, "show_popup", lambda w: None)
+
+    tab.fpanel.filter_clusters["b"].set_state(False)
+    tab.cancel_all_init()
+    msg, ok_handler, _, names = popups[-1]
+    assert msg == "Are you sure you want to cancel all your job(s) on a?"
+
+    ok_handler(None, names)
+    assert tab.pending_actions[-1].wait(5)
+    assert drivers["a"].jobs == {}
+    # Hidden, so left alone
+    assert len(drivers["b"].jobs) == 3
+
+
+def make_plain_jobs(n):
+    # Not array jobs, so each gets a row of its own
+    jobs = make_jobs(n, "me")
+    for job_id, values in jobs.items():
+        values.update(job_id_base=job_id, job_id_idx="N/A")
+    return jobs
+
+
+def test_rows_are_built_lazily():
+    jobs = make_plain_jobs(5000)
+    cluster, tab = make_tab(jobs)
+    update(cluster, tab)
+    walker = tab.qpanel.walker
+    assert len(walker.jobs) == 5000
+
+    tab.qpanel.render((150, 40))
+    # Only what's on screen
+    assert 0 < len(walker.widgets) <= 40
+
+    updates = []
+    for _, widget in walker.widgets.values():
+        widget.update_values = updates.append
+    tab.qpanel.render((150, 40))
+    assert updates == []
+
+    # Scrolling a long way recycles widgets instead of making new ones
+    walker.cache_size = 64
+    walker.set_focus(4000)
+    tab.qpanel.render((150, 40))
+    walker.set_focus(2000)
+    tab.qpanel.render((150, 40))
+    assert len(walker.widgets) <= 64
+
+
+def test_focus_follows_the_job():
+    jobs = make_plain_jobs(50)
+    cluster, tab = make_tab(jobs)
+    update(cluster, tab)
+    walker = tab.qpanel.walker
+
+    walker.set_focus(10)
+    key = walker.get_focus_key()
+    # Some of the jobs above it leave
+    for position in range(5):
+        del jobs[walker.jobs.key_at(position)[1]]
+    cluster.poll_once()
+    tab.refresh()
+    assert walker.get_focus_key() == key
+    assert walker.focus == 5
+
+
+def test_refresh_skips_when_nothing_changed():
+    jobs = make_plain_jobs(10)
+    cluster, tab = make_tab(jobs)
+    update(cluster, tab)
+    assert not tab.refresh()
+
+    # Polled again but the same jobs came back
+    cluster.poll_once()
+    assert not tab.refresh()
+
+    jobs["1000"]["state"] = "RUNNING"
+    cluster.poll_once()
+    assert tab.refresh()
+    assert not tab.refresh()
+
+    tab.fpanel.filter_my_jobs.set_state(True)
+    assert tab.refresh()
+
+
+def test_rows_only_redraw_what_changed():
+    jobs = make_plain_jobs(1)
+    cluster, tab = make_tab(jobs)
+    update(cluster, tab)
+    job = tab.qpanel.walker.jobs[0]
+
+    widget = tab.qpanel.new_job_widget()
+    widget.update_values(job)
+    canvas = widget.render((150,))
+    # A new version of the job that looks the same
+    widget.update_values(backend.Job.from_values(job.job_id, **jobs[job.job_id]))
+    assert widget.render((150,)) is canvas
+
+    jobs[job.job_id]["state"] = "RUNNING"
+    widget.update_values(backend.Job.from_values(job.job_id, **jobs[job.job_id]))
+    assert widget.render((150,)) is not canvas
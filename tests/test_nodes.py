@@ -0,0 +1,105 @@
+from stui.nodes import NodeTable, parse_gres, parse_oneliner, parse_scontrol_nodes
+
+# `scontrol show nodes --oneliner` from Slurm 23.02, trimmed a little
+GPU_NODE = (
+    "NodeName=gpu001 Arch=x86_64 CoresPerSocket=32 CPUAlloc=16 CPUEfctv=62 "
+    "CPUTot=64 CPULoad=15.20 AvailableFeatures=a100,ib ActiveFeatures=a100,ib "
+    "Gres=gpu:a100:4(S:0-1) NodeAddr=gpu001 NodeHostName=gpu001 Version=23.02.6 "
+    "OS=Linux 5.15.0-91-generic #101-Ubuntu SMP Tue Nov 14 13:30:08 UTC 2023 "
+    "RealMemory=515000 AllocMem=128000 FreeMem=300000 Sockets=2 Boards=1 "
+    "State=MIXED ThreadsPerCore=1 TmpDisk=0 Weight=1 Owner=N/A MCS_label=N/A "
+    "Partitions=gpu,long BootTime=2024-01-02T10:00:00 "
+    "SlurmdStartTime=2024-01-02T10:05:00 LastBusyTime=2024-01-10T08:00:00 "
+    "CfgTRES=cpu=64,mem=515000M,billing=64,gres/gpu=4 "
+    "AllocTRES=cpu=16,mem=125G,gres/gpu=2 CapWatts=n/a CurrentWatts=0 AveWatts=0 "
+    "ExtSensorsJoules=n/s ExtSensorsWatts=0 ExtSensorsTemp=n/s "
+    "GresUsed=gpu:a100:2(IDX:0-1)"
+)
+DOWN_NODE = (
+    "NodeName=cpu002 Arch=x86_64 CoresPerSocket=16 CPUAlloc=0 CPUEfctv=32 CPUTot=32 "
+    "CPULoad=N/A AvailableFeatures=(null) ActiveFeatures=(null) Gres=(null) "
+    "NodeAddr=cpu002 NodeHostName=cpu002 RealMemory=192000 AllocMem=0 FreeMem=N/A "
+    "Sockets=2 Boards=1 State=DOWN*+DRAIN ThreadsPerCore=1 TmpDisk=0 Weight=1 "
+    "Owner=N/A MCS_label=N/A Partitions=cpu BootTime=None SlurmdStartTime=None "
+    "Reason=Not responding [slurm@2024-01-09T12:00:00]"
+)
+# Older Slurm without CPUEfctv, and a node that's in no partition
+OLD_NODE = "NodeName=old01 CPUAlloc=2 CPUTot=8 State=ALLOCATED Partitions=(null)"
+
+
+def test_parse_oneliner():
+    d = parse_oneliner(DOWN_NODE)
+    assert d["Reason"] == "Not responding [slurm@2024-01-09T12:00:00]"
+    assert d["State"] == "DOWN*+DRAIN"
+    assert parse_oneliner(GPU_NODE)["OS"].endswith("UTC 2023")
+
+
+def test_parse_gres():
+    assert parse_gres("gpu:a100:4(S:0-1),shard:8") == (("gpu:a100", 4), ("shard", 8))
+    assert parse_gres("gpu:2(IDX:0-1)") == (("gpu", 2),)
+    assert parse_gres("gpu") == (("gpu", 1),)
+    assert parse_gres("(null)") == ()
+
+
+def test_parse_scontrol_nodes():
+    nodes = parse_scontrol_nodes(
+        [GPU_NODE, DOWN_NODE, OLD_NODE, "No nodes in the system"], "test"
+    )
+    assert nodes.names == ["gpu001", "cpu002", "old01"]
+    assert nodes.index[("test", "cpu002")] == 1
+
+    gpu = dict(zip(NodeTable.COLUMNS, nodes.row(0)))
+    assert gpu["cpus_total"] == 62
+    assert gpu["cpus_idle"] == 46
+    assert gpu["mem_alloc"] == 128000
+    assert gpu["gres"] == (("gpu:a100", 4),)
+    assert gpu["partitions"] == ("gpu", "long")
+    assert gpu["features"] == "a100,ib"
+    assert nodes.gpus_total[0] == 4
+    assert nodes.gpus_alloc[0] == 2
+
+    # Nothing's idle on a node that can't run jobs
+    assert nodes.cpus_idle[1] == 0
+    assert nodes.features[1] == ""
+    assert nodes.state_counts() == {"MIXED": 1, "DOWN": 1, "ALLOCATED": 1}
+
+    assert nodes.cpus_total[2] == 8
+    assert nodes.mem_total[2] == 0
+    assert nodes.partitions[2] == ()
+
+
+def make_table(cluster, states):
+    table = NodeTable()
+    for name, state in states.items():
+        table.append(cluster, name, state, 0, 8, 0, 1000)
+    return table
+
+
+def test_changes_since():
+    old = make_table("a", {"n1": "IDLE", "n2": "IDLE", "n3": "IDLE"})
+    new = make_table("a", {"n1": "IDLE", "n2": "ALLOCATED", "n4": "IDLE"})
+
+    gone, added = new.changes_since(old)
+    # n2 changed, n3 left and n4 is new
+    assert sorted(gone) == [1, 2]
+    assert sorted(added) == [1, 2]
+    assert new.changes_since(new) == ([], [])
+
+    assert not new.same_as(old)
+    assert make_table("a", {"n1": "IDLE"}).same_as(make_table("a", {"n1": "IDLE"}))
+
+
+def test_concat():
+    a = make_table("a", {"n1": "IDLE"})
+    b = make_table("b", {"n1": "DOWN", "n2": "IDLE"})
+    both = NodeTable.concat([a, b], generation=3)
+
+    assert both.generation == 3
+    assert len(both) == 3
+    assert both.index == {("a", "n1"): 0, ("b", "n1"): 1, ("b", "n2"): 2}
+    assert both.row(1) == b.row(0)
+    assert list(both.cpus_idle) == [8, 0, 8]
+
+    # Nodes of different clusters can share a name
+    before = NodeTable.concat([a, make_table("b", {"n1": "DOWN"})])
+    assert both.changes_since(before) == ([], [2])
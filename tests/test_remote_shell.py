@@ -0,0 +1,112 @@
+import socket
+
+import pytest
+
+from stui.backend import RemoteShell
+
+
+class FakeChannel(object):
+    """Answers each script sent to it with `replies`, `chunk_size` bytes at a time."""
+
+    def __init__(self, shell, replies, chunk_size):
+        self.shell = shell
+        self.replies = replies
+        self.chunk_size = chunk_size
+        self.sent = []
+        self.pending = b""
+        self.closed = False
+        self.hang = False
+        self.timeouts = []
+
+    def exec_command(self, cmd):
+        assert cmd == "sh"
+
+    def sendall(self, data):
+        self.sent.append(data.decode("utf-8"))
+        if "printf" not in self.sent[-1]:
+            return
+        stdout, status, stderr = self.replies.pop(0)
+        marker = self.shell.marker
+        self.pending += f"{stdout}\n{marker} {status}\n{stderr}\n{marker}\n".encode()
+
+    def settimeout(self, timeout):
+        self.timeouts.append(timeout)
+
+    def recv(self, n):
+        if self.hang:
+            raise socket.timeout()
+        chunk = self.pending[: min(n, self.chunk_size)]
+        self.pending = self.pending[len(chunk) :]
+        return chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeTransport(object):
+    def __init__(self, replies, chunk_size=65536):
+        self.replies = replies
+        self.chunk_size = chunk_size
+        self.channels = []
+
+    def open_session(self):
+        channel = FakeChannel(self.shell, self.replies, self.chunk_size)
+        self.channels.append(channel)
+        return channel
+
+
+def make_shell(replies, chunk_size=65536):
+    transport = FakeTransport(replies, chunk_size)
+    shell = transport.shell = RemoteShell(transport)
+    return transport, shell
+
+
+@pytest.mark.parametrize("chunk_size", [65536, 7, 1])
+def test_framing(chunk_size):
+    transport, shell = make_shell(
+        [
+            ("1|R|job\n2|PD|other\n", 0, ""),
+            ("", 1, "squeue: error: Invalid user\n"),
+            # Output that ends without a newline, or has a marker-like line in it
+            ("no newline", 0, "__stui_not_the_marker__ 3\n"),
+        ],
+        chunk_size,
+    )
+
+    assert shell.run("squeue") == (0, "1|R|job\n2|PD|other\n", "")
+    assert shell.run("squeue -u nobody") == (1, "", "squeue: error: Invalid user\n")
+    assert shell.run("echo") == (0, "no newline", "__stui_not_the_marker__ 3\n")
+
+    # All of them through the one shell
+    assert len(transport.channels) == 1
+    sent = transport.channels[0].sent
+    assert "STUI_ERR" in sent[0]
+    assert sent[1].startswith("{ squeue\n}")
+
+
+def test_reopens_after_eof():
+    transport, shell = make_shell([("ok\n", 0, "")])
+    shell.open()
+    # The shell died before answering
+    transport.channels[0].sendall = lambda data: None
+    with pytest.raises(EOFError):
+        shell.run("squeue")
+    assert transport.channels[0].closed
+
+    assert shell.run("squeue") == (0, "ok\n", "")
+    assert len(transport.channels) == 2
+
+
+def test_timeout():
+    transport, shell = make_shell([("never\n", 0, ""), ("ok\n", 0, "")])
+    shell.timeout = 30
+    shell.open()
+    transport.channels[0].hang = True
+    with pytest.raises(TimeoutError):
+        shell.run("squeue")
+    assert transport.channels[0].closed
+    assert 0 < transport.channels[0].timeouts[0] <= 30
+
+    # A new shell for the next command
+    assert shell.run("squeue") == (0, "ok\n", "")
+    assert len(transport.channels) == 2
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+from stui import scheduler
+from stui.scheduler import MIN_POLL_INTERVAL, PollingPool, PollScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(scheduler.time, "monotonic", clock)
+    return clock
+
+
+def poll(s, clock, duration=0.1, quiet=False):
+    s.poll_started()
+    clock.now += duration
+    s.poll_finished(quiet=quiet)
+
+
+def test_never_faster_than_the_minimum():
+    s = PollScheduler(interval=0.1, jitter=0)
+    assert s.current_interval() == MIN_POLL_INTERVAL
+    # Never polled yet
+    assert s.next_poll_at() == float("-inf")
+
+
+def test_backoff_when_quiet(clock):
+    s = PollScheduler(interval=2, backoff=2, quiet_polls=3, max_interval=10, jitter=0)
+    for _ in range(2):
+        poll(s, clock, quiet=True)
+    assert s.current_interval() == 2
+
+    poll(s, clock, quiet=True)
+    assert s.current_interval() == 4
+    poll(s, clock, quiet=True)
+    assert s.current_interval() == 8
+    poll(s, clock, quiet=True)
+    assert s.current_interval() == 10
+
+    # Anything interesting snaps back
+    poll(s, clock)
+    assert s.current_interval() == 2
+    assert s.consecutive_quiet_polls == 0
+
+
+def test_slow_polls_stretch_the_interval(clock):
+    s = PollScheduler(interval=1, max_duty_cycle=0.25, jitter=0)
+    poll(s, clock, duration=2)
+    assert s.current_interval() == 8
+    assert s.next_poll_at() == clock.now - 2 + 8
+
+    # Smoothed, one fast poll doesn't undo it
+    poll(s, clock, duration=0)
+    assert s.current_interval() == pytest.approx(0.7 * 2 / 0.25)
+
+
+def test_poke(clock):
+    s = PollScheduler(interval=5, backoff=2, quiet_polls=1, jitter=0)
+    poked = []
+    s.on_poke = lambda: poked.append(True)
+
+    poll(s, clock, duration=0.5, quiet=True)
+    assert s.current_interval() == 10
+
+    s.poke()
+    assert poked == [True]
+    assert s.current_interval() == 5
+    # Right away, but not faster than the minimum
+    assert s.next_poll_at() == clock.now - 0.5 + MIN_POLL_INTERVAL
+
+    poll(s, clock)
+    assert not s.poked.is_set()
+
+
+def test_jitter(clock):
+    s = PollScheduler(interval=10, jitter=0.1)
+    for _ in range(20):
+        poll(s, clock)
+        start = clock.now - 0.1
+        assert start + 9 <= s.next_poll_at() <= start + 11
+
+
+class FakeCluster(object):
+    def __init__(self, hang=False):
+        self.scheduler = PollScheduler(jitter=0)
+        self.hang = hang
+        self.polled = threading.Event()
+        self.release = threading.Event()
+
+    def poll_once(self):
+        self.scheduler.poll_started()
+        self.polled.set()
+        if self.hang:
+            self.release.wait()
+        self.scheduler.poll_finished()
+
+
+def test_hung_clusters_dont_hold_up_the_others():
+    pool = PollingPool()
+    hung = [FakeCluster(hang=True) for _ in range(6)]
+    for c in hung:
+        pool.add(c)
+    assert all(c.polled.wait(5) for c in hung)
+
+    fast = FakeCluster()
+    pool.add(fast)
+    try:
+        assert fast.polled.wait(5)
+        # And again once it's due
+        fast.polled.clear()
+        assert fast.polled.wait(5)
+    finally:
+        for c in hung:
+            c.release.set()
@@ -0,0 +1,62 @@
+import pytest
+
+from stui.search import NameIndex, make_matcher
+
+NAMES = ["train_resnet", "Train_ViT", "eval_resnet", "preprocess", "x", "ab"]
+
+
+def make_index():
+    index = NameIndex()
+    for i, name in enumerate(NAMES):
+        index.add(i, name)
+    # Many jobs share a name
+    index.add(10, "train_resnet")
+    return index
+
+
+def brute_force(index, pattern, mode):
+    matcher = make_matcher(pattern, mode)
+    return {
+        k for name, keys in index.keys_by_name.items() if matcher(name) for k in keys
+    }
+
+
+@pytest.mark.parametrize(
+    "pattern,mode,expected",
+    [
+        ("train", "substring", {0, 1, 10}),
+        ("Train", "substring", {1}),
+        ("res", "substring", {0, 2, 10}),
+        ("x", "substring", {4}),
+        ("b", "substring", {5}),
+        ("", "substring", {0, 1, 2, 3, 4, 5, 10}),
+        ("nothing", "substring", set()),
+        ("resnet$", "regex", {0, 2, 10}),
+        ("^train", "regex", {0, 1, 10}),
+        ("train(", "regex", set()),
+        ("trnvt", "fuzzy", {1}),
+        ("TRN", "fuzzy", {0, 1, 10}),
+    ],
+)
+def test_search(pattern, mode, expected):
+    index = make_index()
+    assert index.search(pattern, mode) == expected
+    assert index.search(pattern, mode) == brute_force(index, pattern, mode)
+
+
+def test_remove():
+    index = make_index()
+    index.remove(0, "train_resnet")
+    assert index.search("resnet") == {2, 10}
+    assert len(index) == len(NAMES)
+
+    index.remove(10, "train_resnet")
+    assert index.search("resnet") == {2}
+    assert len(index) == len(NAMES) - 1
+    # Nothing left pointing at the name
+    assert all("train_resnet" not in names for names in index.names_by_gram.values())
+
+    # Unknown keys and names are ignored
+    index.remove(99, "train_resnet")
+    index.remove(99, "eval_resnet")
+    assert index.search("resnet") == {2}
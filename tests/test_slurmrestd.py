@@ -0,0 +1,246 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from stui.slurmrestd import SlurmRestDriver, SlurmRestError, iter_json_array
+
+JOBS = {
+    "meta": {"plugin": {"type": "openapi/v0.0.39"}, "slurm": {"cluster": "test"}},
+    "errors": [],
+    "warnings": [],
+    "jobs": [
+        {
+            "job_id": 100,
+            "name": "train",
+            "user_name": "alice",
+            "partition": "gpu",
+            "job_state": "RUNNING",
+            "cpus": {"set": True, "infinite": False, "number": 8},
+            "nice": 0,
+            "nodes": "gpu[001-002]",
+            "tres_per_node": "gres:gpu:2",
+            "start_time": {"set": True, "infinite": False, "number": 1000},
+            "submit_time": {"set": True, "infinite": False, "number": 900},
+            "array_job_id": {"set": True, "infinite": False, "number": 0},
+            "array_task_id": {"set": False, "infinite": False, "number": 0},
+        },
+        {
+            "job_id": 201,
+            "name": "sweep",
+            "user_name": "bob",
+            "partition": "cpu",
+            "job_state": ["PENDING"],
+            "cpus": {"set": True, "infinite": False, "number": 1},
+            "nice": 0,
+            "nodes": "",
+            "submit_time": {"set": True, "infinite": False, "number": 950},
+            "array_job_id": {"set": True, "infinite": False, "number": 200},
+            "array_task_id": {"set": False, "infinite": False, "number": 0},
+            "array_task_string": "1-10",
+            "array_max_tasks": {"set": True, "infinite": False, "number": 2},
+        },
+    ],
+}
+
+NODES = {
+    "nodes": [
+        {
+            "name": "gpu001",
+            "state": ["MIXED"],
+            "cpus": 64,
+            "alloc_cpus": 16,
+            "real_memory": 512000,
+            "alloc_memory": 64000,
+            "gres": "gpu:a100:4(S:0-1)",
+            "gres_used": "gpu:a100:1(IDX:0)",
+            "partitions": ["gpu", "gpu-long"],
+            "active_features": ["a100", "ib"],
+        },
+        {
+            "name": "cpu001",
+            "state": ["IDLE", "DRAIN"],
+            "cpus": 32,
+            "alloc_cpus": 0,
+            "real_memory": 256000,
+            "alloc_memory": 0,
+            "gres": "",
+            "gres_used": "",
+            "partitions": ["cpu"],
+            "active_features": [],
+        },
+    ]
+}
+
+HISTORY = {
+    "jobs": [
+        {
+            "job_id": 301,
+            "name": "eval",
+            "partition": "gpu",
+            "user": "alice",
+            "state": {"current": ["FAILED"], "reason": "None"},
+            "exit_code": {"status": ["FAILED"], "return_code": {"number": 1}},
+            "time": {"submission": 900, "start": 1000, "end": 1600, "elapsed": 600},
+            "nodes": "gpu001",
+            "array": {"job_id": 300, "task_id": {"set": True, "number": 1}},
+            "tres": {
+                "allocated": [
+                    {"type": "cpu", "name": "", "count": 4},
+                    {"type": "gres", "name": "gpu", "count": 1},
+                ]
+            },
+        }
+    ]
+}
+
+
+class FakeSlurmrestd(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.headers.get("X-SLURM-USER-TOKEN") != "secret":
+            return self._send(401, {"errors": [{"error": "bad token"}]})
+
+        if self.path.endswith("/ping"):
+            self._send(200, {"meta": JOBS["meta"], "pings": []})
+        elif self.path.endswith("/partitions"):
+            self._send(200, {"partitions": [{"name": "gpu"}, {"name": "cpu"}]})
+        elif self.path.startswith("/slurmdb/") and "/jobs?" in self.path:
+            self.server.history_queries.append(self.path)
+            self._send(200, HISTORY)
+        elif self.path.endswith("/jobs"):
+            self._send(200, JOBS)
+        elif self.path.endswith("/nodes"):
+            self._send(200, NODES)
+        elif self.path.endswith("/job/100"):
+            job = dict(JOBS["jobs"][0], current_working_directory="/home/alice")
+            self._send(200, {"jobs": [job]})
+        else:
+            self._send(404, {})
+
+    def do_DELETE(self):
+        job_id = self.path.rsplit("/", 1)[-1]
+        self.server.cancelled.append(job_id)
+        self._send(200 if job_id != "999" else 500, {"errors": []})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSlurmrestd)
+    server.connections = 0
+    server.cancelled = []
+    server.history_queries = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_driver(server, token="secret"):
+    host, port = server.server_address
+    return SlurmRestDriver(f"http://{host}:{port}", user="alice", token=token)
+
+
+def test_get_jobs(server):
+    driver = make_driver(server)
+    jobs = {j.job_id: j for j in driver.get_jobs()}
+
+    assert jobs["100"].is_running()
+    assert jobs["100"].uses_gpu()
+    assert jobs["100"].cpus == "8"
+    assert jobs["100"].array_str() == ""
+
+    assert jobs["201"].is_pending()
+    assert jobs["201"].job_id_combined == "200_[1-10%2]"
+    assert jobs["201"].array_str() == "1-10%2"
+
+
+def test_get_nodes(server):
+    nodes = make_driver(server).get_nodes()
+
+    assert nodes.names == ["gpu001", "cpu001"]
+    assert nodes.states == ["MIXED", "IDLE+DRAIN"]
+    assert list(nodes.cpus_idle) == [48, 0]
+    assert list(nodes.gpus_alloc) == [1, 0]
+    assert list(nodes.gpus_total) == [4, 0]
+    assert nodes.partitions[0] == ("gpu", "gpu-long")
+    assert nodes.features == ["a100,ib", ""]
+
+
+def test_get_job_details(server):
+    details = make_driver(server).get_job_details("100")
+
+    assert details["JobId"] == "100"
+    assert details["WorkDir"] == "/home/alice"
+    assert details["NumCPUs"] == "8"
+    assert "Dependency" not in details
+
+
+def test_get_job_history(server):
+    (record,) = make_driver(server).get_job_history("alice", 1500)
+
+    assert server.history_queries == [
+        "/slurmdb/v0.0.39/jobs?users=alice&start_time=1500"
+    ]
+    assert record.job_id == "300_1"
+    assert record.state == "FAILED"
+    assert record.exit_code == "1:0"
+    assert (record.start_time, record.end_time, record.elapsed) == (1000, 1600, 600)
+    assert record.cpus == 4
+    assert record.tres == "cpu=4,gres/gpu=1"
+
+
+def test_connection_is_reused(server):
+    driver = make_driver(server)
+    driver.connect()
+    driver.get_config()
+    driver.get_partition_info()
+    driver.get_jobs()
+
+    assert server.connections == 1
+
+
+def test_cancel_jobs(server):
+    driver = make_driver(server)
+    errors = driver.cancel_jobs(["100", "999"])
+
+    assert server.cancelled == ["100", "999"]
+    assert list(errors) == ["999"]
+
+
+def test_bad_token(server):
+    driver = make_driver(server, token="wrong")
+    with pytest.raises(SlurmRestError):
+        driver.get_jobs()
+    with pytest.raises(SystemExit):
+        driver.connect()
+
+
+def test_iter_json_array_small_chunks():
+    class Trickle(io.BytesIO):
+        def read(self, size=-1):
+            return super().read(3)
+
+    doc = '{"meta": {"a": [1, 2]}, "n": 12345, "jobs": [{"x": "é"}, 7, []], "z": 1}'
+    items = list(iter_json_array(Trickle(doc.encode("utf-8")), "jobs"))
+
+    assert items == [{"x": "é"}, 7, []]
@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+from stui.backend import Job
+from stui.sorting import SortedJobs, make_sort_key
+
+USERS = ["alice", "bob", "carol"]
+NAMES = ["eval", "train", "x"]
+
+
+def make_job(i, user, name, cpus):
+    job = Job.from_values(str(i), user=user, name=name)
+    job.cluster = "test"
+    job.cpus = cpus
+    return job
+
+
+def make_jobs(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        make_job(i, rng.choice(USERS), rng.choice(NAMES), rng.randint(1, 4))
+        for i in range(n)
+    ]
+
+
+def get_user(j):
+    return j.user
+
+
+def get_name(j):
+    return j.name
+
+
+def get_cpus(j):
+    return j.cpus
+
+
+def get_both(j):
+    return (j.cpus, j.name)
+
+
+def expected_order(jobs, columns):
+    # Stable sorts from the least significant column up, starting from squeue's
+    jobs = list(jobs)
+    for getter, descending in reversed(columns):
+        jobs.sort(key=getter, reverse=descending)
+    return [j.key for j in jobs]
+
+
+@pytest.mark.parametrize(
+    "columns",
+    [
+        [],
+        [(get_user, False)],
+        [(get_user, True)],
+        [(get_user, True), (get_cpus, True)],
+        [(get_user, False), (get_name, True)],
+        [(get_name, True), (get_cpus, False)],
+        [(get_user, False), (get_both, True)],
+        [(get_cpus, True), (get_user, False), (get_name, True)],
+    ],
+)
+def test_sort_order(columns):
+    jobs = make_jobs(200)
+    order = {j.key: i for i, j in enumerate(jobs)}
+    key_fn, reverse = make_sort_key(columns, order)
+
+    sorted_jobs = SortedJobs()
+    sorted_jobs.reset(jobs, key_fn, reverse)
+    assert [j.key for j in sorted_jobs] == expected_order(jobs, columns)
+    assert [sorted_jobs[i].key for i in range(len(jobs))] == expected_order(
+        jobs, columns
+    )
+
+
+def test_incremental_updates():
+    columns = [(get_user, False), (get_name, True)]
+    jobs = make_jobs(100)
+    order = {j.key: i for i, j in enumerate(jobs)}
+    key_fn, reverse = make_sort_key(columns, order)
+
+    sorted_jobs = SortedJobs()
+    sorted_jobs.reset(jobs[:50], key_fn, reverse)
+    for j in jobs[50:]:
+        sorted_jobs.add(j)
+
+    # Moved around by a change
+    changed = make_job(7, "zed", "train", 1)
+    jobs[7] = changed
+    sorted_jobs.add(changed)
+
+    assert sorted_jobs.discard(jobs[3].key)
+    assert not sorted_jobs.discard(jobs[3].key)
+    del jobs[3]
+
+    keys = expected_order(jobs, columns)
+    assert [j.key for j in sorted_jobs] == keys
+    assert sorted_jobs[len(jobs) - 1] is changed
+    for position, key in enumerate(keys):
+        assert sorted_jobs.key_at(position) == key
+        assert sorted_jobs.position_of(key) == position
+        assert sorted_jobs.get(key).key == key
+
+
+def test_replace():
+    columns = [(get_user, True), (get_cpus, True)]
+    jobs = make_jobs(20)
+    order = {j.key: i for i, j in enumerate(jobs)}
+    key_fn, reverse = make_sort_key(columns, order)
+
+    sorted_jobs = SortedJobs()
+    sorted_jobs.reset(jobs, key_fn, reverse)
+    position = sorted_jobs.position_of(jobs[5].key)
+
+    # Same sort values, something else changed
+    job = make_job(5, jobs[5].user, "something else", jobs[5].cpus)
+    assert sorted_jobs.replace(job)
+    assert sorted_jobs[position] is job
+    assert sorted_jobs.get(job.key) is job
+
+    assert not sorted_jobs.replace(make_job(99, "alice", "x", 1))
+    assert 99 not in [int(j.job_id) for j in sorted_jobs]
@@ -0,0 +1,42 @@
+import math
+
+from stui.trends import TimeSeries
+from stui.views.trends import sparkline
+
+
+def test_averages_over_time():
+    trends = TimeSeries(["a"], levels=[(10, 3)])
+    trends.record(0, [1])
+    trends.record(5, [3])
+    trends.record(10, [3])
+    # 1 for 5s then 3 for 5s, and the bucket that has just started
+    assert trends.series("a") == [2, 3]
+
+
+def test_level_rollover():
+    trends = TimeSeries(["a"], levels=[(10, 3), (30, 2)])
+    for t in range(0, 61, 10):
+        trends.record(t, [t])
+    # Only the last 3 closed buckets are kept
+    assert trends.series("a", 0) == [30, 40, 50, 60]
+    assert trends.series("a", 1) == [10, 40, 60]
+
+    # After a long gap the old buckets all hold the sample from before it
+    trends.record(1000, [0])
+    assert trends.series("a", 0) == [60, 60, 60, 0]
+
+
+def test_gaps():
+    trends = TimeSeries(["a", "b"], levels=[(10, 3)])
+    trends.record(0, [1, 1])
+    trends.record(5, [math.nan, 1])
+    trends.record(20, [4, 1])
+    trends.record(30, [4, 1])
+
+    a = trends.series("a")
+    # The unknown half of the first bucket doesn't count
+    assert a[0] == 1
+    assert math.isnan(a[1])
+    assert a[2:] == [4, 4]
+    assert trends.series("b") == [1, 1, 1, 1]
+    assert sparkline(a, 10) == "▃ ██"
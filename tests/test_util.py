@@ -0,0 +1,16 @@
+from stui.util import format_elapsed, to_int
+
+
+def test_format_elapsed():
+    assert format_elapsed(0) == "0:00"
+    assert format_elapsed(61) == "1:01"
+    assert format_elapsed(3600) == "1:00:00"
+    assert format_elapsed(2 * 24 * 3600 + 3 * 3600 + 4 * 60 + 5) == "2-03:04:05"
+    # Clocks that don't quite agree
+    assert format_elapsed(-5) == "0:00"
+
+
+def test_to_int():
+    assert to_int("42") == 42
+    assert to_int("N/A") == 0
+    assert to_int(None, -1) == -1
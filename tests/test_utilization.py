@@ -0,0 +1,58 @@
+from conftest import FakeDriver, make_cluster
+
+from stui import backend
+from stui.utilization import Utilization
+from stui.views.utilization import UtilizationPanel
+
+JOBS = {
+    "1": {"user": "alice", "state": "RUNNING", "partition": "cpu", "cpus": "4"},
+    "2": {"user": "bob", "state": "PENDING", "partition": "cpu", "cpus": "2"},
+    "3": {"user": "bob", "state": "PENDING", "partition": "gpu", "cpus": "1"},
+    "4": {"user": "bob", "state": "RUNNING", "partition": "gpu", "cpus": "2"},
+}
+
+
+def make_group():
+    cluster = make_cluster(FakeDriver(JOBS))
+    return cluster, backend.ClusterGroup([cluster])
+
+
+def test_partial():
+    cluster, group = make_group()
+    utilization = Utilization()
+
+    cluster.poll_once()
+    utilization.refresh(group)
+    assert not utilization.partial
+    assert utilization.totals()["jobs_pending"] == 2
+    lines = UtilizationPanel.summary_lines(utilization)
+    assert "Pending: 2 jobs" in lines[0]
+    assert lines[-1].startswith("Top users: ")
+
+    cluster.set_job_query(backend.JobQuery(users=("bob",)))
+    cluster.poll_once()
+    utilization.refresh(group)
+    assert utilization.partial
+    lines = UtilizationPanel.summary_lines(utilization)
+    assert "Pending (filtered): 2 jobs" in lines[0]
+    assert lines[-1] == "Top users (filtered): bob 2 CPUs"
+
+
+def test_missing_fields():
+    cluster, group = make_group()
+    utilization = Utilization()
+
+    cluster.set_job_query(backend.JobQuery(fields=frozenset(["state", "user"])))
+    cluster.poll_once()
+    assert utilization.refresh(group)
+    assert not utilization.jobs_known
+    assert utilization.totals()["jobs_pending"] == 0
+    assert len(utilization.by_user) == 0
+
+    # Counted from scratch once everything is there
+    cluster.set_job_query(backend.JobQuery())
+    cluster.poll_once()
+    utilization.refresh(group)
+    assert utilization.jobs_known
+    assert utilization.totals()["jobs_pending"] == 2
+    assert utilization.by_user.get(("test", "alice"))["cpus_used"] == 4